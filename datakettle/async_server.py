@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+import concurrent.futures
+import datakettle.cleantext.utils as utils
+from .serve_data import DataServer
+from .stats import PipelineStats
+
+"""
+asyncio interface of DataServer, for applications running an event loop.
+
+Readers are synchronous: they block on file reads and HTTP requests, and clean in the same call.
+AsyncDataServer keeps them off the event loop. Records are read on a producer thread and handed over
+to the loop in batches through an asyncio.Queue of at most buffer_batches batches, so that a slow
+consumer holds the readers back instead of letting records pile up in memory.
+
+Channels are read concurrently by default ("channel_concurrency": "auto"): I/O bound channels on threads
+and CPU bound channels in worker processes, as with DataServer. See datakettle.channel_scheduler.
+This overlaps fetching web pages with reading and cleaning files of other channels.
+
+    ds = AsyncDataServer(configdata)
+    async for record in ds.iter_data_async(channel='ALL'):
+        ...
+    data_list = await ds.fetch_data_async(channel='ALL')
+"""
+
+# Channels read at the same time when neither the config nor the caller set it
+DEF_ASYNC_CHANNEL_CONCURRENCY = "auto"
+
+# Number of records passed to the event loop at a time, when records are yielded one by one
+ASYNC_BATCH_SIZE = 256
+
+# Number of batches the producer thread can get ahead of the consumer
+DEF_ASYNC_BUFFER_BATCHES = 16
+
+# Marks the end of the records in the queue
+RECORDS_DONE = "done"
+
+class AsyncDataServer (DataServer):
+    def __init__(self, config, buffer_batches=None, **kwargs):
+        """
+        :param config: Feed config (parsed feedconfig.json)
+        :param buffer_batches: Number of batches of records read ahead of the consumer. Default 16
+        :param kwargs: DataServer settings: parallelism, cache_dir, manifest_dir, stats, channel_concurrency, ...
+        """
+        super().__init__(config, **kwargs)
+
+        if self.channel_concurrency is None:
+            self.channel_concurrency = DEF_ASYNC_CHANNEL_CONCURRENCY
+
+        self.async_buffer_batches = int(utils.if_null(buffer_batches, DEF_ASYNC_BUFFER_BATCHES))
+        self.logger = logging.getLogger(__name__)
+
+    """
+    Fetch the records of each channel, or, as specified in the input, without blocking the event loop.
+    Returns a list of records, or a (data, stats) tuple if @return_stats is True. See DataServer.fetch_data()
+    """
+    async def fetch_data_async (self, channel='ALL', return_stats=False, ordered=None):
+        stats = self.stats
+        if return_stats and stats is None:
+            stats = PipelineStats()
+
+        data = [record async for record in self.iter_data_async(channel=channel, stats=stats, ordered=ordered)]
+
+        if return_stats:
+            return data, stats
+
+        return data
+
+    """
+    Async generator of the records of each channel, or, as specified in the input.
+    If @batch_size is given, lists of @batch_size records are yielded instead.
+    Stopping early (aclose(), or leaving an "async with contextlib.aclosing(...)" block) stops the readers
+    """
+    async def iter_data_async (self, channel='ALL', batch_size=None, stats=None, ordered=None, record_source=False):
+        """
+        :param channel: Channel name. Specify ALL to fetch from all enabled channels
+        :param batch_size: Number of records per yielded list. None yields single records
+        :param stats: PipelineStats to record into, instead of the one of the DataServer
+        :param ordered: When channels are read concurrently, False yields records as soon as they are read
+        :param record_source: True adds "channel" and "source" (file path or URL) keys to each record
+        """
+        loop = asyncio.get_running_loop()
+        record_queue = asyncio.Queue(maxsize=self.async_buffer_batches)
+        stop = threading.Event()
+
+        producer = threading.Thread(target=self.produce_batches, name="records",
+                                    args=(loop, record_queue, stop, batch_size or ASYNC_BATCH_SIZE,
+                                          dict(channel=channel, stats=stats, ordered=ordered, record_source=record_source)),
+                                    daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                item = await record_queue.get()
+
+                if isinstance(item, str) and item == RECORDS_DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+
+                if batch_size:
+                    yield item
+                else:
+                    for record in item:
+                        yield record
+
+        finally:
+            # The producer stops at its next batch, and closes the readers. Wait for it without blocking the loop
+            stop.set()
+            await loop.run_in_executor(None, producer.join)
+
+    """
+    Read records on the producer thread and put them to @record_queue in lists of @batch_size,
+    followed by RECORDS_DONE, or by the error that stopped the readers
+    """
+    def produce_batches (self, loop, record_queue, stop, batch_size, iter_args):
+        records = self.iter_records(**iter_args)
+
+        try:
+            for batch in utils.iter_batches(records, batch_size):
+                if not self.put(loop, record_queue, batch, stop):
+                    return
+
+            self.put(loop, record_queue, RECORDS_DONE, stop)
+
+        except Exception as ex:
+            self.logger.error("Reading records failed", exc_info=True)
+            self.put(loop, record_queue, ex, stop)
+
+        finally:
+            records.close()
+
+    """
+    Put @item to @record_queue of event loop @loop, waiting for room unless @stop is set. Returns False when stopped
+    """
+    def put (self, loop, record_queue, item, stop):
+        if stop.is_set():
+            return False
+
+        future = asyncio.run_coroutine_threadsafe(record_queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return False
@@ -0,0 +1,129 @@
+import logging
+import importlib
+from datakettle.cleantext.cleaningplan import CleaningPlan
+from datakettle.parallel_reader import ParallelReader
+from datakettle.file_finder import find_files
+
+"""
+Base class of the readers, and the registry readers are looked up in by name.
+
+The "reader" value of a channel in the feed config names the reader class. Reader modules are
+imported on first use, so that importing DataServer does not pull in pandas, nltk, BeautifulSoup
+or urllib3 until a channel needs them. Register additional readers with register_reader().
+"""
+
+# Special characters removed by a remove_special_chars step that doesn't list any
+DEF_SPECIAL_CHARS = ['MINUS', 'COMMA', 'DQUOTE', 'SQUOTE', 'FSLASH', 'BSLASH', 'HASH', 'AT', 'EXCL', 'CARAT',
+                     'AMP', 'PCT', 'DOLLAR', 'TILDA', 'APOS', 'COLN', 'SCOLN', 'QMARK', 'LT', 'GT', 'EQ', 'PIPE', 'CBRACE',
+                     'SBRKT', 'BRKT', 'USCORE', 'ASTRSK', 'DOT', 'PLUS']
+
+# White spaces removed by a remove_white_spaces step that doesn't list any
+DEF_WHITE_SPACE_CHARS = ["NEWLINE", 'CR', 'FF', 'TAB']
+
+# Reader name -> reader class, or "module:class" until the module is imported
+READERS = {
+    "json_file_reader": "datakettle.json_reader:JsonReader",
+    "text_file_reader": "datakettle.text_reader:TextReader",
+    "csv_file_reader": "datakettle.csv_reader:CSVReader",
+    "markup_file_reader": "datakettle.markup_reader:MarkupReader",
+    "html_reader": "datakettle.html_reader:HTMLReader",
+}
+
+"""
+Register a reader under @name. @reader is a BaseReader subclass, or a "module:class" string to import it lazily
+"""
+def register_reader (name, reader, replace=False):
+    if name in READERS and not replace:
+        raise ValueError("Reader {} is already registered. Use replace=True to replace it".format(name))
+
+    READERS[name] = reader
+
+"""
+Reader class registered under @name. Imports the reader module on first use
+"""
+def get_reader_class (name):
+    reader = READERS.get(name)
+    if reader is None:
+        raise ValueError("Unknown reader: {}. Registered readers: {}".format(name, ", ".join(sorted(READERS))))
+
+    if isinstance(reader, str):
+        module_name, class_name = reader.split(":")
+        reader = getattr(importlib.import_module(module_name), class_name)
+        READERS[name] = reader
+
+    return reader
+
+class BaseReader (ParallelReader):
+
+    def __init__(self, source_config, parallelism=None, record_cache=None, manifest_store=None, stats=None, record_source=False):
+        """
+        :param source_config: Channel config from the feed config JSON
+        :param parallelism: Number of worker processes used to read and clean files. See init_parallelism()
+        :param record_cache: RecordCache holding cleaned records of sources read before
+        :param manifest_store: ManifestStore of processed files, to read channels incrementally
+        :param stats: PipelineStats recording time and sizes of each step
+        :param record_source: True adds the channel name and the source file or URL to each record
+        """
+        self.source_config = source_config
+        self.logger = logging.getLogger(type(self).__module__)
+
+        self.def_special_chars = DEF_SPECIAL_CHARS
+        self.def_white_space_chars = DEF_WHITE_SPACE_CHARS
+
+        # Clean steps are compiled once for the channel and applied to every document
+        self.cleaning_plan = CleaningPlan(self.source_config.get("clean"), self.def_special_chars, self.def_white_space_chars)
+
+        # Number of worker processes used to read and clean files
+        self.init_parallelism(parallelism)
+
+        # Cleaned records of unchanged sources are read from the record cache, when given
+        self.init_record_cache(record_cache)
+
+        # Only new and changed files are read when a manifest store is given
+        self.init_manifest(manifest_store)
+
+        # Time and sizes of each step are recorded when stats are given
+        self.init_stats(stats)
+
+        # Records carry their channel and source file when written to a sink
+        self.init_record_source(record_source)
+
+    """
+    Records of the channel, one at a time. This is what DataServer reads
+    """
+    def iter_data (self):
+        raise NotImplementedError("{} does not implement iter_data".format(type(self).__name__))
+
+    """
+    Yield the records of the files with the configured extension in the configured directory path.
+    Sub directories, include and exclude patterns, size limits and file order are set in the access section.
+    See datakettle.file_finder
+    """
+    def iter_local_files (self):
+        access = self.source_config["access"]
+
+        # Read file names and stats from given path
+        files = self.timed_call("list", find_files, access)
+        files_list = [file for file, stat in files]
+
+        try:
+            yield from self.iter_files(files_list, file_stats=dict(files))
+        finally:
+            self.close_pool()
+
+    """
+    Read files from an S3 path
+    """
+    def read_s3_files (self, config=None):
+        self.logger.error ("S3 file reader: Not yet implemented")
+        return [], []
+
+    """
+    Cleanup a document using the cleaning steps listed within the sources section of the feed config JSON.
+    Missing and empty documents give an empty string
+    """
+    def cleanup_data (self, clean_data):
+        if clean_data is None or len(clean_data) < 1:
+            return ""
+
+        return self.cleaning_plan.apply(clean_data)
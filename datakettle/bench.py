@@ -0,0 +1,521 @@
+"""
+Benchmark suite for the readers and the TextCleaner methods.
+
+Readers (json, text, csv, markup and html against a local HTTP stand-in) run over the bundled
+data/ samples, optionally scaled up by copying each file --scale times. TextCleaner methods run
+over the documents of the samples. For every benchmark it reports documents per second,
+MB per second, peak RSS and latency percentiles (per record for readers, per call for cleaners).
+
+Each benchmark runs in a fresh process, so that peak RSS is its own. Results are printed as a table
+and written as JSON with --output, to be compared with a previous run with --compare:
+
+    python -m datakettle.bench --scale 10 --output before.json
+    python -m datakettle.bench --scale 10 --compare before.json --max-slowdown 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import importlib
+import platform
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BENCH_VERSION = 1
+
+DEF_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+SPECIAL_CHARS = ["MINUS", "COMMA", "DQUOTE", "SQUOTE", "FSLASH", "BSLASH", "HASH", "AT", "EXCL", "CARAT", "AMP", "PCT",
+                 "DOLLAR", "TILDA", "APOS", "COLN", "SCOLN", "QMARK", "LT", "GT", "EQ", "PIPE", "CBRACE", "SBRKT", "BRKT",
+                 "USCORE", "ASTRSK", "DOT", "PLUS"]
+
+WHITE_SPACE_CHARS = ["NEWLINE", "CR", "FF", "TAB"]
+
+# Clean steps used by all reader benchmarks, as in feedconfig.json
+CLEAN_STEPS = [{"step": "remove_all_markup"},
+               {"step": "remove_html_encoded_chars"},
+               {"step": "remove_special_chars", "special_chars": SPECIAL_CHARS},
+               {"step": "remove_white_spaces", "white_space_chars": WHITE_SPACE_CHARS}]
+
+# Class of the div holding the article in the pages served by the HTTP stand-in
+ARTICLE_CLASS = "ArticleBody-articleBody"
+
+READER_BENCHMARKS = ["json_reader", "text_reader", "csv_reader", "markup_reader", "html_reader", "html_reader_stream",
+                     "html_reader_lxml"]
+
+# html reader benchmarks of the extract engines other than the default. See datakettle.html_extract
+HTML_ENGINE_BENCHMARKS = {"html_reader_stream": "stream", "html_reader_lxml": "lxml"}
+
+# Cold start: time to import DataServer in a fresh process
+STARTUP_BENCHMARKS = ["import_data_server"]
+
+# Modules readers import on first use. Imported before timing, so that reader benchmarks measure steady state
+LAZY_MODULES = ["pandas", "urllib3", "bs4"]
+
+# Optional modules some benchmarks need, imported before timing as well. The benchmark is skipped without them
+OPTIONAL_MODULES = {"html_reader_lxml": "lxml.html"}
+
+CLEANER_BENCHMARKS = ["remove_all_markup", "remove_html_encoded_chars", "decode_html_entities", "remove_special_chars",
+                      "remove_white_spaces", "get_text_within_tags", "split_by_newline", "split_by_char_sequence", "split_by_punkt",
+                      "get_word_tokens", "get_word_tokens_regex", "remove_stopwords", "cleaning_plan",
+                      "cleaning_plan_batch", "clean_batch"]
+
+"""
+Latency percentiles in milliseconds
+"""
+def percentiles (latencies, points=(50, 90, 99)):
+    if not latencies:
+        return {"p{}".format(point): None for point in points}
+
+    latencies = sorted(latencies)
+    result = {}
+    for point in points:
+        index = min(len(latencies) - 1, int(round(point / 100.0 * (len(latencies) - 1))))
+        result["p{}".format(point)] = round(latencies[index] * 1000.0, 4)
+
+    return result
+
+"""
+Peak resident set size of the current process in MB. None where it cannot be measured
+"""
+def peak_rss_mb ():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    if sys.platform == "darwin":
+        max_rss = max_rss / 1024.0
+
+    return round(max_rss / 1024.0, 1)
+
+"""
+Copy the files of @src_dir matching @file_filter @scale times into @dst_dir. Returns the total size in bytes
+"""
+def scale_files (src_dir, dst_dir, file_filter, scale):
+    os.makedirs(dst_dir, exist_ok=True)
+    total_bytes = 0
+
+    for name in sorted(os.listdir(src_dir)):
+        if not name.endswith(file_filter):
+            continue
+
+        base, ext = os.path.splitext(name)
+        for copy_number in range(scale):
+            dst_path = os.path.join(dst_dir, "{}_{}{}".format(base, copy_number, ext))
+            shutil.copyfile(os.path.join(src_dir, name), dst_path)
+            total_bytes += os.path.getsize(dst_path)
+
+    return total_bytes
+
+"""
+Build article pages for the HTTP stand-in from the bundled JSON news items. Returns a list of html strings
+"""
+def build_web_pages (data_dir, scale):
+    with open(os.path.join(data_dir, "json_data", "sample_newsfeed.json"), encoding="utf8") as fh:
+        items = json.load(fh)
+
+    pages = []
+    for copy_number in range(scale):
+        for item in items:
+            pages.append("<html><head><title>{}</title></head><body><div class=\"header\">Markets</div>"
+                         "<div class=\"{}\">{}</div></body></html>".format(item.get("title", ""), ARTICLE_CLASS, item.get("body", "")))
+
+    return pages
+
+"""
+Serve @pages at http://127.0.0.1:<port>/page/<n> from a background thread. Returns the server
+"""
+def start_web_server (pages):
+    encoded_pages = [page.encode("utf8") for page in pages]
+
+    class PageHandler (BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                page = encoded_pages[int(self.path.rsplit("/", 1)[-1])]
+            except (ValueError, IndexError):
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+"""
+Prepare the scaled corpora in @work_dir. Returns the settings passed to each benchmark
+"""
+def prepare_corpora (data_dir, work_dir, scale, base_url):
+    corpora = {"data_dir": data_dir, "scale": scale, "bytes": {}}
+
+    sources = {"json_reader": ("json_data", ".json"), "text_reader": ("text_data", ".txt"),
+               "csv_reader": ("csv_data", ".csv"), "markup_reader": (os.path.join("markup_data", "reuters_news"), ".sgm")}
+
+    for name, (sub_dir, file_filter) in sources.items():
+        dst_dir = os.path.join(work_dir, name)
+        corpora["bytes"][name] = scale_files(os.path.join(data_dir, sub_dir), dst_dir, file_filter, scale)
+        corpora[name] = dst_dir
+
+    pages = build_web_pages(data_dir, scale)
+    url_list_file = os.path.join(work_dir, "url_list.txt")
+    with open(url_list_file, "w") as fh:
+        for page_number in range(len(pages)):
+            fh.write("{}/page/{}\n".format(base_url, page_number))
+
+    for name in ["html_reader"] + list(HTML_ENGINE_BENCHMARKS):
+        corpora[name] = url_list_file
+        corpora["bytes"][name] = sum(len(page.encode("utf8")) for page in pages)
+
+    return corpora
+
+"""
+Channel config of a reader benchmark
+"""
+def reader_config (name, corpora, parallelism=None):
+    access = {"endpoint": "file", "filesystem": "local", "path": corpora.get(name), "label_value_override": 0.0}
+
+    if name == "json_reader":
+        access.update(reader="json_file_reader", file_filter=".json", data_element="body", label_element="")
+    elif name == "text_reader":
+        access.update(reader="text_file_reader", file_filter=".txt", document_separator="[ENDDOC]")
+    elif name == "csv_reader":
+        access.update(endpoint="csv", reader="csv_file_reader", file_filter=".csv", delimiter="|", header_row=0,
+                      data_column=1, label_column=2)
+        del access["label_value_override"]
+    elif name == "markup_reader":
+        access.update(reader="markup_file_reader", file_filter=".sgm", document_element="REUTERS", data_element="BODY")
+    elif name == "html_reader" or name in HTML_ENGINE_BENCHMARKS:
+        access = {"endpoint": "http", "reader": "html_reader", "url_list_file": corpora[name],
+                  "get_content_within_tag": {"tag": "div", "attribs": {"class": ARTICLE_CLASS}, "find": "all"}}
+        if name in HTML_ENGINE_BENCHMARKS:
+            access["extract_engine"] = HTML_ENGINE_BENCHMARKS[name]
+
+    if parallelism is not None:
+        access["parallelism"] = parallelism
+
+    return {"channel": name, "disabled": False, "access": access, "clean": CLEAN_STEPS}
+
+"""
+Records of a reader benchmark
+"""
+def iter_reader_records (source_config):
+    from datakettle.base_reader import get_reader_class
+
+    return get_reader_class(source_config["access"]["reader"])(source_config).iter_data()
+
+"""
+Documents the TextCleaner benchmarks run on: JSON bodies, Reuters articles and text documents of the samples
+"""
+def load_documents (data_dir, scale):
+    from datakettle.cleantext.textcleaner import TextCleaner
+    from datakettle.cleantext.filereader import TextFileReader
+
+    tc = TextCleaner()
+    tfr = TextFileReader()
+    docs = []
+
+    with open(os.path.join(data_dir, "json_data", "sample_newsfeed.json"), encoding="utf8") as fh:
+        docs.extend(item.get("body") or "" for item in json.load(fh))
+
+    reuters_dir = os.path.join(data_dir, "markup_data", "reuters_news")
+    for name in sorted(os.listdir(reuters_dir)):
+        docs.extend(tc.split_multi_content_by_end_tag(tfr.read_file(os.path.join(reuters_dir, name)), separator_markup="REUTERS"))
+
+    text_dir = os.path.join(data_dir, "text_data")
+    for name in sorted(os.listdir(text_dir)):
+        docs.extend(tc.split_multi_text_by_separator(tfr.read_file(os.path.join(text_dir, name)), separator_code="[ENDDOC]"))
+
+    return [doc for doc in docs if doc] * scale
+
+"""
+Function called once per document by a TextCleaner benchmark. None when the benchmark cannot run here
+"""
+def cleaner_function (name, docs):
+    from datakettle.cleantext.textcleaner import TextCleaner
+    from datakettle.cleantext.cleaningplan import CleaningPlan
+
+    tc = TextCleaner()
+
+    if name == "remove_all_markup":
+        return tc.remove_all_markup
+    if name == "remove_html_encoded_chars":
+        return tc.remove_html_encoded_chars
+    if name == "decode_html_entities":
+        return tc.decode_html_entities
+    if name == "remove_special_chars":
+        return lambda doc: tc.remove_special_chars(SPECIAL_CHARS, doc)
+    if name == "remove_white_spaces":
+        return lambda doc: tc.remove_white_spaces(doc, WHITE_SPACE_CHARS)
+    if name == "get_text_within_tags":
+        return lambda doc: tc.get_text_within_tags(doc, container_tag="BODY")
+    if name == "split_by_newline":
+        return tc.split_by_newline
+    if name == "split_by_char_sequence":
+        return tc.split_by_char_sequence
+    if name == "remove_stopwords":
+        return lambda doc: tc.remove_stopwords(doc.split())
+    if name == "get_word_tokens_regex":
+        return lambda doc: tc.get_word_tokens(doc, backend="regex")
+    if name == "cleaning_plan":
+        return CleaningPlan(CLEAN_STEPS).apply
+
+    # These need the NLTK Punkt model
+    if name in ("split_by_punkt", "get_word_tokens"):
+        try:
+            tc.split_by_punkt("Probe.")
+        except LookupError:
+            return None
+        return tc.split_by_punkt if name == "split_by_punkt" else tc.get_word_tokens
+
+    raise ValueError("Unknown benchmark: {}".format(name))
+
+"""
+Run one benchmark. Runs in its own process, see run_benchmarks()
+"""
+def run_benchmark (name, corpora, parallelism=None):
+    logging.disable(logging.CRITICAL)
+
+    latencies = []
+    docs_count = 0
+
+    if name == "import_data_server":
+        kind = "startup"
+        bytes_in = 0
+        already_imported = "datakettle.serve_data" in sys.modules
+
+        start = time.perf_counter()
+        import datakettle.serve_data
+        seconds = time.perf_counter() - start
+        latencies.append(seconds)
+        docs_count = 1
+
+        if already_imported:
+            return {"name": name, "kind": kind, "skipped": "DataServer already imported. Run without --no-isolate"}
+
+    elif name in READER_BENCHMARKS:
+        kind = "reader"
+        for module_name in LAZY_MODULES:
+            importlib.import_module(module_name)
+
+        if name in OPTIONAL_MODULES:
+            try:
+                importlib.import_module(OPTIONAL_MODULES[name])
+            except ImportError:
+                return {"name": name, "kind": kind, "skipped": "{} is not installed".format(OPTIONAL_MODULES[name])}
+
+        bytes_in = corpora["bytes"][name]
+        records = iter_reader_records(reader_config(name, corpora, parallelism=parallelism))
+
+        start = last = time.perf_counter()
+        for record in records:
+            now = time.perf_counter()
+            latencies.append(now - last)
+            last = now
+            docs_count += 1
+        seconds = time.perf_counter() - start
+
+    elif name == "cleaning_plan_batch":
+        from datakettle.cleantext.cleaningplan import CleaningPlan
+
+        kind = "cleaner"
+        docs = load_documents(corpora["data_dir"], corpora["scale"])
+        bytes_in = sum(len(doc.encode("utf8")) for doc in docs)
+        plan = CleaningPlan(CLEAN_STEPS)
+
+        start = time.perf_counter()
+        for pos in range(0, len(docs), 256):
+            call_start = time.perf_counter()
+            plan.apply_batch(docs[pos:pos + 256])
+            latencies.append(time.perf_counter() - call_start)
+        seconds = time.perf_counter() - start
+        docs_count = len(docs)
+
+    elif name == "clean_batch":
+        from datakettle.cleantext.textcleaner import TextCleaner, DEF_CLEAN_BATCH_SIZE
+        from datakettle.cleantext.cleaningplan import CleaningPlan
+
+        kind = "cleaner"
+        docs = load_documents(corpora["data_dir"], corpora["scale"])
+        bytes_in = sum(len(doc.encode("utf8")) for doc in docs)
+        tc = TextCleaner()
+        plan = CleaningPlan(CLEAN_STEPS)
+
+        start = time.perf_counter()
+        for pos in range(0, len(docs), DEF_CLEAN_BATCH_SIZE):
+            call_start = time.perf_counter()
+            tc.clean_batch(docs[pos:pos + DEF_CLEAN_BATCH_SIZE], plan)
+            latencies.append(time.perf_counter() - call_start)
+        seconds = time.perf_counter() - start
+        docs_count = len(docs)
+
+    else:
+        kind = "cleaner"
+        docs = load_documents(corpora["data_dir"], corpora["scale"])
+        bytes_in = sum(len(doc.encode("utf8")) for doc in docs)
+
+        function = cleaner_function(name, docs)
+        if function is None:
+            return {"name": name, "kind": kind, "skipped": "NLTK Punkt model not available"}
+
+        start = time.perf_counter()
+        for doc in docs:
+            call_start = time.perf_counter()
+            function(doc)
+            latencies.append(time.perf_counter() - call_start)
+        seconds = time.perf_counter() - start
+        docs_count = len(docs)
+
+    return {"name": name, "kind": kind, "docs": docs_count, "bytes": bytes_in, "seconds": round(seconds, 4),
+            "docs_per_sec": round(docs_count / seconds, 1) if seconds > 0 else None,
+            "mb_per_sec": round(bytes_in / (1024.0 * 1024.0) / seconds, 3) if seconds > 0 else None,
+            "peak_rss_mb": peak_rss_mb(), "latency_ms": percentiles(latencies)}
+
+"""
+Run benchmarks @names, each @repeat times, and keep the fastest run of each.
+With @isolate, every run gets a fresh process, so that peak RSS is not inflated by previous runs
+"""
+def run_benchmarks (names, corpora, repeat=1, parallelism=None, isolate=True):
+    results = []
+
+    for name in names:
+        runs = []
+        for run_number in range(repeat):
+            if isolate:
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    result = pool.submit(run_benchmark, name, corpora, parallelism).result()
+            else:
+                result = run_benchmark(name, corpora, parallelism)
+
+            runs.append(result)
+            if "skipped" in result:
+                break
+
+        best = min(runs, key=lambda run: run.get("seconds", 0))
+        if len(runs) > 1:
+            best["runs_seconds"] = [run["seconds"] for run in runs]
+
+        results.append(best)
+        print(format_result(best), flush=True)
+
+    return results
+
+def format_result (result):
+    if "skipped" in result:
+        return "{:<26} skipped: {}".format(result["name"], result["skipped"])
+
+    return "{:<26} {:>8} docs {:>10.1f} docs/s {:>8.3f} MB/s {:>8} MB rss  p50 {} ms  p99 {} ms".format(
+        result["name"], result["docs"], result["docs_per_sec"] or 0, result["mb_per_sec"] or 0, result["peak_rss_mb"],
+        result["latency_ms"]["p50"], result["latency_ms"]["p99"])
+
+"""
+Commit of the working tree, when it is a git checkout
+"""
+def git_commit ():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+"""
+Compare results with a previous report. Returns the names of benchmarks that slowed down by more than @max_slowdown
+"""
+def compare_results (results, baseline, max_slowdown=None):
+    baseline_results = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+
+    print("\nCompared with {} ({})".format(baseline.get("commit"), baseline.get("timestamp")))
+    for result in results:
+        previous = baseline_results.get(result["name"])
+        if previous is None or not previous.get("docs_per_sec") or not result.get("docs_per_sec"):
+            continue
+
+        ratio = result["docs_per_sec"] / previous["docs_per_sec"]
+        flag = ""
+        if max_slowdown is not None and ratio < 1.0 - max_slowdown:
+            regressions.append(result["name"])
+            flag = "  REGRESSION"
+
+        print("{:<26} {:>10.1f} -> {:>10.1f} docs/s  x{:.2f}{}".format(result["name"], previous["docs_per_sec"],
+                                                                       result["docs_per_sec"], ratio, flag))
+
+    return regressions
+
+
+def main (argv=None):
+    parser = argparse.ArgumentParser(prog="python -m datakettle.bench", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=DEF_DATA_DIR, help="Directory of the sample data. Default: bundled data/")
+    parser.add_argument("--scale", type=int, default=1, help="Copy every sample file (or document) this many times")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per benchmark. The fastest run is reported")
+    parser.add_argument("--parallelism", default=None, help="parallelism setting of the file readers")
+    parser.add_argument("--only", default=None, help="Comma separated benchmark names. Default: all")
+    parser.add_argument("--no-isolate", action="store_true", help="Run all benchmarks in this process")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run to compare with")
+    parser.add_argument("--max-slowdown", type=float, default=None,
+                        help="With --compare, exit with status 1 if docs/s dropped by more than this fraction (e.g. 0.1)")
+
+    args = parser.parse_args(argv)
+
+    names = STARTUP_BENCHMARKS + READER_BENCHMARKS + CLEANER_BENCHMARKS
+    if args.only:
+        names = [name.strip() for name in args.only.split(",")]
+        unknown = [name for name in names if name not in STARTUP_BENCHMARKS + READER_BENCHMARKS + CLEANER_BENCHMARKS]
+        if unknown:
+            parser.error("Unknown benchmarks: {}".format(", ".join(unknown)))
+
+    work_dir = tempfile.mkdtemp(prefix="datakettle_bench_")
+    server = None
+
+    try:
+        server = start_web_server(build_web_pages(args.data_dir, args.scale))
+        base_url = "http://127.0.0.1:{}".format(server.server_address[1])
+        corpora = prepare_corpora(args.data_dir, work_dir, args.scale, base_url)
+
+        results = run_benchmarks(names, corpora, repeat=args.repeat, parallelism=args.parallelism, isolate=not args.no_isolate)
+
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"version": BENCH_VERSION, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "commit": git_commit(),
+              "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+              "scale": args.scale, "repeat": args.repeat, "parallelism": args.parallelism, "results": results}
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+
+        if compare_results(results, baseline, max_slowdown=args.max_slowdown):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+import os
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import datakettle.cleantext.utils as utils
+from datakettle.cleantext.utils import resolve_parallelism
+from datakettle.base_reader import get_reader_class
+from datakettle.stats import PipelineStats
+
+"""
+Concurrent fetch of several channels.
+
+Channels are independent, so DataServer can read them at the same time. Each channel runs on:
+    thread    I/O bound channels: html_reader, markup_file_reader reading web pages, and channels that
+              spread their own work over worker processes ("parallelism" > 1). Records are streamed to
+              the caller in batches through a bounded queue
+    process   CPU bound channels (reading and cleaning local files). The channel is read in a worker
+              process and its records are returned at once, when the channel is complete
+
+A channel can choose with "executor": "thread" or "process" in its access section.
+Records are returned channel by channel in config order (ordered), or batch by batch as they
+become available (unordered). Records of a channel always keep their order.
+"""
+
+# Readers whose channels wait on the network rather than the CPU
+IO_BOUND_READERS = ["html_reader"]
+
+EXECUTORS = ["thread", "process"]
+
+# Number of records passed from a channel thread to the caller at a time
+CHANNEL_BATCH_SIZE = 256
+
+# Number of batches a channel thread can get ahead of the caller
+DEF_BUFFER_BATCHES = 64
+
+# Marks the end of a channel in the record queues
+CHANNEL_DONE = "done"
+
+"""
+Read the records of a channel. Yields records one at a time
+"""
+def read_channel (source, parallelism=None, record_cache=None, manifest_store=None, stats=None, record_source=False):
+    """
+    :param source: Channel config from the feed config JSON
+    :param parallelism: Default number of worker processes of the reader
+    :param record_cache: RecordCache, or None
+    :param manifest_store: ManifestStore, or None
+    :param stats: PipelineStats, or None
+    :param record_source: True adds "channel" and "source" keys to the records
+    """
+    logger = logging.getLogger(__name__)
+    access = source["access"]
+    logger.info ("Fetching data from {0} Reader {1}".format(source["channel"], access["reader"]))
+
+    # Readers are looked up by name, and their modules imported on first use
+    reader_class = get_reader_class(access["reader"])
+    reader = reader_class(source_config=source, parallelism=parallelism, record_cache=record_cache,
+                          manifest_store=manifest_store, stats=stats, record_source=record_source)
+    data = reader.iter_data()
+
+    # Time not taken by any step of the reader is recorded as "records"
+    if stats is not None:
+        data = stats.iter_timed(source["channel"], "records", data)
+
+    count = 0
+    for record in data:
+        count += 1
+        yield record
+
+    logger.info("Fetched data {} items ".format(count))
+
+    if stats is not None:
+        stats.report()
+
+"""
+Read a whole channel in a worker process. Returns (records, stats counters)
+"""
+def fetch_channel (source, parallelism, record_cache, manifest_store, with_stats, record_source):
+    stats = PipelineStats(log_reports=False) if with_stats else None
+    records = list(read_channel(source, parallelism=parallelism, record_cache=record_cache,
+                                manifest_store=manifest_store, stats=stats, record_source=record_source))
+
+    return records, stats.pop_counters() if stats is not None else None
+
+class ChannelScheduler (object):
+    def __init__(self, concurrency, process_workers=None, ordered=True, buffer_batches=None):
+        """
+        :param concurrency: Number of channels read on threads at the same time. 0 or "auto": one per CPU core
+        :param process_workers: Number of worker processes for CPU bound channels. Default: concurrency, at most one per CPU core
+        :param ordered: True returns the records channel by channel, in config order.
+                        False returns batches of records as soon as they are read
+        :param buffer_batches: Number of batches of records a channel thread can read ahead. Default 64
+        """
+        self.concurrency = resolve_parallelism(concurrency if concurrency != "" else None)
+        if process_workers is None or process_workers == "":
+            self.process_workers = min(self.concurrency, os.cpu_count() or 1)
+        else:
+            self.process_workers = resolve_parallelism(process_workers)
+
+        self.ordered = ordered
+        self.buffer_batches = int(utils.if_null(buffer_batches, DEF_BUFFER_BATCHES))
+        self.logger = logging.getLogger(__name__)
+
+    """
+    Executor a channel runs on: "thread" or "process"
+    """
+    def get_executor (self, source, parallelism=None):
+        access = source["access"]
+
+        executor = access.get("executor")
+        if executor:
+            if executor not in EXECUTORS:
+                raise ValueError("Unknown executor {} of channel {}. Use one of {}".format(executor, source["channel"], EXECUTORS))
+            return executor
+
+        if access["reader"] in IO_BOUND_READERS or access.get("endpoint") == "http":
+            return "thread"
+
+        # The reader starts worker processes of its own
+        if resolve_parallelism(utils.if_null(access.get("parallelism"), parallelism)) > 1:
+            return "thread"
+
+        return "process"
+
+    """
+    Read @sources concurrently. Yields records in config order, or as they are read when not ordered
+    """
+    def iter_records (self, sources, parallelism=None, record_cache=None, manifest_store=None, stats=None, record_source=False):
+        """
+        :param sources: Channel configs to read
+        :param parallelism: Default number of worker processes of the readers
+        :param record_cache: RecordCache, or None
+        :param manifest_store: ManifestStore, or None
+        :param stats: PipelineStats, or None
+        :param record_source: True adds "channel" and "source" keys to the records
+        """
+        sources = list(sources)
+        if not sources:
+            return
+
+        executors = [self.get_executor(source, parallelism) for source in sources]
+        self.logger.info("Fetching {} channels: {} on threads, {} on processes".format(
+            len(sources), executors.count("thread"), executors.count("process")))
+
+        # Ordered: a queue per channel, drained in config order. Otherwise one queue shared by all channels.
+        # Queues are unbounded; channel threads take one of buffer_batches slots per batch, freed when it is read.
+        # Channels read in worker processes hand over their records at once, without waiting for a slot
+        if self.ordered:
+            queues = [queue.Queue() for source in sources]
+            slots = [threading.Semaphore(self.buffer_batches) for source in sources]
+        else:
+            shared_queue = queue.Queue()
+            queues = [shared_queue] * len(sources)
+            slots = [threading.Semaphore(self.buffer_batches)] * len(sources)
+
+        stop = threading.Event()
+        thread_pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="channel")
+        process_pool = None
+
+        try:
+            # Worker processes are forked on the first submit. Submit process channels before any channel thread
+            # starts, so that no worker is forked while another thread holds a lock (logging, connection pools, ...)
+            for index, (source, executor) in enumerate(zip(sources, executors)):
+                if executor != "process":
+                    continue
+
+                if process_pool is None:
+                    process_pool = ProcessPoolExecutor(max_workers=self.process_workers)
+
+                future = process_pool.submit(fetch_channel, source, parallelism, record_cache, manifest_store,
+                                             stats is not None, record_source)
+                future.add_done_callback(self.channel_result_callback(index, source, queues[index], stats))
+
+            for index, (source, executor) in enumerate(zip(sources, executors)):
+                if executor == "thread":
+                    thread_pool.submit(self.run_channel_thread, index, source, queues[index], slots[index], stop,
+                                       parallelism, record_cache, manifest_store, stats, record_source)
+
+            if self.ordered:
+                for index in range(len(sources)):
+                    yield from self.drain_queue(queues[index], 1)
+            else:
+                yield from self.drain_queue(shared_queue, len(sources))
+
+        finally:
+            # Stops channel threads when the caller stops early. Their readers are closed
+            stop.set()
+            thread_pool.shutdown(wait=True)
+            if process_pool is not None:
+                process_pool.shutdown(wait=True, cancel_futures=True)
+
+    """
+    Yield the records of @channel_count channels from @record_queue. Errors of a channel are raised here
+    """
+    def drain_queue (self, record_queue, channel_count):
+        done = 0
+        while done < channel_count:
+            index, item, slots = record_queue.get()
+
+            # Lets the channel thread read ahead another batch
+            if slots is not None:
+                slots.release()
+
+            if isinstance(item, str) and item == CHANNEL_DONE:
+                done += 1
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                yield from item
+
+    """
+    Read a channel on a thread. Records are put to @record_queue in batches, each taking one of @slots,
+    followed by CHANNEL_DONE
+    """
+    def run_channel_thread (self, index, source, record_queue, slots, stop, parallelism, record_cache, manifest_store,
+                            stats, record_source):
+        records = read_channel(source, parallelism=parallelism, record_cache=record_cache, manifest_store=manifest_store,
+                               stats=stats, record_source=record_source)
+
+        try:
+            for batch in utils.iter_batches(records, CHANNEL_BATCH_SIZE):
+                if not self.put(record_queue, slots, (index, batch), stop):
+                    return
+
+            record_queue.put((index, CHANNEL_DONE, None))
+
+        except Exception as ex:
+            self.logger.error("Channel {} failed".format(source["channel"]), exc_info=True)
+            record_queue.put((index, ex, None))
+
+        finally:
+            records.close()
+
+    """
+    Put batch @item to @record_queue once one of @slots is free, unless @stop is set. Returns False when stopped
+    """
+    def put (self, record_queue, slots, item, stop):
+        while not stop.is_set():
+            if slots.acquire(timeout=0.1):
+                record_queue.put(item + (slots,))
+                return True
+        return False
+
+    """
+    Callback that passes the records of a channel read in a worker process on to @record_queue.
+    It runs on the management thread of the process pool, hence it never waits: the queue is unbounded
+    """
+    def channel_result_callback (self, index, source, record_queue, stats):
+        def put_result(future):
+            if future.cancelled():
+                return
+
+            try:
+                records, counters = future.result()
+            except Exception as ex:
+                self.logger.error("Channel {} failed".format(source["channel"]), exc_info=True)
+                record_queue.put_nowait((index, ex, None))
+                return
+
+            if counters and stats is not None:
+                stats.merge(counters)
+                stats.report()
+
+            record_queue.put_nowait((index, records, None))
+            record_queue.put_nowait((index, CHANNEL_DONE, None))
+
+        return put_result
@@ -0,0 +1,371 @@
+import re
+import logging
+from datakettle.cleantext.textcleaner import WHITE_SPACE_CODES, MARKUP_REGEX, HTML_NAME_REGEX, HTML_NUM_REGEX, HTML_ENCODED_REGEX, \
+    HTML_ENTITY_REGEX, HTML_ENCODED_MODES, compile_special_chars, is_ascii_class, is_single_pass_replacement, entity_decoder
+
+"""
+Compiled form of the "clean" section of a channel in the feed config JSON.
+
+Readers used to walk the list of clean steps for every document and call one TextCleaner
+method per step, each of them scanning the whole document again. A CleaningPlan is built once
+per channel. It turns the steps into a short list of operations and fuses adjacent
+character level steps (remove_special_chars, remove_white_spaces) into a single translation
+table, so that a document is scanned as few times as possible.
+
+Output is identical to running the TextCleaner methods one step at a time.
+"""
+
+# Operation codes used within a compiled plan
+OP_REGEX     = "regex"
+OP_REPLACE   = "replace"
+OP_TRANSLATE = "translate"
+OP_SQUEEZE   = "squeeze"
+
+# Up to this many characters sharing a replacement are handled with str.replace,
+# which is much faster than a regex pass for a handful of characters
+MAX_REPLACE_CHARS = 4
+
+# Replacement used by a clean step that doesn't set "replace_char"
+DEFAULT_REPLACE_CHARS = {"remove_special_chars": "", "remove_white_spaces": " ", "remove_html_encoded_chars": " "}
+
+# Joins the documents of a batch in apply_batch. No operation matches, removes or produces it
+# on its own; it can only disappear within a match that spans two documents
+BATCH_SEPARATOR = "\x00"
+
+# Run of white spaces, as split by str.split()
+WHITE_SPACE_RUN = re.compile(r"\s+")
+
+class CleaningPlan (object):
+    def __init__(self, clean_steps, def_special_chars=None, def_white_space_chars=None):
+        """
+        :param clean_steps: List of clean steps from the channel config. E.g: [{"step": "remove_all_markup"}, ...]
+        :param def_special_chars: Special characters used when a remove_special_chars step doesn't list any
+        :param def_white_space_chars: White space characters used when a remove_white_spaces step doesn't list any
+        """
+        self.logger = logging.getLogger(__name__)
+
+        self.clean_steps = clean_steps if clean_steps is not None else []
+        self.def_special_chars = def_special_chars if def_special_chars is not None else []
+        self.def_white_space_chars = def_white_space_chars if def_white_space_chars is not None else []
+
+        # Set by the reader when instrumentation is on. See datakettle.stats
+        self.stats = None
+        self.stats_channel = None
+
+        self.operations = self.compile(self.clean_steps)
+
+    """
+    Resolve the replacement character of a clean step: "replace_char" of the step when set
+    (an empty string removes the characters), otherwise the default of the step. See DEFAULT_REPLACE_CHARS
+    """
+    def get_replace_char (self, cstep):
+        replace_char = cstep.get("replace_char")
+        if replace_char is None:
+            return DEFAULT_REPLACE_CHARS.get(cstep["step"], ' ')
+        return replace_char
+
+    """
+    Turn the list of clean steps into a list of operations.
+    Each operation is a tuple (operation code, argument, replacement)
+    """
+    def compile (self, clean_steps):
+        """
+        :param clean_steps: List of clean steps from the channel config
+        :return: List of operations
+        """
+        operations = []
+
+        # Names of the clean steps each operation comes from, as reported by instrumentation
+        names = []
+
+        # Translation table being built for adjacent character level steps, and the steps it comes from
+        table = None
+        table_steps = []
+
+        for cstep in clean_steps:
+            stepname = cstep["step"]
+
+            if stepname == "remove_special_chars":
+                special_chars = cstep.get("special_chars", self.def_special_chars)
+                regex = compile_special_chars(tuple(special_chars))
+
+                if not is_ascii_class(regex):
+                    # A negated class matches non-ASCII characters as well, which a table over the ASCII range can't
+                    self.add_table_operations(operations, names, table, table_steps)
+                    table = None
+                    table_steps = []
+                    operations.append((OP_REGEX, regex, self.get_replace_char(cstep)))
+                    names.append(stepname)
+                    continue
+
+                step_table = self.special_chars_table(special_chars, self.get_replace_char(cstep))
+                table = self.merge_tables(table, step_table)
+                table_steps.append(stepname)
+                continue
+
+            if stepname == "remove_white_spaces":
+                white_space_chars = cstep.get("white_space_chars", self.def_white_space_chars)
+                replace_char = self.get_replace_char(cstep)
+
+                for wchar in white_space_chars:
+                    if wchar in WHITE_SPACE_CODES:
+                        table = self.merge_tables(table, {ord(WHITE_SPACE_CODES[wchar]): replace_char})
+                        if stepname not in table_steps:
+                            table_steps.append(stepname)
+                    elif wchar == 'SPACE':
+                        # Consecutive white spaces are squeezed in place. Flush pending table first
+                        self.add_table_operations(operations, names, table, table_steps)
+                        table = None
+                        table_steps = []
+                        operations.append((OP_SQUEEZE, None, None))
+                        names.append(stepname)
+                    else:
+                        self.logger.warning("Unknown white space code: {}".format(wchar))
+                continue
+
+            # Any other step ends the current run of character level steps
+            self.add_table_operations(operations, names, table, table_steps)
+            table = None
+            table_steps = []
+
+            if stepname == "remove_all_markup":
+                operations.append((OP_REGEX, MARKUP_REGEX, ''))
+                names.append(stepname)
+
+            elif stepname == "remove_html_encoded_chars":
+                replace_char = self.get_replace_char(cstep)
+                mode = cstep.get("mode", "remove")
+                if mode not in HTML_ENCODED_MODES:
+                    self.logger.warning("Unknown remove_html_encoded_chars mode: {}. Removing them".format(mode))
+
+                if mode == "decode":
+                    # Dropped references are replaced as they are. A function replacement expands no escapes
+                    decoder = entity_decoder(tuple(cstep.get("drop_entities", [])), replace_char)
+                    operations.append((OP_REGEX, HTML_ENTITY_REGEX, decoder))
+                    names.append(stepname)
+                elif is_single_pass_replacement(replace_char):
+                    operations.append((OP_REGEX, HTML_ENCODED_REGEX, replace_char))
+                    names.append(stepname)
+                else:
+                    # Any other replacement can complete a new match of the second pass
+                    operations.append((OP_REGEX, HTML_NAME_REGEX, replace_char))
+                    operations.append((OP_REGEX, HTML_NUM_REGEX, replace_char))
+                    names.extend([stepname, stepname])
+
+            else:
+                self.logger.warning("Unknown clean step: {}".format(stepname))
+
+        self.add_table_operations(operations, names, table, table_steps)
+        self.operation_names = ["clean:" + name for name in names]
+
+        self.logger.info("Compiled {} clean steps into {} operations".format(len(clean_steps), len(operations)))
+
+        return operations
+
+    """
+    Append the operations of a translation table to @operations, and their name, built from
+    the names of the fused steps, to @names
+    """
+    def add_table_operations (self, operations, names, table, table_steps):
+        table_ops = self.table_operations(table)
+        operations.extend(table_ops)
+        names.extend(["+".join(table_steps)] * len(table_ops))
+
+    """
+    Build a str.translate table equivalent to TextCleaner.remove_special_chars.
+    The character class is built from ASCII characters only. Unless it is negated (see is_ascii_class),
+    probing the ASCII range gives the exact set of matched characters (including accidental ranges like [#-@])
+    """
+    def special_chars_table (self, special_chars, replace_char):
+        """
+        :param special_chars: List of special characters, denoted by pnemonic codes
+        :param replace_char: character to be replaced with
+        :return: Translation table
+        """
+        regex = compile_special_chars(tuple(special_chars))
+        table = {}
+
+        for code in range(128):
+            char = chr(code)
+            if regex.match(char):
+                # Let re expand the replacement so that escapes behave as in re.sub
+                table[code] = regex.sub(replace_char, char)
+
+        return table
+
+    """
+    Compose two translation tables. Translating with the result is the same as translating
+    with @first and then with @second
+    """
+    def merge_tables (self, first, second):
+        if not first:
+            return dict(second)
+
+        table = {}
+        for code, replacement in first.items():
+            table[code] = replacement.translate(second)
+
+        for code, replacement in second.items():
+            if code not in table:
+                table[code] = replacement
+
+        return table
+
+    """
+    Convert a translation table into operations.
+    When every character is removed or replaced by a single character, the whole table is run
+    as one str.translate pass over a 128 entry list, which is the fastest option for ASCII text.
+    Otherwise characters are grouped by their replacement and each group becomes one regex pass,
+    or a few str.replace calls when the group is small. This is only valid when no replacement
+    contains a character handled by another group; if it does, fall back to str.translate with strings
+    """
+    def table_operations (self, table):
+        """
+        :param table: Translation table (may be None)
+        :return: List of operations
+        """
+        if not table:
+            return []
+
+        # Tables are built from ASCII characters only
+        if all(len(replacement) <= 1 for replacement in table.values()):
+            ascii_table = tuple((ord(table[code]) if table[code] else None) if code in table else code
+                                for code in range(128))
+            return [(OP_TRANSLATE, ascii_table, None)]
+
+        groups = {}
+        for code, replacement in table.items():
+            groups.setdefault(replacement, []).append(chr(code))
+
+        for replacement in groups:
+            if any(ord(char) in table for char in replacement):
+                return [(OP_TRANSLATE, tuple(table.get(code, chr(code)) for code in range(128)), None)]
+
+        operations = []
+        for replacement, chars in groups.items():
+            if len(chars) <= MAX_REPLACE_CHARS:
+                operations.append((OP_REPLACE, tuple(chars), replacement))
+                continue
+
+            regex = re.compile("[{}]".format("".join(re.escape(char) for char in sorted(chars))))
+            # Escape the replacement since it is final, already expanded text
+            operations.append((OP_REGEX, regex, replacement.replace("\\", "\\\\")))
+
+        return operations
+
+    """
+    Run the compiled plan on a document
+    """
+    def apply (self, doc):
+        """
+        :param doc: Document string
+        :return: cleaned document string
+        """
+        if doc is None:
+            return None
+
+        if self.stats is not None:
+            return self.apply_timed(doc)
+
+        for opcode, arg, replacement in self.operations:
+            if opcode == OP_REGEX:
+                doc = arg.sub(replacement, doc)
+            elif opcode == OP_REPLACE:
+                for char in arg:
+                    doc = doc.replace(char, replacement)
+            elif opcode == OP_TRANSLATE:
+                doc = doc.translate(arg)
+            else:
+                doc = " ".join(doc.split())
+
+        return doc
+
+    """
+    apply() recording the time and sizes of every operation in self.stats
+    """
+    def apply_timed (self, doc):
+        stats = self.stats
+
+        for (opcode, arg, replacement), name in zip(self.operations, self.operation_names):
+            start = stats.start()
+            size_in = len(doc)
+
+            if opcode == OP_REGEX:
+                doc = arg.sub(replacement, doc)
+            elif opcode == OP_REPLACE:
+                for char in arg:
+                    doc = doc.replace(char, replacement)
+            elif opcode == OP_TRANSLATE:
+                doc = doc.translate(arg)
+            else:
+                doc = " ".join(doc.split())
+
+            stats.stop(self.stats_channel, name, start, docs=1, bytes_in=size_in, bytes_out=len(doc))
+
+        return doc
+
+    """
+    Run the compiled plan on a list of documents at once. The documents are joined with
+    BATCH_SEPARATOR and every operation runs once over the whole batch, instead of once per
+    document, which removes the per call overhead that dominates for short documents
+    (e.g. csv rows). Matches of the plan's patterns never extend past a separator unless they
+    swallow it, so when all separators survive the result equals apply() on each document.
+    Otherwise, or if a document contains the separator, documents are cleaned one by one
+    """
+    def apply_batch (self, docs):
+        """
+        :param docs: List of document strings. None or empty documents give an empty string
+        :return: List of cleaned document strings
+        """
+        docs = [doc if doc else "" for doc in docs]
+        if len(docs) < 2:
+            return [self.apply(doc) for doc in docs]
+
+        batch = BATCH_SEPARATOR.join(docs)
+        if batch.count(BATCH_SEPARATOR) != len(docs) - 1:
+            return [self.apply(doc) for doc in docs]
+
+        stats = self.stats
+        for (opcode, arg, replacement), name in zip(self.operations, self.operation_names):
+            if stats is not None:
+                start = stats.start()
+                size_in = len(batch)
+
+            if opcode == OP_REGEX:
+                batch = arg.sub(replacement, batch)
+            elif opcode == OP_REPLACE:
+                for char in arg:
+                    batch = batch.replace(char, replacement)
+            elif opcode == OP_TRANSLATE:
+                batch = batch.translate(arg)
+            else:
+                # Squeeze white spaces within each document: \s matches what str.split() splits on
+                batch = WHITE_SPACE_RUN.sub(" ", batch)
+                batch = batch.replace(" " + BATCH_SEPARATOR, BATCH_SEPARATOR).replace(BATCH_SEPARATOR + " ", BATCH_SEPARATOR).strip(" ")
+
+            if stats is not None:
+                stats.stop(self.stats_channel, name, start, docs=len(docs), bytes_in=size_in, bytes_out=len(batch))
+
+        clean_docs = batch.split(BATCH_SEPARATOR)
+        if len(clean_docs) != len(docs):
+            self.logger.debug("A match spans documents of the batch. Cleaning documents one by one")
+            return [self.apply(doc) for doc in docs]
+
+        return clean_docs
+
+    """
+    apply_batch for a pandas Series, e.g. a column of a csv chunk.
+    Missing values give an empty string, as cleanup_data does for None
+    """
+    def apply_series (self, series):
+        """
+        :param series: pandas Series of document strings
+        :return: pandas Series of cleaned document strings, with the same index
+        """
+        import pandas as pd
+
+        series = series.fillna("")
+        if not pd.api.types.is_string_dtype(series):
+            series = series.astype(str)
+
+        return pd.Series(self.apply_batch(series.tolist()), index=series.index, dtype=object)
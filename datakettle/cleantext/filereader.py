@@ -1,14 +1,64 @@
 import os
-import numpy as np
-import pandas as pd
+import json
 import logging
 from . import utils
-import urllib3
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Defaults used when reading web pages
+DEF_HTTP_CONCURRENCY = 8
+DEF_HTTP_CONNECTIONS_PER_HOST = 4
+DEF_HTTP_TIMEOUT = 30.0
+DEF_HTTP_RETRIES = 3
+DEF_HTTP_BACKOFF_FACTOR = 0.5
+
+# Number of hosts for which connection pools are kept open
+HTTP_NUM_POOLS = 100
+
+# Number of characters read at a time by iter_file_chunks
+DEF_READ_CHUNK_SIZE = 1024 * 1024
+
+# Characters that can continue a JSON number
+JSON_NUMBER_CHARS = "0123456789.eE+-"
+
+# A JSON decode error this many characters or more before the end of the data is not caused by a value cut
+# at the end of a chunk (the longest cut token, -Infinity or a \uXXXX escape, is shorter), and is raised right away
+JSON_CUT_VALUE_MARGIN = 16
+
+# Number of rows read at a time by iter_csv_chunks
+DEF_CSV_CHUNK_ROWS = 10000
+
+"""
+Get a urllib3 PoolManager for the given settings. Managers are shared by all readers using the
+same settings, so that connections to a host are reused across readers.
+Connections per host are capped (block=True makes threads wait for a free connection).
+Connection errors and 429/5xx responses are retried with exponential backoff
+"""
+@functools.lru_cache(maxsize=16)
+def get_http_pool_manager (connections_per_host, timeout, retries, backoff_factor):
+    # Imported here, so that readers of local files don't pay for it
+    import urllib3
+
+    retry = urllib3.Retry(total=retries, backoff_factor=backoff_factor,
+                          status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+
+    return urllib3.PoolManager(num_pools=HTTP_NUM_POOLS, maxsize=connections_per_host, block=True,
+                               timeout=urllib3.Timeout(total=timeout), retries=retry)
 
 class TextFileReader (object):
-    def __init__(self):
+    def __init__(self, connections_per_host=None, timeout=None, retries=None, backoff_factor=None):
+        """
+        :param connections_per_host: Maximum number of open connections to a single host
+        :param timeout: Timeout in seconds for a web page request
+        :param retries: Number of retries for a failed web page request
+        :param backoff_factor: Backoff factor for retries. Sleeps backoff_factor * 2^(retry - 1) seconds between retries
+        """
         self.logger = logging.getLogger(__name__)
-        self.http_pool_manager = urllib3.PoolManager()
+        self.http_pool_manager = get_http_pool_manager(int(utils.if_null(connections_per_host, DEF_HTTP_CONNECTIONS_PER_HOST)),
+                                                       float(utils.if_null(timeout, DEF_HTTP_TIMEOUT)),
+                                                       int(utils.if_null(retries, DEF_HTTP_RETRIES)),
+                                                       float(utils.if_null(backoff_factor, DEF_HTTP_BACKOFF_FACTOR)))
 
     def read_file (self, file_path):
         fh = None
@@ -30,6 +80,169 @@ class TextFileReader (object):
 
         return file_data
 
+    """
+    Read a text file in chunks of @chunk_size characters, so that large files are never
+    held in memory as a whole. Yields nothing if the file cannot be read
+    """
+    def iter_file_chunks (self, file_path, chunk_size=None):
+        """
+        :param file_path: Path of the file
+        :param chunk_size: Number of characters per chunk. Default 1M
+        :return: Generator of strings
+        """
+        chunk_size = int(utils.if_null(chunk_size, DEF_READ_CHUNK_SIZE))
+        total_chars = 0
+
+        try:
+            with open(file_path, mode='r', encoding="utf8") as fh:
+                for chunk in iter(lambda: fh.read(chunk_size), ""):
+                    total_chars += len(chunk)
+                    yield chunk
+
+            self.logger.info("Read: {} chars from {}.".format(total_chars, file_path))
+
+        except IOError as ioerror:
+            self.logger.error ("Error Occurred while reading: ", exc_info=True)
+
+    """
+    Read a JSON Lines file (one JSON value per line) line by line. Yields one value at a time.
+    Blank lines are skipped; lines that are not valid JSON are logged and skipped
+    """
+    def iter_json_lines (self, file_path):
+        """
+        :param file_path: Path of the file
+        :return: Generator of JSON values (dictionaries for JSON objects)
+        """
+        decoder = json.JSONDecoder()
+        line_count = 0
+
+        try:
+            with open(file_path, mode='r', encoding="utf8") as fh:
+                for line_number, line in enumerate(fh, start=1):
+                    line = line.strip()
+                    if len(line) < 1:
+                        continue
+
+                    try:
+                        value = decoder.decode(line)
+                    except ValueError:
+                        self.logger.error("Invalid JSON at {}:{}".format(file_path, line_number))
+                        continue
+
+                    line_count += 1
+                    yield value
+
+            self.logger.info("Read: {} JSON lines from {}.".format(line_count, file_path))
+
+        except IOError as ioerror:
+            self.logger.error ("Error Occurred while reading: ", exc_info=True)
+
+    """
+    Read a JSON file incrementally. If the file holds a top level array, its items are parsed and
+    yielded one at a time, so that memory is bounded by the largest item rather than the whole array.
+    Any other JSON value is yielded as a single value. Parsing stops at the first syntax error
+    """
+    def iter_json_file (self, file_path, chunk_size=None):
+        """
+        :param file_path: Path of the file
+        :param chunk_size: Number of characters read at a time. Default 1M
+        :return: Generator of JSON values
+        """
+        decoder = json.JSONDecoder()
+        chunks = self.iter_file_chunks(file_path, chunk_size=chunk_size)
+
+        buffer = ""
+        pos = 0
+        eof = False
+
+        # Skip white space, reading more data as needed. Returns False at the end of the data
+        def skip_white_space():
+            nonlocal buffer, pos, eof
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\n\r":
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return pos < len(buffer)
+
+                buffer = next(chunks, None)
+                pos = 0
+                if buffer is None:
+                    buffer = ""
+                    eof = True
+
+        # Read at least as much data as is left in the buffer after pos. A value spanning many chunks is then
+        # parsed again a logarithmic number of times, so that parsing time stays linear in its size
+        def read_more():
+            nonlocal buffer, pos, eof
+            # Drop the data consumed so far before growing the buffer
+            parts = [buffer[pos:]]
+            needed = max(len(parts[0]), 1)
+            while needed > 0:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    eof = True
+                    break
+                parts.append(chunk)
+                needed -= len(chunk)
+
+            buffer = "".join(parts)
+            pos = 0
+
+        # Parse one JSON value at pos. Values cut at a chunk edge are parsed again with more data
+        def parse_value():
+            nonlocal buffer, pos, eof
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A value at the end of the buffer, or followed by number characters, may continue in the next chunk
+                    if eof or (end < len(buffer) and buffer[end] not in JSON_NUMBER_CHARS):
+                        pos = end
+                        return value
+                except json.JSONDecodeError as ex:
+                    # An unterminated string is reported at its start, and may end in the data not read yet
+                    if eof or (ex.pos < len(buffer) - JSON_CUT_VALUE_MARGIN and not ex.msg.startswith("Unterminated string")):
+                        raise
+
+                read_more()
+
+        try:
+            if not skip_white_space():
+                return
+
+            if buffer[pos] != "[":
+                value = parse_value()
+                if skip_white_space():
+                    raise ValueError("Extra data after the JSON value")
+                yield value
+                return
+
+            pos += 1
+            item_count = 0
+            while True:
+                if not skip_white_space():
+                    raise ValueError("Unterminated JSON array")
+
+                if buffer[pos] == "]":
+                    break
+
+                if item_count > 0:
+                    if buffer[pos] != ",":
+                        raise ValueError("Expected ',' between JSON array items")
+                    pos += 1
+                    if not skip_white_space():
+                        raise ValueError("Unterminated JSON array")
+
+                item = parse_value()
+                item_count += 1
+                yield item
+
+            pos += 1
+            if skip_white_space():
+                raise ValueError("Extra data after the JSON array")
+
+        except ValueError:
+            self.logger.error("Failed to parse JSON file {}".format(file_path), exc_info=True)
+
     """
     Read a csv file into a pandas dataframe.
     """
@@ -41,6 +254,8 @@ class TextFileReader (object):
         :param select_cols: List of columns to read. If None, selects all columns from the file
         :return: Pandas dataframe
         """
+        import pandas as pd
+
         df = None
 
         separator = utils.if_null(separator, ",")
@@ -57,6 +272,33 @@ class TextFileReader (object):
 
         return df
 
+    """
+    Read a csv file in chunks of @chunk_rows rows. Yields a pandas dataframe per chunk,
+    so that memory use does not grow with the size of the file. Yields nothing if the file cannot be read
+    """
+    def iter_csv_chunks (self, file_path, separator=",", header_row=None, select_cols=None, chunk_rows=None):
+        """
+        :param file_path: CSV file path and file name
+        :param separator: Column delimiter. Defaults to ,
+        :param header_row: Integer row position of the header row. Defaults to None indicating no header row
+        :param select_cols: List of columns to read. If None, selects all columns from the file
+        :param chunk_rows: Number of rows per chunk. Default 10000
+        :return: Generator of pandas dataframes
+        """
+        import pandas as pd
+
+        separator = utils.if_null(separator, ",")
+        header = utils.if_null(header_row, None)
+        chunk_rows = int(utils.if_null(chunk_rows, DEF_CSV_CHUNK_ROWS))
+
+        try:
+            with pd.read_csv(file_path, sep=separator, header=header, usecols=select_cols, chunksize=chunk_rows) as chunks:
+                for df in chunks:
+                    yield df
+
+        except Exception as ex:
+            self.logger.error("Error Occurred while reading: ", exc_info=True)
+
     """
     Read contents of a text file line by line
     """
@@ -83,10 +325,29 @@ class TextFileReader (object):
     Read contents of a web page using the given http url
     """
     def read_web_page(self, url):
+        status, file_data, etag = self.fetch_web_page(url)
+
+        return file_data
+
+    """
+    Read contents of a web page, with an optional conditional request.
+    Returns (http status, page content, etag). When @etag is given and the page has not changed,
+    status is 304 and content is None. Content is None if the page could not be read
+    """
+    def fetch_web_page(self, url, etag=None):
         file_data = None
+        status = None
+        new_etag = None
 
         try:
-            resp = self.http_pool_manager.request('GET', url)
+            headers = {"If-None-Match": etag} if etag else None
+            resp = self.http_pool_manager.request('GET', url, headers=headers)
+            status = resp.status
+            new_etag = resp.headers.get("ETag")
+
+            if etag and status == 304:
+                return status, None, etag
+
             assert resp.status == 200, f"Error reading from {url}"
 
             file_data = str(resp.data, 'utf-8')
@@ -96,4 +357,52 @@ class TextFileReader (object):
         except Exception as e:
             self.logger.error(e)
 
-        return file_data
\ No newline at end of file
+        return status, file_data, new_etag
+
+    """
+    Read contents of a list of web pages concurrently, using a pool of @concurrency threads.
+    Yields (url, page content) tuples. Content is None if a page could not be read.
+    When @ordered is True, pages are yielded in the order of @urls, otherwise as soon as they arrive.
+    At most 2 x @concurrency requests are pending at a time, so that pages are processed while others are fetched
+    @read_fn can replace read_web_page, to fetch each url differently. Its result is yielded in place of the page content
+    """
+    def read_web_pages(self, urls, concurrency=DEF_HTTP_CONCURRENCY, ordered=True, read_fn=None):
+        """
+        :param urls: Iterable of http urls
+        :param concurrency: Number of pages fetched at the same time
+        :param ordered: Yield pages in input order when True, in completion order when False
+        :param read_fn: Function called with each url. Defaults to read_web_page
+        :return: Generator of (url, page content) tuples
+        """
+        concurrency = max(1, int(utils.if_null(concurrency, DEF_HTTP_CONCURRENCY)))
+        read_fn = read_fn if read_fn is not None else self.read_web_page
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = deque()
+            futures = {}
+
+            for url in urls:
+                future = executor.submit(read_fn, url)
+                futures[future] = url
+                if ordered:
+                    pending.append(future)
+
+                while len(futures) >= 2 * concurrency:
+                    yield from self.collect_web_pages(pending, futures, ordered)
+
+            while futures:
+                yield from self.collect_web_pages(pending, futures, ordered)
+
+    """
+    Wait for pending page requests of read_web_pages. Yields (url, page content) of the completed ones.
+    In order mode only the oldest request is waited for
+    """
+    def collect_web_pages(self, pending, futures, ordered):
+        if ordered:
+            future = pending.popleft()
+            yield futures.pop(future), future.result()
+            return
+
+        done, not_done = wait(list(futures), return_when=FIRST_COMPLETED)
+        for future in done:
+            yield futures.pop(future), future.result()
@@ -1,10 +1,473 @@
 import logging
-from bs4 import BeautifulSoup
 import re
 import json
 import os
-import nltk
-from nltk.tokenize import word_tokenize
+import sys
+import functools
+import itertools
+import threading
+from html import unescape
+from html.entities import html5
+from . import utils
+
+# Pnemonic map
+#-------------
+# COMMA : ,
+# DQUOTE: "
+# SQUOTE: '
+# FSLASH: /
+# BSLASH: \
+# HASH  : #
+# AT    : @
+# EXCL  : !
+# CARAT : ^
+# AMP   : &
+# PCT   : %
+# DOLLAR: $
+# TILDA : ~
+# APOS  : `
+# COLN  : :
+# SCOLN : ;
+# QMARK : ?
+# LT    : <
+# GT    : >
+# EQ    : =
+# PIPE  : |
+# CBRACE: {, }
+# SBRKT : [,]
+# BRKT  : (,)
+# USCORE: _
+# ASTRSK: *
+# DOT   : .
+# MINUS : -
+# PLUS  : +
+PNEMONICS = {
+    "COMMA" : ",",
+    "DQUOTE": '\"',
+    "SQUOTE": "\'",
+    "FSLASH": "/",
+    "BSLASH": "\\\\",
+    "HASH"  : "#",
+    "AT"    : "@",
+    "EXCL"  : "!",
+    "CARAT" : "^",
+    "AMP"   : "&",
+    "PCT"   : "%",
+    "DOLLAR": "$",
+    "TILDA" : "~",
+    "APOS"  : "`",
+    "COLN"  : ":",
+    "SCOLN" : ";",
+    "QMARK" : "?",
+    "LT"    : "<",
+    "GT"    : ">",
+    "EQ"    : "=",
+    "PIPE"  : "|",
+    "CBRACE": "{}",
+    "SBRKT" : "\[\]",
+    "BRKT"  : "()",
+    "USCORE": "_",
+    "ASTRSK": "*",
+    "DOT"   : ".",
+    "MINUS" : "-",
+    "PLUS"  : "+"
+}
+
+# Human readable codes for white space characters, used by remove_white_spaces
+WHITE_SPACE_CODES = {
+    "NEWLINE": "\n",
+    "CR"     : "\r",
+    "FF"     : "\f",
+    "TAB"    : "\t"
+}
+
+# Number of compiled patterns and translation tables kept in each cache
+CACHE_SIZE = 256
+
+# Number of documents cleaned in one pass by clean_batch
+DEF_CLEAN_BATCH_SIZE = 8192
+
+MARKUP_REGEX    = re.compile('<[^<]+?>')
+HTML_NAME_REGEX = re.compile(r"[&]\w+[;]", flags=re.MULTILINE)
+HTML_NUM_REGEX  = re.compile(r"[&][#]\w+[;]", flags=re.MULTILINE)
+
+# remove_html_encoded_chars in one pass. Matches of HTML_NAME_REGEX and HTML_NUM_REGEX can never overlap,
+# so when the replacement cannot complete a new match of the second pass, one pass with an optional # gives the same result
+HTML_ENCODED_REGEX = re.compile(r"[&][#]?\w+[;]", flags=re.MULTILINE)
+
+# Character references as html.unescape() finds them: numeric, and named ones with or without the semicolon.
+# NUL is left out, so that a reference never spans the documents of a batch (see CleaningPlan.apply_batch)
+HTML_ENTITY_REGEX = re.compile(r"&(#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;\x00]{1,32};?)")
+
+# Modes of the remove_html_encoded_chars clean step
+HTML_ENCODED_MODES = ["remove", "decode"]
+
+"""
+Compile the regular expression character class for a tuple of special character pnemonic codes.
+Compiled expressions are cached, so that they are built once and not for every document
+"""
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_special_chars (special_chars):
+    pattern = ""
+    for spec_char in special_chars:
+        pattern = "{}{}".format(pattern, PNEMONICS[spec_char])
+
+    return re.compile("[{}]".format(pattern), flags=re.MULTILINE)
+
+"""
+Compile (and cache) the regular expression that captures text between <container_tag ...> and </container_tag>
+"""
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_tag_pattern (container_tag):
+    start_tag = "<{}".format(container_tag.lower())
+    end_tag   = "</{}>".format(container_tag.lower())
+
+    return re.compile(r"{0}(.*?){1}".format(start_tag, end_tag), re.MULTILINE|re.DOTALL)
+
+"""
+Compile (and cache) a case insensitive regular expression matching the literal @text
+"""
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_ignorecase (text):
+    return re.compile(re.escape(text), re.IGNORECASE)
+
+"""
+str.translate can be used instead of a regex only when a matched character is replaced by 
+a single character or removed. A backslash is left to re, which treats it as an escape.
+"""
+def is_translatable (replace_char):
+    return replace_char == '' or (len(replace_char) == 1 and replace_char != '\\')
+
+"""
+Build a str.translate table for the ASCII range, mapping each matching character to the ordinal
+of @replace_char (None when removed). Characters outside the table are left untouched by str.translate
+"""
+def make_ascii_table (chars, replace_char):
+    replace_code = ord(replace_char) if replace_char else None
+    return tuple(replace_code if chr(code) in chars else code for code in range(128))
+
+"""
+True if special characters class @regex (see compile_special_chars) can only match ASCII characters.
+The class lists ASCII characters only, but when it starts with CARAT it is a negated class [^...],
+which matches every other character, non-ASCII ones included
+"""
+def is_ascii_class (regex):
+    return not regex.pattern.startswith("[^")
+
+"""
+Translation table equivalent to remove_special_chars. None when the fast path cannot be used:
+a replacement str.translate cannot do, or a negated class, which matches characters outside the ASCII table
+"""
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def special_chars_table (special_chars, replace_char):
+    if not is_translatable(replace_char):
+        return None
+
+    regex = compile_special_chars(special_chars)
+    if not is_ascii_class(regex):
+        return None
+
+    chars = [chr(code) for code in range(128) if regex.match(chr(code))]
+
+    return make_ascii_table(chars, replace_char)
+
+"""
+Translation table equivalent to remove_white_spaces. None when the fast path cannot be used
+(SPACE or an unknown code in @white_space_chars, or a multi character replacement)
+"""
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def white_spaces_table (white_space_chars, replace_char):
+    if not is_translatable(replace_char):
+        return None
+
+    if any(wchar not in WHITE_SPACE_CODES for wchar in white_space_chars):
+        return None
+
+    chars = [WHITE_SPACE_CODES[wchar] for wchar in white_space_chars]
+
+    return make_ascii_table(chars, replace_char)
+
+"""
+True if html encoded characters replaced with @replace_char can be removed with one pass of HTML_ENCODED_REGEX.
+The replacement must not be empty, and hold none of the characters of a reference (&, #, ; and word characters)
+"""
+def is_single_pass_replacement (replace_char):
+    return bool(replace_char) and re.search(r"[&#;\w]", replace_char) is None
+
+"""
+Table of every complete named character reference, "&amp;" -> "&". Built once per process
+"""
+@functools.lru_cache(maxsize=1)
+def get_entity_table ():
+    return {"&" + name: text for name, text in html5.items() if name.endswith(";")}
+
+"""
+Text of numeric character reference @reference ("&#38;", "&#x26"), as html.unescape() gives it.
+Documents repeat a few references many times, hence the cache
+"""
+@functools.lru_cache(maxsize=4096)
+def decode_numeric_reference (reference):
+    return unescape(reference)
+
+"""
+Name of a character reference to drop: "nbsp", "&nbsp;", "#160" or "&#xa0;" give "nbsp;", "#160;", "#xa0;"
+"""
+def normalize_entity_name (name):
+    return name.lstrip("&").rstrip(";") + ";"
+
+"""
+Replacement function of HTML_ENTITY_REGEX decoding character references as html.unescape() does.
+References to the characters of @drop_entities (a tuple of reference names, see normalize_entity_name) are replaced
+with @replace_char instead. "nbsp" drops &nbsp;, &#160; and &#xa0; alike.
+Complete named references are looked up in the entity table, numeric references are decoded once and cached
+"""
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def entity_decoder (drop_entities=(), replace_char=' '):
+    entity_table = get_entity_table()
+    drop_texts = frozenset(unescape("&" + normalize_entity_name(name)) for name in drop_entities)
+
+    def decode(match):
+        reference = match.group()
+
+        text = entity_table.get(reference)
+        if text is None and reference[1] == "#":
+            text = decode_numeric_reference(reference)
+
+        if text is not None:
+            return replace_char if text in drop_texts else text
+
+        # Legacy reference without the semicolon, e.g. "&copy2022": the longest name it starts with
+        name = reference[1:]
+        for length in range(len(name), 1, -1):
+            text = html5.get(name[:length])
+            if text is not None:
+                return (replace_char if text in drop_texts else text) + name[length:]
+
+        return reference
+
+    return decode
+
+# Sentence split methods of split_sentences_batch
+SENTENCE_SPLIT_METHODS = {"punkt": "split_by_punkt", "newline": "split_by_newline", "char_sequence": "split_by_char_sequence"}
+
+# Punkt sentence tokenizers by language. Each is loaded once per process, on first use
+PUNKT_TOKENIZERS = {}
+PUNKT_LOCK = threading.Lock()
+
+"""
+Get the Punkt sentence tokenizer of a language. Loading the model is expensive, hence it is done
+once per process and language and shared by all TextCleaner instances and threads
+"""
+def get_punkt_tokenizer (language="english"):
+    tokenizer = PUNKT_TOKENIZERS.get(language)
+    if tokenizer is not None:
+        return tokenizer
+
+    with PUNKT_LOCK:
+        # Another thread may have loaded it meanwhile
+        if language not in PUNKT_TOKENIZERS:
+            # nltk is imported on first use. It takes longer to import than everything else in the package
+            import nltk
+
+            # Recent nltk versions load the pickle-free punkt_tab model for this resource
+            PUNKT_TOKENIZERS[language] = nltk.data.load('tokenizers/punkt/{}.pickle'.format(language))
+
+    return PUNKT_TOKENIZERS[language]
+
+# Word tokenizer applied to each sentence by the nltk backend, as nltk.word_tokenize does. Created on first use
+WORD_TOKENIZER = None
+
+def get_word_tokenizer ():
+    global WORD_TOKENIZER
+    if WORD_TOKENIZER is None:
+        from nltk.tokenize import NLTKWordTokenizer
+        WORD_TOKENIZER = NLTKWordTokenizer()
+    return WORD_TOKENIZER
+
+# Fast word tokenizer of the "regex" backend. A single regex pass, no sentence splitting.
+# Follows Treebank conventions for the common cases: punctuation symbols are separate tokens,
+# hyphenated words and numbers with separators (1,000.50) are kept whole, and contractions are
+# split (don't -> do n't, it's -> it 's). Known differences from nltk.word_tokenize:
+#   - periods of abbreviations are split off ("Mr." -> "Mr", "."), as there is no Punkt model
+#   - double quotes stay " instead of `` and ''
+#   - other inner apostrophes split a word ("o'clock" -> "o", "'", "clock")
+#   - "..." is one token but other runs of punctuation are split into single characters ("--" -> "-", "-")
+#   - symbols are always split from words, e.g. in leftover markup ("/p", "href=")
+FAST_TOKEN_REGEX = re.compile(r"""
+      \d+(?:[.,]\d+)+                  # numbers with separators
+    | \w+(?=n't\b)                     # do|n't, ca|n't
+    | n't\b
+    | '(?:s|m|d|ll|re|ve)\b             # 's 'm 'd 'll 're 've
+    | \w+(?:-\w+)*                      # words and hyphenated words
+    | \.\.\.                            # ellipsis
+    | [^\w\s]                           # any other symbol
+""", flags=re.VERBOSE | re.IGNORECASE)
+
+# Word tokenizer backends of get_word_tokens
+TOKENIZER_BACKENDS = ["nltk", "regex"]
+
+# Stopword sets by language. Each is loaded once per process, on first use
+STOPWORDS = {}
+STOPWORDS_LOCK = threading.Lock()
+
+# Custom stopword files by language: {lang: {"files": [...], "replace": bool}}
+STOPWORD_FILES = {}
+
+# Characters removed from each line of a stopwords file
+STOPWORD_LINE_TABLE = str.maketrans("", "", "\n\r\f\t")
+
+"""
+Path of the bundled stopwords file of a language: stopwords_<lang>.txt next to this module
+"""
+def stopwords_file_path (lang="en"):
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), "stopwords_{}.txt".format(lang))
+
+"""
+Read a stopwords file, one stop word per line. Returns a list of words (empty if the file cannot be read)
+"""
+def read_stopwords (file_name):
+    logger = logging.getLogger(__name__)
+    logger.info ("Reading stopwords from {}".format(file_name))
+
+    try:
+        with open(file_name, mode='r') as fh:
+            # Remove trailing newline, carriage return from each word
+            return [line.translate(STOPWORD_LINE_TABLE) for line in fh]
+
+    except IOError as ioerror:
+        logger.error ("Error Occurred while reading: {}".format(file_name), exc_info=True)
+
+    return []
+
+"""
+Add a custom stopwords file for a language. Its words are added to the bundled stopwords_<lang>.txt,
+or replace them if @replace is True. A language without a bundled file can be added this way
+"""
+def register_stopwords_file (lang, file_name, replace=False):
+    with STOPWORDS_LOCK:
+        registered = STOPWORD_FILES.setdefault(lang, {"files": [], "replace": False})
+        registered["files"].append(file_name)
+        registered["replace"] = registered["replace"] or replace
+
+        # Reload on next use
+        STOPWORDS.pop(lang, None)
+
+"""
+Get the stopwords of a language as a frozenset. The stopword files are read once per process
+"""
+def get_stopwords (lang="en"):
+    stopwords = STOPWORDS.get(lang)
+    if stopwords is not None:
+        return stopwords
+
+    with STOPWORDS_LOCK:
+        if lang not in STOPWORDS:
+            registered = STOPWORD_FILES.get(lang, {"files": [], "replace": False})
+
+            file_names = list(registered["files"])
+            if not registered["replace"]:
+                file_names.insert(0, stopwords_file_path(lang))
+
+            words = set()
+            for file_name in file_names:
+                words.update(read_stopwords(file_name))
+
+            STOPWORDS[lang] = frozenset(words)
+
+    return STOPWORDS[lang]
+
+"""
+Tokenize a batch of documents. Runs in worker processes for get_word_tokens_batch, hence a module level function
+"""
+def tokenize_chunk (docs, language, backend):
+    tc = TextCleaner()
+    return [tc.get_word_tokens(doc, language=language, backend=backend) for doc in docs]
+
+"""
+Split a batch of documents into sentences with TextCleaner method @method_name.
+Runs in worker processes for split_sentences_batch, hence a module level function
+"""
+def split_sentences_chunk (docs, method_name, options):
+    split_method = getattr(TextCleaner(), method_name)
+    return [split_method(doc, **options) for doc in docs]
+
+"""
+Clean an iterable of documents with CleaningPlan @plan, @batch_size documents per pass. Yields cleaned documents in order
+"""
+def clean_doc_batches (plan, docs, batch_size=DEF_CLEAN_BATCH_SIZE):
+    for batch in utils.iter_batches(docs, batch_size):
+        yield from plan.apply_batch(batch)
+
+"""
+Lowercase a stream of text chunks. Gives the same text as lowercasing the concatenated chunks:
+str.lower is context sensitive for a final sigma only, and that context never extends across
+white space. So each chunk is cut after its last white space and the rest is carried over
+"""
+def lower_chunks (chunks):
+    carry = ""
+    for chunk in chunks:
+        text = carry + chunk
+        cut = max(text.rfind("\n"), text.rfind(" "))
+
+        if cut < 0:
+            carry = text
+            continue
+
+        carry = text[cut + 1:]
+        yield text[:cut + 1].lower()
+
+    if carry:
+        yield carry.lower()
+
+"""
+Split a stream of text chunks by @separator. Yields the same items as "".join(chunks).split(separator),
+finding separators across chunk edges. Only the document being assembled is held in memory
+"""
+def split_chunks (chunks, separator):
+    buffer = ""
+    for chunk in chunks:
+        # A separator may start within the last len(separator) - 1 characters of the buffer
+        search_pos = max(0, len(buffer) - len(separator) + 1)
+        buffer += chunk
+
+        start = 0
+        pos = buffer.find(separator, search_pos)
+        while pos >= 0:
+            yield buffer[start:pos]
+            start = pos + len(separator)
+            pos = buffer.find(separator, start)
+
+        buffer = buffer[start:]
+
+    yield buffer
+
+"""
+Text within the <@container_tag ...> ... </@container_tag> blocks of text[@pos:@endpos], joined with spaces.
+Gives the blocks get_text_within_tags finds, in a single linear scan: once a start tag has no end tag
+after it, no later start tag has one either. Tags are matched case insensitively.
+When @open_block_suffix is given, a block still open at @endpos ends there, followed by @open_block_suffix
+"""
+def join_text_within_tags (text, container_tag, pos=0, endpos=None, open_block_suffix=None):
+    endpos = len(text) if endpos is None else endpos
+    start_tag = compile_ignorecase("<{}".format(container_tag))
+    end_tag = compile_ignorecase("</{}>".format(container_tag))
+
+    blocks = []
+    while True:
+        start = start_tag.search(text, pos, endpos)
+        if start is None:
+            break
+
+        end = end_tag.search(text, start.end(), endpos)
+        if end is None:
+            if open_block_suffix is not None:
+                blocks.append(text[start.end():endpos] + open_block_suffix)
+            break
+
+        blocks.append(text[start.end():end.start()])
+        pos = end.end()
+
+    return " ".join(blocks)
 
 """
 Class intended to be used to clean up text data. 
@@ -25,33 +488,7 @@ class TextCleaner (object):
     Returns a list of stopwords
     """
     def read_stopwords_file(self, lang="en"):
-        file_name = "stopwords_{}.txt".format(lang)
-        fh = None
-        stopwords = []
-
-        file_path = os.path.dirname(os.path.realpath(__file__))
-        file_name = os.path.join(file_path, file_name)
-
-        self.logger.info ("Reading stopwords list for [{}] from {}".format(lang, file_name))
-
-        try:
-            fh = open(file_name, mode='r')
-
-            # Each line is a stop word in the file. Reads them into a list
-            lines = fh.readlines()
-
-            # Remove trailing newline, carriage return from each word
-            for word in lines:
-                sword = self.remove_white_spaces(white_space_chars=['NEWLINE', 'CR', 'FF', 'TAB'], replace_char='', doc=word)
-                stopwords.append(sword)
-
-        except IOError as ioerror:
-            self.logger.error ("Error Occurred while reading: {}".format(file_name), exc_info=True)
-
-        finally:
-            if fh:
-                fh.close()
-        return stopwords
+        return read_stopwords(stopwords_file_path(lang))
 
     """
     If the file data contains multiple documents (markup content), separated
@@ -108,6 +545,107 @@ class TextCleaner (object):
             doc_list = data_str.lower().split(separator_code.lower())
         return doc_list
 
+    """
+    Streaming version of split_multi_content_by_end_tag. Takes the file data as an iterable of
+    text chunks (see TextFileReader.iter_file_chunks) and yields one document at a time.
+    Peak memory is bounded by the largest document instead of the whole file
+    """
+    def iter_split_multi_content_by_end_tag (self, chunks, separator_markup="html"):
+        """
+        :param chunks: Iterable of string chunks (whole document, in pieces)
+        :param separator_markup: markup tag that separates documents within the file
+        :return: Generator of documents
+        """
+        start_tag = "<{}".format(separator_markup.lower())
+        end_tag   = "</{}>".format(separator_markup.lower())
+
+        self.logger.info ("Start-End tags: {} {}".format(start_tag, end_tag))
+
+        for doc in self.iter_split_chunks(chunks, end_tag):
+            yield "{} {}".format(doc, end_tag)
+
+    """
+    Streaming version of split_multi_text_by_separator. Takes the file data as an iterable of
+    text chunks (see TextFileReader.iter_file_chunks) and yields one document at a time
+    """
+    def iter_split_multi_text_by_separator (self, chunks, separator_code=""):
+        """
+        :param chunks: Iterable of string chunks (whole document, in pieces)
+        :param separator_code: document delimiter - character sequence that separates documents within the file
+        :return: Generator of documents
+        """
+        if separator_code == "":
+            # The whole data is a single document
+            doc = "".join(lower_chunks(chunks))
+            if len(doc) > 0:
+                yield doc
+            return
+
+        if separator_code.lower() == 'newline':
+            separator_code = '\n'
+
+        yield from self.iter_split_chunks(chunks, separator_code.lower())
+
+    """
+    Single pass version of iter_split_multi_content_by_end_tag followed by get_text_within_tags on each document.
+    Takes the data as an iterable of text chunks and yields, for each document, the text within @container_tag
+    blocks joined with spaces ("" when there is none). Tags are found case insensitively in the data as it is read;
+    only the extracted text is copied, and lowercased unless @preserve_case is True
+    """
+    def iter_text_within_tags_by_end_tag (self, chunks, separator_markup="html", container_tag="body", preserve_case=False):
+        """
+        :param chunks: Iterable of string chunks (whole document, in pieces)
+        :param separator_markup: markup tag that separates documents within the file
+        :param container_tag: The markup tag within which the text of interest is packed
+        :param preserve_case: True keeps the case of the text. By default it is lowercased, as by the split functions
+        :return: Generator of strings, one per document
+        """
+        end_tag = "</{}>".format(separator_markup)
+        doc_end = compile_ignorecase(end_tag)
+
+        # Documents split by end tag get the end tag appended. When it closes the container tag too,
+        # a block still open at the end of a document ends there
+        open_block_suffix = " " if separator_markup.lower() == container_tag.lower() else None
+
+        def extract(text, pos, endpos):
+            doc_text = join_text_within_tags(text, container_tag, pos, endpos, open_block_suffix=open_block_suffix)
+            return doc_text if preserve_case else doc_text.lower()
+
+        buffer = ""
+        has_data = False
+        for chunk in chunks:
+            if not chunk:
+                continue
+            has_data = True
+
+            # An end tag may start within the last len(end_tag) - 1 characters of the buffer
+            search_pos = max(0, len(buffer) - len(end_tag) + 1)
+            buffer += chunk
+
+            start = 0
+            end = doc_end.search(buffer, search_pos)
+            while end is not None:
+                yield extract(buffer, start, end.start())
+                start = end.end()
+                end = doc_end.search(buffer, start)
+
+            buffer = buffer[start:]
+
+        if has_data:
+            yield extract(buffer, 0, len(buffer))
+
+    """
+    Lowercase and split a stream of text chunks by @separator. Yields nothing for empty data
+    """
+    def iter_split_chunks (self, chunks, separator):
+        lowered = (chunk for chunk in lower_chunks(chunks) if chunk)
+
+        first = next(lowered, None)
+        if first is None:
+            return
+
+        yield from split_chunks(itertools.chain([first], lowered), separator)
+
     """
     Get content enclosed in a specific tag, within a document having markups
     For example, retrieve only the content enclosed inside <body></body> tag 
@@ -118,16 +656,12 @@ class TextCleaner (object):
         :param container_tag: The markup tag within which the text of interest is packed. E.g: Text between <body> and </body>
         :return: List of strings
         """
-        start_tag = "<{}".format(container_tag.lower())
-        end_tag   = "</{}>".format(container_tag.lower())
-
         if (doc is None):
             return None
 
         tag_doc = None
 
-        regex_pattern = r"{0}(.*?){1}".format(start_tag, end_tag)
-        tag_doc = re.findall(regex_pattern, doc, re.MULTILINE|re.DOTALL)
+        tag_doc = compile_tag_pattern(container_tag).findall(doc)
 
         return tag_doc
 
@@ -146,13 +680,15 @@ class TextCleaner (object):
 
         if (valid_markup):
             # Use beautifulsoup to replace all tags with spaces
+            from bs4 import BeautifulSoup
+
             cleantext = ""
             soup = BeautifulSoup(doc, "lxml")
             cleantext = soup.get_text(separator=' ')
         else:
             # Use regular expression to get rid of any tags
             #pattern = re.compile(r'<.*?>')
-            cleantext = re.sub('<[^<]+?>', '', doc)
+            cleantext = MARKUP_REGEX.sub('', doc)
 
         return cleantext
 
@@ -174,6 +710,11 @@ class TextCleaner (object):
         if doc is None:
             return None
 
+        # Fast path: all listed characters are single characters, replaced in one str.translate pass
+        table = white_spaces_table(tuple(white_space_chars), replace_char)
+        if table is not None:
+            return doc.translate(table)
+
         for wchar in white_space_chars:
             if (wchar == 'NEWLINE'):
                 remove = '\n'
@@ -200,18 +741,37 @@ class TextCleaner (object):
         :param doc: Document string
         :param replace_char: The character to be used to replace a matching encoded character. Default is white space
         """
-        pat_html_name = r"[&]\w+[;]"
-        pat_html_num  = r"[&][#]\w+[;]"
-
         if (doc is None):
             return None
 
-        clean_doc = re.sub(pat_html_name, replace_char, doc, flags=re.MULTILINE)
+        if is_single_pass_replacement(replace_char):
+            return HTML_ENCODED_REGEX.sub(replace_char, doc)
+
+        clean_doc = HTML_NAME_REGEX.sub(replace_char, doc)
 
-        clean_doc = re.sub(pat_html_num, replace_char, clean_doc, flags=re.MULTILINE)
+        clean_doc = HTML_NUM_REGEX.sub(replace_char, clean_doc)
 
         return clean_doc
 
+    """
+    Decode named (&amp;) and numeric (&#38;, &#x26;) character references in one pass, as html.unescape() does.
+    References to the characters in @drop_entities are replaced with @replace_char instead of decoded.
+    E.g: drop_entities=["nbsp", "shy"] replaces &nbsp;, &#160; and &shy; with @replace_char
+    """
+    def decode_html_entities (self, doc, drop_entities=None, replace_char=' '):
+        """
+        :param doc: Document string
+        :param drop_entities: List of reference names to drop: "nbsp", "&nbsp;", "#160", ... (optional)
+        :param replace_char: The character to be used to replace a dropped reference. Default is white space
+        """
+        if doc is None:
+            return None
+
+        if "&" not in doc:
+            return doc
+
+        return HTML_ENTITY_REGEX.sub(entity_decoder(tuple(drop_entities or ()), replace_char), doc)
+
     """
     Split a given text document by newline. 
     if @trim_spaces is True, consecutive whitespaces (/r, /t, /f...) are removed
@@ -267,12 +827,17 @@ class TextCleaner (object):
         return sentences
 
     """
-    Splits a document into sentences using nltk.punkt module. Available only for English
+    Splits a document into sentences using nltk.punkt module. English by default; other languages
+    need their Punkt model in the NLTK data package.
     nltk Punkt Sentence Tokenizer divides a text into a list of sentences by using an unsupervised algorithm.
     The NLTK data package includes a pre-trained Punkt tokenizer for English, which is being used here.
+    The tokenizer is loaded once per process. See get_punkt_tokenizer()
     """
-    def split_by_punkt (self, doc, trim_spaces=True, remove_empty_lines=True):
-        sent_detector = nltk.data.load('tokenizers/punkt/english.pickle')
+    def split_by_punkt (self, doc, trim_spaces=True, remove_empty_lines=True, language="english"):
+        if doc is None:
+            return None
+
+        sent_detector = get_punkt_tokenizer(language)
 
         raw_sentences = sent_detector.tokenize(doc.strip())
 
@@ -292,6 +857,80 @@ class TextCleaner (object):
                     sentences.append(clean_sentence)
         return sentences
 
+    """
+    Split many documents into sentences. Yields one list of sentences per document, in order.
+    @docs can be a list or any iterable (e.g. a generator), and is consumed lazily.
+    The Punkt model is loaded once per process. With @parallelism > 1, documents are split in
+    batches of @batch_size in a pool of worker processes
+    Methods:
+        punkt         - split_by_punkt. Option: language
+        newline       - split_by_newline
+        char_sequence - split_by_char_sequence. Option: char_sequence
+    """
+    def split_sentences_batch (self, docs, method="punkt", trim_spaces=True, remove_empty_lines=True,
+                               parallelism=None, batch_size=256, **options):
+        """
+        :param docs: Iterable of documents
+        :param method: punkt, newline or char_sequence
+        :param trim_spaces: Squeeze white spaces within sentences
+        :param remove_empty_lines: Leave out empty sentences
+        :param parallelism: Number of worker processes. None or 1 splits in the current process, 0 or "auto" uses all cores
+        :param batch_size: Number of documents sent to a worker at a time
+        :param options: Method specific options, e.g. language="english" or char_sequence=". "
+        :return: Generator of lists of sentences
+        """
+        if method not in SENTENCE_SPLIT_METHODS:
+            raise ValueError("Unknown sentence split method: {}. Use one of {}".format(method, sorted(SENTENCE_SPLIT_METHODS)))
+
+        options = dict(options, trim_spaces=trim_spaces, remove_empty_lines=remove_empty_lines)
+
+        return utils.parallel_map_batches(split_sentences_chunk, docs, batch_size=batch_size, parallelism=parallelism,
+                                          args=(SENTENCE_SPLIT_METHODS[method], options))
+
+    """
+    Run the clean steps of @plan over many documents at once. Each clean step runs once per batch of @batch_size
+    documents instead of once per document (see CleaningPlan.apply_batch), which is several times faster for
+    short documents. Gives the same text as CleaningPlan.apply() on each document; None gives an empty string.
+    Returns the same kind of container as @docs:
+        list or tuple      list of cleaned documents
+        pandas Series      Series with the same index and name. Missing values give an empty string, others are cast to str
+        NumPy array        object array of the same shape
+        other iterables    generator of cleaned documents, consumed lazily
+    """
+    def clean_batch (self, docs, plan, batch_size=DEF_CLEAN_BATCH_SIZE):
+        """
+        :param docs: Documents: list, tuple, pandas Series, NumPy array or any iterable of strings
+        :param plan: CleaningPlan, or a list of clean steps as in the "clean" section of a channel
+        :param batch_size: Number of documents cleaned in one pass
+        :return: Cleaned documents
+        """
+        # cleaningplan imports this module
+        from .cleaningplan import CleaningPlan
+
+        if not isinstance(plan, CleaningPlan):
+            plan = CleaningPlan(plan)
+
+        # pandas and numpy are only imported by the caller passing their types
+        pd = sys.modules.get("pandas")
+        if pd is not None and isinstance(docs, pd.Series):
+            series = docs.fillna("")
+            if not pd.api.types.is_string_dtype(series):
+                series = series.astype(str)
+
+            return pd.Series(list(clean_doc_batches(plan, series.tolist(), batch_size)), index=docs.index,
+                             name=docs.name, dtype=object)
+
+        np = sys.modules.get("numpy")
+        if np is not None and isinstance(docs, np.ndarray):
+            cleaned = np.empty(docs.shape, dtype=object)
+            cleaned.ravel()[:] = list(clean_doc_batches(plan, docs.ravel().tolist(), batch_size))
+            return cleaned
+
+        if isinstance(docs, (list, tuple)):
+            return list(clean_doc_batches(plan, docs, batch_size))
+
+        return clean_doc_batches(plan, docs, batch_size)
+
     """
     Takes in a json string and converts it to a python object.
     If the input json is an array, the returned object will be a list of dictionaries.
@@ -316,6 +955,16 @@ class TextCleaner (object):
 
         return json_obj
 
+    """
+    Build the regular expression character class that matches the special characters in :special_chars list
+    """
+    def get_special_chars_pattern (self, special_chars):
+        """
+        :param special_chars: List of special characters, denoted by pnemonic codes. E.g: COMMA, DQUOTE, SQUOTE, FSLASH, BSLASH, HASH, etc.
+        :return: Regular expression pattern string. E.g: [,#@]
+        """
+        return compile_special_chars(tuple(special_chars)).pattern
+
     """
     Removes special characters specified in :special_chars list
     """
@@ -325,117 +974,115 @@ class TextCleaner (object):
         :param replace_char: character to be replaced with. Default is white space
         :param doc: String or text document to clean
         """
-        # Pnemonic map
-        #-------------
-        # COMMA : ,
-        # DQUOTE: "
-        # SQUOTE: '
-        # FSLASH: /
-        # BSLASH: \
-        # HASH  : #
-        # AT    : @
-        # EXCL  : !
-        # CARAT : ^
-        # AMP   : &
-        # PCT   : %
-        # DOLLAR: $
-        # TILDA : ~
-        # APOS  : `
-        # COLN  : :
-        # SCOLN : ;
-        # QMARK : ?
-        # LT    : <
-        # GT    : >
-        # EQ    : =
-        # PIPE  : |
-        # CBRACE: {, }
-        # SBRKT : [,]
-        # BRKT  : (,)
-        # USCORE: _
-        # ASTRSK: *
-        # DOT   : .
-        # MINUS : -
-        # PLUS  : +
-
-        pnemonics = {
-            "COMMA" : ",",
-            "DQUOTE": '\"',
-            "SQUOTE": "\'",
-            "FSLASH": "/",
-            "BSLASH": "\\\\",
-            "HASH"  : "#",
-            "AT"    : "@",
-            "EXCL"  : "!",
-            "CARAT" : "^",
-            "AMP"   : "&",
-            "PCT"   : "%",
-            "DOLLAR": "$",
-            "TILDA" : "~",
-            "APOS"  : "`",
-            "COLN"  : ":",
-            "SCOLN" : ";",
-            "QMARK" : "?",
-            "LT"    : "<",
-            "GT"    : ">",
-            "EQ"    : "=",
-            "PIPE"  : "|",
-            "CBRACE": "{}",
-            "SBRKT" : "\[\]",
-            "BRKT"  : "()",
-            "USCORE": "_",
-            "ASTRSK": "*",
-            "DOT"   : ".",
-            "MINUS" : "-",
-            "PLUS"  : "+"
-        }
-
-        pattern = ""
-        for spec_char in special_chars:
-            pattern = "{}{}".format(pattern, pnemonics[spec_char])
-
-        pattern = "[{}]".format(pattern)
-        #print (pattern)
-
-        clean_doc = re.sub(pattern, replace_char, doc, flags=re.MULTILINE)
+        special_chars = tuple(special_chars)
+
+        # Fast path: single character replacement or removal using str.translate
+        table = special_chars_table(special_chars, replace_char)
+        if table is not None:
+            return doc.translate(table)
+
+        clean_doc = compile_special_chars(special_chars).sub(replace_char, doc)
         return clean_doc
 
     """
     Convert a given sentence or document into word tokens. 
-    Uses nltk word_tokenize()
+    backend "nltk" (default) gives the same tokens as nltk word_tokenize(), using the cached Punkt model
+    and a shared word tokenizer instead of looking them up for every document.
+    backend "regex" is a much faster single regex pass, close to but not the same as nltk. See FAST_TOKEN_REGEX
     
     Returns empty list if the doc is empty
     """
-    def get_word_tokens (self, doc, language='english'):
+    def get_word_tokens (self, doc, language='english', backend="nltk"):
         """
         :param doc: Source document to be tokenized
         :param language: Language input for nltk. Default is 'english'
+        :param backend: nltk or regex
         :return: List of word tokens. Empty list when the document is empty
         """
         if doc is None or len(doc) < 1:
             return []
 
-        return nltk.word_tokenize(doc, language=language)
+        if backend == "regex":
+            return FAST_TOKEN_REGEX.findall(doc)
+
+        if backend != "nltk":
+            raise ValueError("Unknown tokenizer backend: {}. Use one of {}".format(backend, TOKENIZER_BACKENDS))
+
+        word_tokenizer = get_word_tokenizer()
+        return [token for sentence in get_punkt_tokenizer(language).tokenize(doc)
+                for token in word_tokenizer.tokenize(sentence)]
+
+    """
+    Tokenize many documents. Yields one list of word tokens per document, in order.
+    @docs can be a list or any iterable (e.g. a generator), and is consumed lazily.
+    With @parallelism > 1, documents are tokenized in batches of @batch_size in a pool of worker processes
+    """
+    def get_word_tokens_batch (self, docs, language='english', backend="nltk", parallelism=None, batch_size=256):
+        """
+        :param docs: Iterable of documents
+        :param language: Language input for nltk. Default is 'english'
+        :param backend: nltk or regex. See get_word_tokens()
+        :param parallelism: Number of worker processes. None or 1 tokenizes in the current process, 0 or "auto" uses all cores
+        :param batch_size: Number of documents sent to a worker at a time
+        :return: Generator of lists of word tokens
+        """
+        if backend not in TOKENIZER_BACKENDS:
+            raise ValueError("Unknown tokenizer backend: {}. Use one of {}".format(backend, TOKENIZER_BACKENDS))
+
+        return utils.parallel_map_batches(tokenize_chunk, docs, batch_size=batch_size, parallelism=parallelism,
+                                          args=(language, backend))
 
     """
     Given a list of word tokens, remove all stopwords. 
-    If a list of stopwords is supplied, the list will be used. Otherwise, list of stopwords will be read from stopwords_<ll>.txt
+    If a list of stopwords is supplied, the list will be used. Otherwise, stopwords of @lang are taken from
+    the stopword registry (stopwords_<ll>.txt, read once per process). See get_stopwords()
     
     Returns a list of filtered word tokens. None if the supplied word_tokens is None.
     """
     def remove_stopwords (self, word_tokens, stopwords=None, lang="en" ):
         """
         :param word_tokens: List of words (word tokens)
-        :param stopwords: List of stopwords (optional)
+        :param stopwords: List (or set) of stopwords (optional)
         :param lang: (language code. E.g: en, optional)
         :return: List of filtered word tokens. Otherwise None
         """
-        if stopwords is None or len(stopwords) < 1:
-            stopwords = self.read_stopwords_file(lang=lang)
-
         if word_tokens is None:
             return None
 
+        stopwords = self.get_stopword_set(stopwords, lang=lang)
+
         filtered_tokens = [w for w in word_tokens if w not in stopwords]
 
         return filtered_tokens
 
+    """
+    Remove stopwords from many lists of word tokens. The stopword set is resolved once for all lists.
+    Yields one filtered list per input list, in order (None for None)
+    """
+    def remove_stopwords_batch (self, token_lists, stopwords=None, lang="en"):
+        """
+        :param token_lists: Iterable of lists of word tokens
+        :param stopwords: List (or set) of stopwords (optional)
+        :param lang: (language code. E.g: en, optional)
+        :return: Generator of lists of filtered word tokens
+        """
+        stopwords = self.get_stopword_set(stopwords, lang=lang)
+
+        for word_tokens in token_lists:
+            if word_tokens is None:
+                yield None
+            else:
+                yield [w for w in word_tokens if w not in stopwords]
+
+    """
+    Stopwords to filter with: the supplied stopwords as a set, or the registered stopwords of @lang
+    """
+    def get_stopword_set (self, stopwords=None, lang="en"):
+        if stopwords is None or len(stopwords) < 1:
+            return get_stopwords(lang)
+
+        if isinstance(stopwords, (set, frozenset)):
+            return stopwords
+
+        return frozenset(stopwords)
+
@@ -3,8 +3,10 @@
 #
 #-----------------------------------------------------------------------------------------
 import math
-import numpy
 import os
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 #import boto3
 #import s3fs
 
@@ -42,19 +44,88 @@ def df_size(df):
 """
 Given a local directory path, get eligible files names from the path.
 * If file_filter is specified in the config JSON, fetch file names with only the specified extension. E.g: .json 
+Files are listed by datakettle.file_finder.FileFinder, in path order. Readers call find_files, which takes all the filters
 """
 def get_files_in_path (path, file_filter):
-    files_list = []
-    for file in os.listdir(path):
+    # Imported here, as datakettle.file_finder imports this module
+    from datakettle.file_finder import FileFinder
 
-        if file_filter != "":
+    return [file for file, stat in FileFinder(file_filter=file_filter).find(path)]
 
-            if file.endswith(file_filter):
-                files_list.append(os.path.join(path, file))
-        else:
-            files_list.append(os.path.join(path, file))
+"""
+SHA-256 hex digest of the content of a file, read in blocks of @block_size bytes
+"""
+def file_sha256 (file_path, block_size=1024 * 1024):
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            hasher.update(block)
+
+    return hasher.hexdigest()
+
+"""
+Group items of an iterable into lists of @batch_size items. The last batch may be smaller.
+Items are pulled lazily, so that only one batch is held in memory at a time
+"""
+def iter_batches (iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+"""
+Convert a parallelism setting into a number of processes.
+None or "" means no parallelism (1). 0 or "auto" means one process per CPU core
+"""
+def resolve_parallelism (value):
+    if value is None or value == "":
+        return 1
+
+    if value == "auto" or int(value) <= 0:
+        return os.cpu_count() or 1
+
+    return int(value)
+
+"""
+Apply @function to batches of @batch_size items, in a pool of worker processes.
+@function takes a list of items and returns a list of results; it must be a module level function.
+Yields results one item at a time, in input order. Items are consumed lazily: at most two batches
+per worker are pending at a time. With parallelism 1, batches are processed in the current process
+"""
+def parallel_map_batches (function, iterable, batch_size=256, parallelism=None, args=()):
+    """
+    :param function: function(batch, *args) returning a list of results
+    :param iterable: Items to process. Can be a generator
+    :param batch_size: Number of items sent to a worker at a time
+    :param parallelism: Number of worker processes. See resolve_parallelism()
+    :param args: Extra arguments passed to @function
+    :return: Generator of results
+    """
+    parallelism = resolve_parallelism(parallelism)
+    batches = iter_batches(iterable, batch_size)
+
+    if parallelism <= 1:
+        for batch in batches:
+            yield from function(batch, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=parallelism) as pool:
+        pending = deque()
+
+        for batch in batches:
+            pending.append(pool.submit(function, batch, *args))
+
+            if len(pending) >= 2 * parallelism:
+                yield from pending.popleft().result()
 
-    return files_list
+        while pending:
+            yield from pending.popleft().result()
     
     
 class DateOps (object):
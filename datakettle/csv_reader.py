@@ -1,33 +1,22 @@
-import os
-from datakettle.cleantext.textcleaner import TextCleaner
 from datakettle.cleantext.filereader import TextFileReader
 import datakettle.cleantext.utils as utils
-import logging
+from datakettle.base_reader import BaseReader
 
-class CSVReader (object):
-
-    def __init__(self, source_config):
-        self.source_config = source_config
-        self.logger = logging.getLogger(__name__)
-
-        self.def_special_chars = ['MINUS', 'COMMA', 'DQUOTE', 'SQUOTE', 'FSLASH', 'BSLASH', 'HASH', 'AT', 'EXCL', 'CARAT',
-                          'AMP', 'PCT', 'DOLLAR', 'TILDA', 'APOS', 'COLN', 'SCOLN', 'QMARK', 'LT', 'GT', 'EQ', 'PIPE', 'CBRACE',
-                          'SBRKT','BRKT', 'USCORE', 'ASTRSK', 'DOT', 'PLUS']
-
-        self.def_white_space_chars = ["NEWLINE", 'CR', 'FF', 'TAB']
+class CSVReader (BaseReader):
 
     """
     Read local csv files from configured directory path
     """
     def read_local_files (self):
+        return list(self.iter_local_files())
+
+    """
+    Read a single csv file. Yields one {"content", "label"} record per row
+    """
+    def iter_file_records (self, file):
         tfr = TextFileReader ()
-        tc = TextCleaner ()
         access = self.source_config["access"]
 
-        file_filter = ""
-        if access["file_filter"] :
-            file_filter = access["file_filter"]
-
         # Read column delimiter
         delimiter = ","
         if "delimiter" in access:
@@ -57,90 +46,48 @@ class CSVReader (object):
         if "label_value_override" in access:
             global_label_value = utils.if_null(access["label_value_override"], None)
 
-        # Read file names from given path
-        files_list = utils.get_files_in_path(access["path"], file_filter)
-
-        file_data_list = []
-        label_value_list = []
-        for file in files_list:
-
-            # read csv file as a pandas dataframe
-            data_df = tfr.read_csv_file (file_path=file, separator=delimiter, header_row=header_row, select_cols=usecols)
-            self.logger.info("Found {} documents ".format(len(data_df)))
-
-            if utils.df_size(data_df) < 1:
-                continue
+        # Read the csv file in chunks of rows. Each chunk is cleaned column-wise,
+        # in worker processes when parallelism is enabled
+        data_chunks = tfr.iter_csv_chunks (file_path=file, separator=delimiter, header_row=header_row, select_cols=usecols,
+                                           chunk_rows=access.get("csv_chunk_size"))
+        data_chunks = self.iter_timed("read", data_chunks, count=utils.df_size, file=file)
+        chunk_args = ((data_df, label_column is not None, global_label_value) for data_df in data_chunks)
 
-            # Convert data column (text rows) into a list
-            text_list = list(data_df.iloc[:,0].values)
+        if self.parallelism <= 1:
+            chunk_records = (self.csv_chunk_records(*args) for args in chunk_args)
+        else:
+            chunk_records = self.pool_map("csv_chunk_records", chunk_args)
 
-            # If label column is specified, convert label column into list
-            if label_column is not None:
-                label_list = list(data_df.iloc[:,1].values)
+        doc_count = 0
+        for records in chunk_records:
+            doc_count += len(records)
+            yield from records
 
-            # Iterate through each text row
-            id = 0
-            for textdoc in text_list:
-                # Cleanup  document
-                clean_data = self.cleanup_data(textdoc)
-                # Get the label value
-                label_value = global_label_value
-                if label_column is not None:
-                    label_value = label_list[id]
-
-                file_data_list.append({"content": clean_data, "label":label_value})
-                id += 1
-
-        return file_data_list
+        self.logger.info("Found {} documents ".format(doc_count))
 
     """
-    Read json files from an S3 path
+    Clean the text column of a chunk of csv rows and convert the chunk into a list of {"content", "label"} records
     """
-    def read_s3_files (self, config):
-        self.logger.error ("S3 file reader: Not yet implemented")
-        return [], []
-
-    """
-    Cleanup file data list using the cleaning steps listed within the sources section of the feed config JSON
-    """
-    def cleanup_data (self, clean_data):
-        if clean_data is None or len(clean_data) < 1:
-            return ""
-
-        tc = TextCleaner()
-        clean_steps = self.source_config["clean"]
-
-        # Iterate through each step and perform specified cleaning action
-        for cstep in clean_steps:
-
-            stepname = cstep["step"]
-
-            #self.logger.info("Processing: {}".format(stepname))
-
-            if stepname == "remove_all_markup":
-                clean_data = tc.remove_all_markup (doc=clean_data, valid_markup=False)
-
-            if stepname == "remove_html_encoded_chars":
-                clean_data = tc.remove_html_encoded_chars(clean_data, replace_char=' ')
-
-            if stepname == "remove_special_chars":
-                if "special_chars" in cstep:
-                    special_chars = cstep["special_chars"]
-                else:
-                    special_chars = self.def_special_chars
-
-                replace_char = cstep["replace_char"] if cstep.get("replace_char") else ''
-                clean_data = tc.remove_special_chars (special_chars, clean_data, replace_char=replace_char)
-
-            if stepname == "remove_white_spaces":
-                if "white_space_chars" in cstep:
-                    white_space_chars = cstep["white_space_chars"]
-                else:
-                    white_space_chars = self.def_white_space_chars
-
-                clean_data = tc.remove_white_spaces(white_space_chars=white_space_chars, doc=clean_data)
-
-        return clean_data
+    def csv_chunk_records (self, data_df, has_label_column, global_label_value):
+        """
+        :param data_df: Chunk of the csv file. Data column first, then the label column if any
+        :param has_label_column: True when the chunk has a label column
+        :param global_label_value: Label of every record when there is no label column
+        :return: List of records
+        """
+        if utils.df_size(data_df) < 1:
+            return []
+
+        # Clean the whole data column at once
+        text_list = self.cleaning_plan.apply_series(data_df.iloc[:,0]).tolist()
+
+        # If label column is specified, convert label column into list
+        if has_label_column:
+            label_list = list(data_df.iloc[:,1].values)
+        else:
+            label_list = [global_label_value] * len(text_list)
+
+        return [{"content": clean_data, "label": label_value} for clean_data, label_value in zip(text_list, label_list)]
 
     """
     From the config, understand the file endpoint. It can be local file system or Amazon S3. 
@@ -163,3 +110,24 @@ class CSVReader (object):
 
         return data_list
 
+    """
+    Generator version of read_csv_data. Yields one record at a time
+    """
+    def iter_csv_data (self):
+
+        access = self.source_config["access"]
+
+        if (access["endpoint"] == "csv") and (access["filesystem"] == "local"):
+            self.logger.info ("Streaming local csv files from {}".format(access["path"]))
+            yield from self.iter_local_files ()
+
+        if (access["endpoint"] == "csv") and (access["filesystem"] == "s3"):
+            self.logger.info("Streaming s3 csv files from {}".format(access["path"]))
+            data_list, label_list = self.read_s3_files (access)
+            yield from data_list
+
+    """
+    Records of the channel. Entry point used by DataServer
+    """
+    def iter_data (self):
+        return self.iter_csv_data()
@@ -0,0 +1,414 @@
+import os
+import re
+import time
+import zlib
+import pickle
+import hashlib
+import logging
+import numpy as np
+import datakettle.cleantext.utils as utils
+
+"""
+Removal of duplicate and near duplicate records, after cleaning.
+
+Exact duplicates are found by a hash of the record content. Near duplicates are found with MinHash
+signatures of the word shingles of the content, looked up in an LSH index: signatures are cut into bands,
+and records sharing a band are candidates. A candidate is a near duplicate when the share of equal
+signature values (an estimate of the Jaccard similarity of the shingle sets) is at least the threshold.
+
+Records are deduplicated per channel ("scope": "channel"), or across all channels ("scope": "all").
+The first record read is kept, later copies are dropped.
+
+With a path, the index of each scope is saved to <path>/<channel or ALL>.dedup once the records are read,
+and loaded on the next run, so that records of later incremental runs are checked against earlier runs as well.
+Each indexed record remembers its source (file path or URL). A record found in the index under its own source
+is the same record read again (a "merge" run, or a changed file), and is kept.
+"""
+
+DEDUP_VERSION = 1
+
+SCOPES = ["channel", "all"]
+
+DEF_SCOPE = "all"
+
+# Estimated Jaccard similarity from which records are near duplicates
+DEF_THRESHOLD = 0.8
+
+# Number of MinHash values per signature
+DEF_NUM_PERM = 128
+
+# Number of words per shingle
+DEF_SHINGLE_SIZE = 5
+
+DEF_SEED = 1
+
+INDEX_SUFFIX = ".dedup"
+
+# Mersenne prime of the universal hash functions, and the range of hash values
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Multiplier combining the word hashes of a shingle
+SHINGLE_MULTIPLIER = np.uint64(1000003)
+
+# Number of shingles hashed at a time, bounding the (shingles x num_perm) matrix
+SHINGLE_BLOCK_SIZE = 2048
+
+"""
+Number of bands and rows per band of an LSH index of @num_perm values, for @threshold.
+Takes the most rows per band (fewest false candidates) for which records at @threshold similarity
+still share a band with probability of about 1 - 1/e or more
+"""
+def get_lsh_bands (num_perm, threshold):
+    for rows in range(num_perm, 0, -1):
+        bands = num_perm // rows
+        if (1.0 / bands) ** (1.0 / rows) <= threshold:
+            return bands, rows
+
+    return num_perm, 1
+
+"""
+Hash of the content of a record, for exact duplicates
+"""
+def content_hash (content):
+    return hashlib.blake2b(content.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+"""
+32 bit hashes of the word shingles of @text (@shingle_size words each). Texts shorter than a shingle
+give a single shingle of all their words. Returns a uint64 array of the distinct hashes, empty for no words
+"""
+def shingle_hashes (text, shingle_size=DEF_SHINGLE_SIZE):
+    words = text.split()
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+
+    word_hashes = np.fromiter((zlib.crc32(word.encode("utf-8", "surrogatepass")) for word in words),
+                              dtype=np.uint64, count=len(words))
+
+    size = min(shingle_size, len(words))
+    count = len(words) - size + 1
+
+    hashes = word_hashes[:count].copy()
+    for offset in range(1, size):
+        hashes *= SHINGLE_MULTIPLIER
+        hashes += word_hashes[offset:offset + count]
+
+    return np.unique((hashes ^ (hashes >> np.uint64(32))) & MAX_HASH)
+
+class MinHasher (object):
+    def __init__(self, num_perm=DEF_NUM_PERM, shingle_size=DEF_SHINGLE_SIZE, seed=DEF_SEED):
+        """
+        :param num_perm: Number of hash functions, the length of a signature
+        :param shingle_size: Number of words per shingle
+        :param seed: Seed of the hash functions. Signatures are only comparable with the same seed
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+        # Universal hash functions (a * x + b) mod p
+        generator = np.random.RandomState(seed)
+        self.a = generator.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = generator.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    """
+    MinHash signature of @text: uint32 array of num_perm values. None when the text has no words
+    """
+    def signature (self, text):
+        hashes = shingle_hashes(text, self.shingle_size)
+        if not len(hashes):
+            return None
+
+        signature = np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        for start in range(0, len(hashes), SHINGLE_BLOCK_SIZE):
+            block = hashes[start:start + SHINGLE_BLOCK_SIZE, np.newaxis]
+            values = (block * self.a + self.b) % MERSENNE_PRIME & MAX_HASH
+            np.minimum(signature, values.min(axis=0), out=signature)
+
+        return signature.astype(np.uint32)
+
+class DedupIndex (object):
+    def __init__(self, path=None, near=True, threshold=DEF_THRESHOLD, num_perm=DEF_NUM_PERM,
+                 shingle_size=DEF_SHINGLE_SIZE, seed=DEF_SEED):
+        """
+        :param path: Index file, or None to keep the index in memory only
+        :param near: False finds exact duplicates only
+        :param threshold: Estimated Jaccard similarity from which records are near duplicates
+        :param num_perm: Number of MinHash values per signature
+        :param shingle_size: Number of words per shingle
+        :param seed: Seed of the MinHash functions
+        """
+        self.path = path
+        self.near = near
+        self.threshold = threshold
+        self.logger = logging.getLogger(__name__)
+
+        # An index is only valid for the settings it was built with
+        self.settings = {"version": DEDUP_VERSION, "near": near, "num_perm": num_perm,
+                         "shingle_size": shingle_size, "seed": seed}
+
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size, seed=seed) if near else None
+        self.band_count, self.band_rows = get_lsh_bands(num_perm, threshold)
+
+        # Record id -> source and signature. Content hash -> record id. Per band: band values -> record ids
+        self.sources = []
+        self.signatures = []
+        self.hashes = {}
+        self.bands = [{} for band in range(self.band_count)]
+
+        # Records indexed or matched in this run. Matching one of them makes a record a duplicate
+        self.seen = set()
+        self.changed = False
+
+        if self.path:
+            self.load()
+
+    def load (self):
+        try:
+            with open(self.path, "rb") as fh:
+                saved = pickle.load(fh)
+        except FileNotFoundError:
+            return
+        except Exception:
+            self.logger.error("Cannot read dedup index {}. Starting a new index".format(self.path), exc_info=True)
+            return
+
+        if saved.get("settings") != self.settings:
+            self.logger.info("Dedup settings changed since {} was written. Starting a new index".format(self.path))
+            return
+
+        self.sources = saved["sources"]
+        self.hashes = saved["hashes"]
+        self.signatures = list(saved["signatures"])
+        if self.near:
+            for record_id, signature in enumerate(self.signatures):
+                if signature is not None:
+                    self.add_bands(record_id, signature)
+
+    """
+    Write the index, if it changed. The file is replaced atomically
+    """
+    def save (self):
+        if not self.path or not self.changed:
+            return
+
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as fh:
+                pickle.dump({"settings": self.settings, "sources": self.sources, "hashes": self.hashes,
+                             "signatures": self.signatures}, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self.changed = False
+
+        except Exception:
+            self.logger.error("Cannot write dedup index {}".format(self.path), exc_info=True)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def band_keys (self, signature):
+        rows = self.band_rows
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.band_count)]
+
+    def add_bands (self, record_id, signature):
+        for table, key in zip(self.bands, self.band_keys(signature)):
+            table.setdefault(key, []).append(record_id)
+
+    """
+    Ids of indexed records similar to @signature, most similar first
+    """
+    def find_similar (self, signature):
+        candidates = set()
+        for table, key in zip(self.bands, self.band_keys(signature)):
+            candidates.update(table.get(key, ()))
+
+        matches = []
+        for record_id in candidates:
+            similarity = np.count_nonzero(self.signatures[record_id] == signature) / len(signature)
+            if similarity >= self.threshold:
+                matches.append((similarity, record_id))
+
+        return [record_id for similarity, record_id in sorted(matches, reverse=True)]
+
+    """
+    True if @record_id matches a record read from another source, or read earlier in this run
+    """
+    def is_copy (self, record_id, source):
+        if record_id in self.seen:
+            return True
+
+        if source is None or self.sources[record_id] != source:
+            return True
+
+        # The same record read again from its source
+        self.seen.add(record_id)
+        return False
+
+    """
+    Check @content read from @source against the index. Returns "exact" or "near" for duplicates, decided by
+    the most similar indexed record. Otherwise None is returned, and new content is added to the index
+    """
+    def check (self, content, source=None):
+        digest = content_hash(content)
+
+        record_id = self.hashes.get(digest)
+        if record_id is not None:
+            return "exact" if self.is_copy(record_id, source) else None
+
+        signature = self.hasher.signature(content) if self.near else None
+        if signature is not None:
+            similar = self.find_similar(signature)
+            if similar:
+                return "near" if self.is_copy(similar[0], source) else None
+
+        record_id = len(self.sources)
+        self.sources.append(source)
+        self.signatures.append(signature)
+        self.hashes[digest] = record_id
+        if signature is not None:
+            self.add_bands(record_id, signature)
+
+        self.seen.add(record_id)
+        self.changed = True
+        return None
+
+class Deduplicator (object):
+    def __init__(self, index_dir=None, scope=DEF_SCOPE, channels=None, near=True, threshold=DEF_THRESHOLD,
+                 num_perm=DEF_NUM_PERM, shingle_size=DEF_SHINGLE_SIZE, seed=DEF_SEED):
+        """
+        :param index_dir: Directory of the persistent indexes. None keeps the indexes in memory, for one run
+        :param scope: "channel" removes duplicates within each channel, "all" across all channels
+        :param channels: Names of the channels to deduplicate. None: all channels
+        :param near: False removes exact duplicates only
+        :param threshold: Estimated Jaccard similarity from which records are near duplicates. Default 0.8
+        :param num_perm: Number of MinHash values per signature. Default 128
+        :param shingle_size: Number of words per shingle. Default 5
+        :param seed: Seed of the MinHash functions
+        """
+        if scope not in SCOPES:
+            raise ValueError("Unknown dedup scope: {}. Use one of {}".format(scope, SCOPES))
+
+        self.index_dir = index_dir
+        self.scope = scope
+        self.channels = set(channels) if channels is not None else None
+        self.index_settings = {"near": near, "threshold": float(threshold), "num_perm": int(num_perm),
+                               "shingle_size": int(shingle_size), "seed": int(seed)}
+        self.logger = logging.getLogger(__name__)
+
+        if self.index_dir:
+            os.makedirs(self.index_dir, exist_ok=True)
+
+    """
+    Index file of the scope @name (channel name or ALL)
+    """
+    def index_path (self, name):
+        return os.path.join(self.index_dir, re.sub(r"[^\w.-]", "_", name) + INDEX_SUFFIX)
+
+    """
+    Index of the scope @name. Indexes are loaded again on every call, so that each run starts
+    from the saved state
+    """
+    def open_index (self, name):
+        path = self.index_path(name) if self.index_dir else None
+        return DedupIndex(path, **self.index_settings)
+
+    """
+    Yield the records of @records that are not duplicates. Records need "channel" and "source" keys
+    (iter_records(record_source=True)). Records of other channels, and records without content, pass through.
+    Indexes are saved when the records are exhausted or the caller stops
+    """
+    def iter_unique (self, records, stats=None, strip_source=False):
+        """
+        :param records: Iterable of records with "channel" and "source" keys
+        :param stats: PipelineStats to record the "dedup" step into, or None
+        :param strip_source: True removes the "channel" and "source" keys from the yielded records
+        """
+        indexes = {}
+        counts = {"records": 0, "exact": 0, "near": 0}
+
+        try:
+            for record in records:
+                channel = record.get("channel")
+                content = record.get("content")
+
+                duplicate = None
+                if content and (self.channels is None or channel in self.channels):
+                    name = channel if self.scope == "channel" else "ALL"
+                    index = indexes.get(name)
+                    if index is None:
+                        index = indexes[name] = self.open_index(name)
+
+                    start = time.perf_counter() if stats is not None else 0.0
+                    duplicate = index.check(content, record.get("source"))
+                    if stats is not None:
+                        stats.add(channel, "dedup", time.perf_counter() - start, docs=1, bytes_in=len(content),
+                                  bytes_out=0 if duplicate else len(content))
+
+                    counts["records"] += 1
+                    if duplicate:
+                        counts[duplicate] += 1
+
+                if duplicate:
+                    continue
+
+                if strip_source:
+                    record = {key: value for key, value in record.items() if key not in ("channel", "source")}
+                yield record
+
+        finally:
+            for index in indexes.values():
+                index.save()
+
+            self.logger.info("Dedup: {} of {} records were duplicates ({} exact, {} near)".format(
+                counts["exact"] + counts["near"], counts["records"], counts["exact"], counts["near"]))
+
+    """
+    Remove the saved index of a channel, or all saved indexes. Returns the number of removed indexes
+    """
+    def reset (self, channel=None):
+        if not self.index_dir or not os.path.isdir(self.index_dir):
+            return 0
+
+        if channel is not None:
+            paths = [self.index_path(channel)]
+        else:
+            paths = [os.path.join(self.index_dir, name) for name in os.listdir(self.index_dir) if name.endswith(INDEX_SUFFIX)]
+
+        removed = 0
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+
+        return removed
+
+"""
+Deduplicator for the "dedup" section of feed config @config, or None when no channel is deduplicated.
+@dedup (True, False or a dict of section settings) and @index_dir override the config
+"""
+def get_deduplicator (config, dedup=None, index_dir=None):
+    dedup_config = config.get("dedup")
+    if dedup is False:
+        return None
+
+    if isinstance(dedup, dict):
+        dedup_config = dict(dedup_config if isinstance(dedup_config, dict) else {}, **dedup)
+    elif dedup is True and not dedup_config:
+        dedup_config = {}
+
+    sources = config.get("sources", [])
+    if dedup_config is None or dedup_config is False:
+        # Only channels that turn dedup on themselves
+        channels = [source["channel"] for source in sources if source.get("access", {}).get("dedup") is True]
+        if not channels:
+            return None
+        dedup_config = {}
+    else:
+        dedup_config = dedup_config if isinstance(dedup_config, dict) else {}
+        channels = [source["channel"] for source in sources if source.get("access", {}).get("dedup") is not False]
+
+    return Deduplicator(index_dir=utils.if_null(index_dir, dedup_config.get("path")),
+                        scope=dedup_config.get("scope", DEF_SCOPE), channels=channels,
+                        near=dedup_config.get("near", True),
+                        threshold=utils.if_null(dedup_config.get("threshold"), DEF_THRESHOLD),
+                        num_perm=utils.if_null(dedup_config.get("num_perm"), DEF_NUM_PERM),
+                        shingle_size=utils.if_null(dedup_config.get("shingle_size"), DEF_SHINGLE_SIZE),
+                        seed=utils.if_null(dedup_config.get("seed"), DEF_SEED))
@@ -0,0 +1,227 @@
+import os
+import re
+import fnmatch
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import datakettle.cleantext.utils as utils
+
+"""
+Discovery of the files of a local file channel.
+
+Directories are read with os.scandir, which returns the file type along with each name, so that only
+files passing the name filters are stat'ed, once. Settings in the access section of a channel:
+    "file_filter"   file name extension, as before. E.g: ".json"
+    "recursive"     true reads sub directories as well (default false). Symbolic links to directories are not followed
+    "include"       glob patterns, or regular expressions prefixed with "re:". A file is read when it matches any of them.
+                    A glob without "/" matches the file name, at any depth ("*.json"). A glob with "/" and a regular
+                    expression match the path relative to "path" ("2024-*/*.json", "re:^2024-0[1-3]/")
+    "exclude"       patterns of files, and of directories not to descend into. E.g: ["tmp", "*.partial"]
+    "min_size", "max_size"  file size limits in bytes
+    "file_order"    order files are read in: "name" (path, default), "size" (largest first, so that parallel
+                    workers are not left waiting on one big file at the end) or "none" (directory order)
+    "scan_workers"  number of threads reading directories at the same time, for large trees or network file systems
+
+find_files returns (path, os.stat_result) tuples. Readers pass the stat on to the record cache and the
+manifest, so that files are not stat'ed again.
+"""
+
+FILE_ORDERS = ["name", "size", "none"]
+
+DEF_FILE_ORDER = "name"
+
+# Prefix of include and exclude patterns that are regular expressions
+REGEX_PREFIX = "re:"
+
+class PatternSet (object):
+    def __init__(self, patterns):
+        """
+        :param patterns: Glob pattern, regular expression prefixed with "re:", or a list of them
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+
+        name_patterns = []
+        path_patterns = []
+        for pattern in patterns:
+            if pattern.startswith(REGEX_PREFIX):
+                path_patterns.append("(?:{})".format(pattern[len(REGEX_PREFIX):]))
+            elif "/" in pattern:
+                path_patterns.append(r"\A" + fnmatch.translate(pattern.strip("/")))
+            else:
+                name_patterns.append(r"\A" + fnmatch.translate(pattern))
+
+        # All patterns of a kind are tried in a single search
+        self.name_regex = re.compile("|".join(name_patterns)) if name_patterns else None
+        self.path_regex = re.compile("|".join(path_patterns)) if path_patterns else None
+
+    """
+    True if the file or directory @name, at @rel_path relative to the searched directory, matches any pattern
+    """
+    def matches (self, name, rel_path):
+        if self.name_regex is not None and self.name_regex.search(name):
+            return True
+
+        return self.path_regex is not None and self.path_regex.search(rel_path) is not None
+
+"""
+PatternSet of @patterns, or None when there are none
+"""
+def get_pattern_set (patterns):
+    return PatternSet(patterns) if patterns else None
+
+class FileFinder (object):
+    def __init__(self, file_filter="", recursive=False, include=None, exclude=None, min_size=None, max_size=None,
+                 order=None, scan_workers=None):
+        """
+        :param file_filter: File name extension. "" matches any file
+        :param recursive: Read sub directories as well
+        :param include: Patterns of the files to read. See PatternSet. None reads all files
+        :param exclude: Patterns of the files, and directories, to leave out
+        :param min_size: Minimum file size in bytes
+        :param max_size: Maximum file size in bytes
+        :param order: "name", "size" (largest first) or "none". Default "name"
+        :param scan_workers: Number of threads reading directories. None or 1 reads them one after another
+        """
+        self.file_filter = utils.if_null(file_filter, "")
+        self.recursive = recursive
+        self.include = get_pattern_set(include)
+        self.exclude = get_pattern_set(exclude)
+        self.min_size = int(min_size) if min_size not in (None, "") else None
+        self.max_size = int(max_size) if max_size not in (None, "") else None
+
+        self.order = utils.if_null(order, DEF_FILE_ORDER)
+        if self.order not in FILE_ORDERS:
+            raise ValueError("Unknown file order: {}. Use one of {}".format(self.order, FILE_ORDERS))
+
+        self.scan_workers = utils.resolve_parallelism(scan_workers)
+        self.logger = logging.getLogger(__name__)
+
+    """
+    Files under directory @path, as (path, os.stat_result) tuples in the configured order
+    """
+    def find (self, path):
+        if self.recursive and self.scan_workers > 1:
+            files, dir_count = self.scan_parallel(path)
+        else:
+            files, dir_count = self.scan_serial(path)
+
+        if self.order == "name":
+            files.sort(key=lambda file: file[0])
+        elif self.order == "size":
+            files.sort(key=lambda file: (-file[1].st_size, file[0]))
+
+        self.logger.info("Found {} files in {} directories under {}".format(len(files), dir_count, path))
+        return files
+
+    def scan_serial (self, path):
+        files = []
+        pending = [(path, "")]
+        dir_count = 0
+
+        while pending:
+            dir_path, rel_dir = pending.pop()
+            dir_files, sub_dirs = self.scan_directory(dir_path, rel_dir, root=(dir_count == 0))
+            dir_count += 1
+
+            files.extend(dir_files)
+            # Depth first, in directory order
+            pending.extend(reversed(sub_dirs))
+
+        return files, dir_count
+
+    """
+    Read directories on scan_workers threads. os.scandir and stat release the GIL while they wait on the file system
+    """
+    def scan_parallel (self, path):
+        files, sub_dirs = self.scan_directory(path, "", root=True)
+        dir_count = 1
+
+        with ThreadPoolExecutor(max_workers=self.scan_workers, thread_name_prefix="scan") as executor:
+            pending = set(executor.submit(self.scan_directory, dir_path, rel_dir) for dir_path, rel_dir in sub_dirs)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dir_files, sub_dirs = future.result()
+                    dir_count += 1
+
+                    files.extend(dir_files)
+                    pending.update(executor.submit(self.scan_directory, dir_path, rel_dir) for dir_path, rel_dir in sub_dirs)
+
+        return files, dir_count
+
+    """
+    Read directory @dir_path, at @rel_dir ("" or ending with "/") relative to the searched directory.
+    Returns the matching files, and the sub directories to read as (path, relative path) tuples.
+    Errors are raised for the searched directory (@root) only, and logged for sub directories
+    """
+    def scan_directory (self, dir_path, rel_dir, root=False):
+        files = []
+        sub_dirs = []
+
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    name = entry.name
+                    rel_path = rel_dir + name
+
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+
+                    if is_dir:
+                        if self.recursive and not (self.exclude is not None and self.exclude.matches(name, rel_path)):
+                            sub_dirs.append((entry.path, rel_path + "/"))
+                        continue
+
+                    if not self.is_candidate(name, rel_path):
+                        continue
+
+                    try:
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        self.logger.error("Cannot access {}".format(entry.path), exc_info=True)
+                        continue
+
+                    if self.min_size is not None and stat.st_size < self.min_size:
+                        continue
+                    if self.max_size is not None and stat.st_size > self.max_size:
+                        continue
+
+                    files.append((entry.path, stat))
+
+        except OSError:
+            if root:
+                raise
+            self.logger.error("Cannot read directory {}".format(dir_path), exc_info=True)
+
+        return files, sub_dirs
+
+    """
+    True if the name and relative path of a file pass the extension, include and exclude filters
+    """
+    def is_candidate (self, name, rel_path):
+        if self.file_filter and not name.endswith(self.file_filter):
+            return False
+
+        if self.include is not None and not self.include.matches(name, rel_path):
+            return False
+
+        return not (self.exclude is not None and self.exclude.matches(name, rel_path))
+
+"""
+Files of a local file channel, as (path, os.stat_result) tuples. See FileFinder for the settings of @access
+"""
+def find_files (access):
+    """
+    :param access: Access section of the channel config
+    """
+    finder = FileFinder(file_filter=access.get("file_filter"), recursive=access.get("recursive", False),
+                        include=access.get("include"), exclude=access.get("exclude"),
+                        min_size=access.get("min_size"), max_size=access.get("max_size"),
+                        order=access.get("file_order"), scan_workers=access.get("scan_workers"))
+
+    return finder.find(access["path"])
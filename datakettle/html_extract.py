@@ -0,0 +1,369 @@
+from html import unescape
+from html.parser import HTMLParser
+from html.entities import html5
+
+"""
+Extraction of the title and of the content within tags from web pages, without a full BeautifulSoup tree.
+
+The html_reader reads the <title> of each page and, with "get_content_within_tag", the text of the tags
+matching a tag name and attributes. "extract_engine" in the access section selects how:
+    bs4       BeautifulSoup tree of the whole page, built with html.parser (default)
+    stream    html.parser events, collecting the text within matching tags as the page is parsed. No tree is built.
+              Gives the same title and content as bs4
+    lxml      lxml.html tree. Fastest, needs lxml. libxml2 fixes up broken markup, drops some white space only strings
+              and keeps unknown entities as they are, so text can differ slightly from bs4
+
+Text is extracted the same way as BeautifulSoup get_text(): strings within script, style and template tags and
+comments are left out, and strings made of white space only are reduced to a single newline or space.
+Character references are converted as BeautifulSoup does.
+Attributes match as in BeautifulSoup find_all: a value matches one of the classes of a tag, or the whole attribute
+value; True matches any value and None a missing attribute; a list matches any of its values.
+"""
+
+EXTRACT_ENGINES = ["bs4", "stream", "lxml"]
+
+DEF_EXTRACT_ENGINE = "bs4"
+
+# Strings within these tags are not text (BeautifulSoup Script, Stylesheet and TemplateString)
+NON_TEXT_TAGS = frozenset(["script", "style", "template"])
+
+# Tags without content or end tag
+VOID_TAGS = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta",
+                       "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex",
+                       "nextid", "spacer"])
+
+# White space only strings within these tags are kept as they are
+PRESERVE_WHITESPACE_TAGS = frozenset(["pre", "textarea"])
+
+# Attributes holding a white space separated list of values
+MULTI_VALUED_ATTRS = frozenset(["class", "rel", "rev", "accept-charset", "headers", "accesskey", "dropzone"])
+
+ASCII_SPACES = " \n\t\f\r"
+
+# Number of characters fed to the parser at a time when only the title is read
+TITLE_FEED_SIZE = 8192
+
+"""
+True if attribute values @attrs ({name: value}) match @attribs, the "attribs" of get_content_within_tag
+"""
+def match_attrs (attrs, attribs):
+    if not attribs:
+        return True
+
+    for name, expected in attribs.items():
+        value = attrs.get(name)
+
+        if expected is None or expected is False:
+            if value is not None:
+                return False
+            continue
+
+        if value is None:
+            return False
+
+        if expected is True:
+            continue
+
+        expected_values = expected if isinstance(expected, (list, tuple)) else [expected]
+        values = value.split() if name in MULTI_VALUED_ATTRS else []
+
+        if not any(item == value or item in values for item in expected_values):
+            return False
+
+    return True
+
+"""
+Text of a string between two tags, as BeautifulSoup stores it
+"""
+def normalize_string (text, preserve_whitespace=False):
+    if preserve_whitespace or text.strip(ASCII_SPACES):
+        return text
+
+    return "\n" if "\n" in text else " "
+
+"""
+Character of numeric character reference @name ("8212", "x2014"), following HTML5 as BeautifulSoup does:
+references in the windows-1252 range are taken as windows-1252, invalid ones give U+FFFD
+"""
+def convert_charref (name):
+    return unescape("&#{};".format(name))
+
+"""
+Character of named character reference @name ("amp"). Unknown names are kept as text, without the semicolon,
+as BeautifulSoup keeps them
+"""
+def convert_entityref (name):
+    return html5.get(name + ";", "&" + name)
+
+"""
+Combine the text of the matching tags as get_content_within_tag does: "all" joins them with spaces,
+"first" and "last" take one of them. None when nothing matched
+"""
+def join_snippets (snippets, find_what="all"):
+    if not snippets:
+        return None
+
+    if find_what == "all":
+        return ' '.join(snippets)
+    if find_what == "first":
+        return snippets[0]
+    if find_what == "last":
+        return snippets[-1]
+
+    raise ValueError("Unknown find value: {}. Use all, first or last".format(find_what))
+
+class StreamExtractor (HTMLParser):
+    """
+    Collects the page title and the text of the tags matching @find_tag and @attribs while the page is parsed.
+    Tags nest as in a BeautifulSoup html.parser tree: an end tag closes the most recent open tag of that name,
+    and end tags without an open tag are ignored
+    """
+    def __init__(self, find_tag=None, attribs=None, find_content=True):
+        """
+        :param find_tag: Tag name to collect the text of. None matches any tag
+        :param attribs: Attributes the tags must have. See match_attrs()
+        :param find_content: False reads the title only
+        """
+        super().__init__(convert_charrefs=False)
+        self.find_tag = find_tag
+        self.attribs = attribs
+        self.find_content = find_content
+
+        self.stack = []
+        self.closed_void_tags = []
+        self.pending = []
+        self.non_text_depth = 0
+        self.preserve_depth = 0
+
+        # Snippets in document order, and the ones still open as (stack depth, text parts)
+        self.snippets = []
+        self.open_snippets = []
+
+        self.head_depth = None
+        self.head_done = False
+        self.title_parts = None
+        self.title_depth = None
+        self.title_done = False
+
+    """
+    Pass the text read since the last tag to the title and the open snippets
+    """
+    def flush (self):
+        if not self.pending:
+            return
+
+        text = "".join(self.pending)
+        self.pending = []
+
+        if self.non_text_depth:
+            return
+
+        text = normalize_string(text, self.preserve_depth > 0)
+        if self.title_depth is not None:
+            self.title_parts.append(text)
+        for depth, parts in self.open_snippets:
+            parts.append(text)
+
+    def handle_starttag (self, tag, attrs):
+        self.start_tag(tag, attrs)
+
+    # A self-closing tag is closed right away. It does not take the place of an end tag of an earlier void tag
+    def handle_startendtag (self, tag, attrs):
+        self.start_tag(tag, attrs, close_void=False)
+        self.end_tag(tag)
+
+    """
+    Open @tag. A void tag is closed right away, unless @close_void is False, and its end tag is then ignored once
+    """
+    def start_tag (self, tag, attrs, close_void=True):
+        self.flush()
+
+        if tag == "head" and self.head_depth is None and not self.head_done:
+            self.head_depth = len(self.stack)
+        elif tag == "title" and self.head_depth is not None and self.title_parts is None:
+            self.title_parts = []
+            self.title_depth = len(self.stack)
+
+        if self.find_content and (self.find_tag is None or tag == self.find_tag):
+            if match_attrs({name: "" if value is None else value for name, value in attrs}, self.attribs):
+                parts = []
+                self.snippets.append(parts)
+                self.open_snippets.append((len(self.stack), parts))
+
+        self.stack.append(tag)
+        if tag in NON_TEXT_TAGS:
+            self.non_text_depth += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+
+        if close_void and tag in VOID_TAGS:
+            self.end_tag(tag)
+            self.closed_void_tags.append(tag)
+
+    def handle_endtag (self, tag):
+        if tag in self.closed_void_tags:
+            self.closed_void_tags.remove(tag)
+            return
+
+        self.end_tag(tag)
+
+    def end_tag (self, tag):
+        self.flush()
+
+        for depth in range(len(self.stack) - 1, -1, -1):
+            if self.stack[depth] == tag:
+                self.close_to(depth)
+                return
+
+    """
+    Close the open tags from stack depth @depth on
+    """
+    def close_to (self, depth):
+        while len(self.stack) > depth:
+            tag = self.stack.pop()
+            if tag in NON_TEXT_TAGS:
+                self.non_text_depth -= 1
+            if tag in PRESERVE_WHITESPACE_TAGS:
+                self.preserve_depth -= 1
+
+        while self.open_snippets and self.open_snippets[-1][0] >= depth:
+            self.open_snippets.pop()
+
+        if self.title_depth is not None and self.title_depth >= depth:
+            self.title_depth = None
+            self.title_done = True
+
+        if self.head_depth is not None and self.head_depth >= depth:
+            self.head_depth = None
+            self.head_done = True
+
+    def handle_data (self, data):
+        self.pending.append(data)
+
+    def handle_charref (self, name):
+        self.pending.append(convert_charref(name))
+
+    def handle_entityref (self, name):
+        self.pending.append(convert_entityref(name))
+
+    # Comments, declarations and processing instructions end a string, as in BeautifulSoup
+    def handle_comment (self, data):
+        self.flush()
+
+    def handle_decl (self, decl):
+        self.flush()
+
+    def handle_pi (self, data):
+        self.flush()
+
+    # CDATA sections are text of their own
+    def unknown_decl (self, data):
+        self.flush()
+        if data.upper().startswith("CDATA["):
+            self.pending.append(data[len("CDATA["):])
+            self.flush()
+
+    def close (self):
+        super().close()
+        self.flush()
+        self.close_to(0)
+
+    @property
+    def title (self):
+        return "".join(self.title_parts) if self.title_parts is not None else None
+
+    @property
+    def title_complete (self):
+        return self.title_done or self.head_done
+
+    def get_snippets (self):
+        return ["".join(parts) for parts in self.snippets]
+
+"""
+Title of @html_data, read with the stream parser. Parsing stops once the title (or the head) is complete.
+None when the page has no title within its head
+"""
+def read_stream_title (html_data):
+    parser = StreamExtractor(find_content=False)
+
+    for start in range(0, len(html_data), TITLE_FEED_SIZE):
+        parser.feed(html_data[start:start + TITLE_FEED_SIZE])
+        if parser.title_complete:
+            return parser.title
+
+    parser.close()
+    return parser.title
+
+"""
+Title and text of the matching tags of @html_data, with the stream parser. Returns (title, snippets).
+snippets is None when @tag_def is None
+"""
+def extract_stream (html_data, tag_def=None):
+    if tag_def is None:
+        return read_stream_title(html_data), None
+
+    parser = StreamExtractor(tag_def.get("tag"), tag_def.get("attribs"))
+    parser.feed(html_data)
+    parser.close()
+
+    return parser.title, parser.get_snippets()
+
+"""
+Text of lxml element @element, as BeautifulSoup get_text() gives it
+"""
+def get_lxml_text (element):
+    from lxml import etree
+
+    parts = []
+    non_text_depth = 0
+    preserve_depth = 0
+
+    for event, node in etree.iterwalk(element, events=("start", "end")):
+        # Comments and processing instructions have no tag name. Only their tail is text
+        tag = node.tag if isinstance(node.tag, str) else None
+
+        if event == "start":
+            if tag in NON_TEXT_TAGS:
+                non_text_depth += 1
+            if tag in PRESERVE_WHITESPACE_TAGS:
+                preserve_depth += 1
+            if tag is not None and not non_text_depth and node.text:
+                parts.append(normalize_string(node.text, preserve_depth > 0))
+            continue
+
+        if tag in NON_TEXT_TAGS:
+            non_text_depth -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            preserve_depth -= 1
+        if node is not element and not non_text_depth and node.tail:
+            parts.append(normalize_string(node.tail, preserve_depth > 0))
+
+    return "".join(parts)
+
+"""
+Title and text of the matching tags of @html_data, with lxml. Returns (title, snippets).
+snippets is None when @tag_def is None
+"""
+def extract_lxml (html_data, tag_def=None):
+    from lxml import etree
+    import lxml.html
+
+    try:
+        root = lxml.html.document_fromstring(html_data)
+    except (etree.ParserError, ValueError):
+        # Empty page, or a page lxml cannot take as a string (XML encoding declaration)
+        return None, ([] if tag_def is not None else None)
+
+    head = root.find("head")
+    title = head.find(".//title") if head is not None else None
+    title = get_lxml_text(title) if title is not None else None
+
+    if tag_def is None:
+        return title, None
+
+    find_tag = tag_def.get("tag")
+    attribs = tag_def.get("attribs")
+    snippets = [get_lxml_text(node) for node in root.iter(find_tag if find_tag else etree.Element)
+                if isinstance(node.tag, str) and match_attrs(node.attrib, attribs)]
+
+    return title, snippets
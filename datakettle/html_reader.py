@@ -1,67 +1,95 @@
-import os
-from datakettle.cleantext.textcleaner import TextCleaner
 from datakettle.cleantext.filereader import TextFileReader
-import datakettle.cleantext.utils as utils
-import logging
 from bs4 import BeautifulSoup
+from datakettle.base_reader import BaseReader
+from datakettle.html_extract import EXTRACT_ENGINES, DEF_EXTRACT_ENGINE, extract_lxml, extract_stream, join_snippets
 
-class HTMLReader(object):
-
-    def __init__(self, source_config):
-        self.source_config = source_config
-        self.logger = logging.getLogger(__name__)
-
-        self.def_special_chars = ['MINUS', 'COMMA', 'DQUOTE', 'SQUOTE', 'FSLASH', 'BSLASH', 'HASH', 'AT', 'EXCL',
-                                  'CARAT',
-                                  'AMP', 'PCT', 'DOLLAR', 'TILDA', 'APOS', 'COLN', 'SCOLN', 'QMARK', 'LT', 'GT', 'EQ',
-                                  'PIPE', 'CBRACE',
-                                  'SBRKT', 'BRKT', 'USCORE', 'ASTRSK', 'DOT', 'PLUS']
-
-        self.def_white_space_chars = ["NEWLINE", 'CR', 'FF', 'TAB']
-
+class HTMLReader (BaseReader):
 
     """
     Read web pages from a list of URLs provided in a text file
     """
     def read_url_list(self):
-        tfr = TextFileReader()
-        tc = TextCleaner()
+        return list(self.iter_url_list())
+
+    """
+    Generator version of read_url_list. Yields one {"url", "title", "content"} record per URL
+    """
+    def iter_url_list(self):
         access = self.source_config["access"]
-        url_data_list = []
+        tfr = TextFileReader(connections_per_host=access.get("connections_per_host"), timeout=access.get("timeout"),
+                             retries=access.get("retries"), backoff_factor=access.get("backoff_factor"))
+
+        # Parser used to extract the title and the content within tags. See datakettle.html_extract
+        engine = access.get("extract_engine") or DEF_EXTRACT_ENGINE
+        if engine not in EXTRACT_ENGINES:
+            raise ValueError("Unknown extract_engine: {}. Use one of {}".format(engine, EXTRACT_ENGINES))
 
         # Read the list of URLs from the local text file defined by the config JSON.
         # Each line in the text file is assumed to be a valid URL
         urls_list_file = access["url_list_file"]
         urls_list = tfr.read_file_by_line(urls_list_file)
 
-        for url in urls_list:
-            # Fetch html content
-            html_data = tfr.read_web_page(url.strip())
+        # Fetch html content concurrently. Pages are parsed as they are fetched
+        web_pages = self.iter_web_pages(tfr, [url.strip() for url in urls_list], concurrency=access.get("concurrency"),
+                                        ordered=access.get("ordered", True))
+        web_pages = self.iter_timed("read", web_pages, size=lambda page: len(page[1]) if page[1] else 0)
+
+        for url, html_data, cached_records, etag in web_pages:
+
+            if cached_records is not None:
+                self.logger.info(f"Reading URL: {url}: Not modified")
+                yield from self.tag_records(url, cached_records)
+                continue
 
             if html_data is None:
                 self.logger.info(f"Reading URL: {url}: Error")
-                url_data_list.append({"url": url.strip(), "title": None, "content": None})
+                yield from self.tag_records(url, [{"url": url, "title": None, "content": None}])
                 continue
 
             self.logger.info(f"Reading URL: {url}: {len(html_data)} chars")
 
-            soup = BeautifulSoup(html_data, 'html.parser')
-            html_title = soup.head.title.get_text()
-            tag_data = html_data  # By default, use the entire html string as the target data
+            if self.stats is not None:
+                start = self.stats.start()
+
+            html_title, tag_data = self.extract_html(html_data, access.get("get_content_within_tag"), engine)
 
-            # Filter for a given tag with specific attributes, if specified in the config JSON
-            content_within_tag = access.get("get_content_within_tag")
-            if content_within_tag:
-                tag_data = self.get_html_content_within_tag(soup, content_within_tag)
-            #
-            # TBD: Run other extraction methods, as defined in the config file
-            #
+            if self.stats is not None:
+                self.stats.stop(self.stats_channel, "extract", start, docs=1, bytes_in=len(html_data),
+                                bytes_out=len(tag_data) if tag_data else 0)
 
             clean_data = self.cleanup_data(tag_data) if tag_data else None
             clean_title = self.cleanup_data(html_title) if html_title else None
-            url_data_list.append({"url": url.strip(), "title": clean_title, "content": clean_data})
+            record = {"url": url, "title": clean_title, "content": clean_data}
+            self.cache_web_page(url, [record], etag)
 
-        return url_data_list
+            yield from self.tag_records(url, [record])
+
+    """
+    Title and content of a web page, extracted with @engine. The content is the entire html, or the
+    text within the tags of @tag_def when given. Returns (title, content)
+    """
+    def extract_html(self, html_data, tag_def, engine=DEF_EXTRACT_ENGINE):
+        # By default, use the entire html string as the target data
+        tag_data = html_data
+
+        if engine == "lxml" or engine == "stream":
+            extract = extract_lxml if engine == "lxml" else extract_stream
+            html_title, snippets = extract(html_data, tag_def if tag_def else None)
+
+            if tag_def:
+                tag_data = join_snippets(snippets, tag_def.get("find"))
+            return html_title, tag_data
+
+        soup = BeautifulSoup(html_data, 'html.parser')
+        html_title = soup.head.title.get_text() if soup.head is not None and soup.head.title is not None else None
+
+        # Filter for a given tag with specific attributes, if specified in the config JSON
+        if tag_def:
+            tag_data = self.get_html_content_within_tag(soup, tag_def)
+        #
+        # TBD: Run other extraction methods, as defined in the config file
+        #
+        return html_title, tag_data
 
     def get_html_content_within_tag(self, soup, tag_def):
         find_tag = tag_def.get("tag")
@@ -69,7 +97,7 @@ class HTMLReader(object):
         find_what = tag_def.get("find")
 
         tag_snippets = soup.find_all(find_tag, attrs=attribs)
-        print(f"Number of snipets: {len(tag_snippets)}")
+        self.logger.debug(f"Number of snippets: {len(tag_snippets)}")
 
         # If the filter didn't yield anything, skip this html altogether.
         if not tag_snippets:
@@ -83,45 +111,6 @@ class HTMLReader(object):
             tag_data = tag_snippets[-1].get_text()
         return tag_data
 
-    """
-    Cleanup file data list using the cleaning steps listed within the sources section of the feed config JSON
-    """
-
-    def cleanup_data(self, clean_data):
-        if clean_data is None or len(clean_data) < 1:
-            return ""
-
-        tc = TextCleaner()
-        clean_steps = self.source_config["clean"]
-
-        # Iterate through each step and perform specified cleaning action
-        for cstep in clean_steps:
-            stepname = cstep["step"]
-
-            if stepname == "remove_all_markup":
-                clean_data = tc.remove_all_markup(doc=clean_data, valid_markup=False)
-
-            if stepname == "remove_html_encoded_chars":
-                clean_data = tc.remove_html_encoded_chars(clean_data, replace_char=' ')
-
-            if stepname == "remove_special_chars":
-                if "special_chars" in cstep:
-                    special_chars = cstep["special_chars"]
-                else:
-                    special_chars = self.def_special_chars
-
-                replace_char = cstep["replace_char"] if cstep.get("replace_char") else ''
-                clean_data = tc.remove_special_chars(special_chars, clean_data, replace_char=replace_char)
-
-            if stepname == "remove_white_spaces":
-                if "white_space_chars" in cstep:
-                    white_space_chars = cstep["white_space_chars"]
-                else:
-                    white_space_chars = self.def_white_space_chars
-                clean_data = tc.remove_white_spaces(white_space_chars=white_space_chars, doc=clean_data)
-
-        return clean_data
-
     """
     From the config, understand the file endpoint. It can be local file system or Amazon S3. 
     Call read function as necessary
@@ -139,3 +128,18 @@ class HTMLReader(object):
 
         return url_data_list
 
+    """
+    Generator version of read_html_data. Yields one record per URL
+    """
+    def iter_html_data(self):
+        access = self.source_config["access"]
+
+        if access["endpoint"] == "http":
+            self.logger.info("Streaming web pages for URLs in {}".format(access["url_list_file"]))
+            yield from self.iter_url_list()
+
+    """
+    Records of the channel. Entry point used by DataServer
+    """
+    def iter_data (self):
+        return self.iter_html_data()
@@ -0,0 +1,168 @@
+import os
+import json
+import logging
+import datakettle.cleantext.utils as utils
+
+"""
+Manifests of processed files, for incremental ingestion.
+
+A manifest records, for every file of a channel that was read: path, size, modification time,
+content hash and number of records. It is stored as <manifest_dir>/<channel>.json.
+
+On the next run only new or changed files are read. A file whose size and modification time
+are unchanged is not read at all. When only the modification time changed, the content hash
+decides. A change of the channel config resets the manifest.
+
+Incremental modes:
+    delta   yield the records of new and changed files only
+    merge   yield the records of all files. Records of unchanged files come from the record cache
+            (files missing from the cache are read again)
+"""
+
+MANIFEST_VERSION = 1
+
+INCREMENTAL_MODES = ["delta", "merge"]
+
+class ManifestStore (object):
+    def __init__(self, manifest_dir, mode="delta"):
+        """
+        :param manifest_dir: Directory where channel manifests are stored
+        :param mode: Default incremental mode: "delta" or "merge"
+        """
+        if mode not in INCREMENTAL_MODES:
+            raise ValueError("Unknown incremental mode: {}. Use one of {}".format(mode, INCREMENTAL_MODES))
+
+        self.manifest_dir = manifest_dir
+        self.mode = mode
+        self.logger = logging.getLogger(__name__)
+
+        os.makedirs(self.manifest_dir, exist_ok=True)
+
+    def manifest_path (self, channel):
+        # Keep channel names usable as a file name
+        name = "".join(char if char.isalnum() or char in "-_." else "_" for char in str(channel))
+        return os.path.join(self.manifest_dir, name + ".json")
+
+    """
+    Load the manifest of a channel. A manifest written with a different channel config is discarded
+    """
+    def load (self, channel, config_hash):
+        return Manifest(self.manifest_path(channel), config_hash)
+
+    """
+    Remove the manifest of a channel, or of all channels when @channel is None.
+    The next run reads all files again. Returns the number of removed manifests
+    """
+    def reset (self, channel=None):
+        if channel is not None:
+            paths = [self.manifest_path(channel)]
+        else:
+            paths = [os.path.join(self.manifest_dir, name) for name in os.listdir(self.manifest_dir) if name.endswith(".json")]
+
+        removed = 0
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+
+        return removed
+
+
+class Manifest (object):
+    def __init__(self, path, config_hash):
+        """
+        :param path: Manifest file
+        :param config_hash: Hash of the channel config the records are produced with
+        """
+        self.path = path
+        self.config_hash = config_hash
+        self.logger = logging.getLogger(__name__)
+        self.files = {}
+
+        try:
+            with open(self.path, "r") as fh:
+                saved = json.load(fh)
+
+            if saved.get("version") == MANIFEST_VERSION and saved.get("config_hash") == config_hash:
+                self.files = saved.get("files", {})
+            else:
+                self.logger.info("Channel config changed since {} was written. Reading all files".format(self.path))
+
+        except FileNotFoundError:
+            pass
+        except Exception:
+            self.logger.error("Cannot read manifest {}. Reading all files".format(self.path), exc_info=True)
+
+    """
+    Check whether a file was processed before and did not change since. Returns False for new files
+    """
+    def is_unchanged (self, file_path, stat):
+        """
+        :param file_path: Path of the file
+        :param stat: os.stat() result of the file
+        """
+        entry = self.files.get(os.path.abspath(file_path))
+        if entry is None or entry["size"] != stat.st_size:
+            return False
+
+        if entry["mtime_ns"] == stat.st_mtime_ns:
+            return True
+
+        # Touched but possibly not modified. Compare content
+        try:
+            if utils.file_sha256(file_path) != entry["sha256"]:
+                return False
+        except OSError:
+            return False
+
+        entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def record_count (self, file_path):
+        entry = self.files.get(os.path.abspath(file_path))
+        return entry["records"] if entry else 0
+
+    """
+    Record a file as processed
+    """
+    def update (self, file_path, stat, record_count):
+        """
+        :param file_path: Path of the file
+        :param stat: os.stat() result of the file, taken before it was read
+        :param record_count: Number of records read from the file
+        """
+        try:
+            sha256 = utils.file_sha256(file_path)
+        except OSError:
+            self.logger.error("Cannot hash {}. It will be read again on the next run".format(file_path), exc_info=True)
+            return
+
+        self.files[os.path.abspath(file_path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                                  "sha256": sha256, "records": record_count}
+
+    """
+    Drop files that no longer exist in the source. Returns the number of dropped files
+    """
+    def retain (self, file_paths):
+        keep = set(os.path.abspath(file_path) for file_path in file_paths)
+        dropped = [path for path in self.files if path not in keep]
+
+        for path in dropped:
+            del self.files[path]
+
+        return len(dropped)
+
+    """
+    Write the manifest. The file is replaced atomically
+    """
+    def save (self):
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with open(tmp_path, "w") as fh:
+                json.dump({"version": MANIFEST_VERSION, "config_hash": self.config_hash, "files": self.files}, fh)
+            os.replace(tmp_path, self.path)
+
+        except Exception:
+            self.logger.error("Cannot write manifest {}".format(self.path), exc_info=True)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
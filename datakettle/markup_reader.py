@@ -1,198 +1,174 @@
-import os
 from datakettle.cleantext.textcleaner import TextCleaner
 from datakettle.cleantext.filereader import TextFileReader
-import datakettle.cleantext.utils as utils
-import logging
+from datakettle.base_reader import BaseReader
 
-class MarkupReader (object):
-
-    def __init__(self, source_config):
-        self.source_config = source_config
-        self.logger = logging.getLogger(__name__)
-
-        self.def_special_chars = ['MINUS', 'COMMA', 'DQUOTE', 'SQUOTE', 'FSLASH', 'BSLASH', 'HASH', 'AT', 'EXCL', 'CARAT',
-                          'AMP', 'PCT', 'DOLLAR', 'TILDA', 'APOS', 'COLN', 'SCOLN', 'QMARK', 'LT', 'GT', 'EQ', 'PIPE', 'CBRACE',
-                          'SBRKT','BRKT', 'USCORE', 'ASTRSK', 'DOT', 'PLUS']
-
-        self.def_white_space_chars = ["NEWLINE", 'CR', 'FF', 'TAB']
+class MarkupReader (BaseReader):
 
     """
     Read local markup files from configured directory path
     """
     def read_local_files (self):
+        return self.collect_records(self.iter_local_files())
+
+    """
+    Read a single markup file. Yields one {"content", "label"} record per markup document
+    """
+    def iter_file_records (self, file):
         tfr = TextFileReader ()
         tc = TextCleaner ()
         access = self.source_config["access"]
 
-        file_filter = ""
-        if access["file_filter"] :
-            file_filter = access["file_filter"]
+        # Stream the file in chunks and extract the text of each markup doc on the fly,
+        # so that only one document is held in memory at a time
+        if "document_element" in access:
+            file_chunks = tfr.iter_file_chunks(file, chunk_size=self.read_chunk_size)
+            file_chunks = self.iter_timed("read", file_chunks, file=file)
+            yield from self.iter_markup_chunks(file_chunks, tc)
+        else:
+            markup_docs = [self.read_whole_file(tfr, file)]
+            yield from self.iter_markup_docs(markup_docs, tc)
 
-        # Read file names from given path
-        files_list = utils.get_files_in_path(access["path"], file_filter)
-
-        # Which data element is to be read from the JSON object for text data
-        data_element = access["data_element"]
-
-        file_data_list = []
-        label_value_list = []
-        for file in files_list:
-
-            # read file content and convert json string to dictionary
-            file_data = tfr.read_file (file)
+    """
+    Read web pages from a list of URLs provided in a text file
+    """
+    def read_url_list(self):
+        return self.collect_records(self.iter_url_list())
 
-            # Marked up data that is read from the file may contain one or more markup blocks
-            # Split them into a list of markup docs
+    """
+    Generator version of read_url_list. Yields one {"content", "label"} record at a time
+    """
+    def iter_url_list(self):
+        access = self.source_config["access"]
+        tfr = TextFileReader (connections_per_host=access.get("connections_per_host"), timeout=access.get("timeout"),
+                              retries=access.get("retries"), backoff_factor=access.get("backoff_factor"))
+        tc = TextCleaner ()
 
-            if "document_element" in access:
-                separator_markup = access["document_element"]
-                markup_docs = tc.split_multi_content_by_end_tag(file_data, separator_markup=separator_markup)
-            else:
-                markup_docs = [file_data]
+        # Read the list of URLs from the local text file defined by the config JSON.
+        # Each line in the text file is assumed to be a valid URL
+        urls_list_file = access["url_list_file"]
+        urls_list = tfr.read_file_by_line(urls_list_file)
 
-            data_element = access["data_element"]
+        # Fetch web pages concurrently. Pages are processed as they are fetched
+        web_pages = self.iter_web_pages(tfr, urls_list, concurrency=access.get("concurrency"), ordered=access.get("ordered", True))
+        web_pages = self.iter_timed("read", web_pages, size=lambda page: len(page[1]) if page[1] else 0)
 
-            # If a label is provided globally, read it from config.
-            # Label will be the class/prediction used for training purposes.
-            global_label_value = None
-            if "label_value_override" in access:
-                global_label_value = access["label_value_override"]
+        try:
+            for url, http_data, cached_records, etag in web_pages:
 
-            self.logger.info("Found {} markup documents ".format(len(markup_docs)))
+                if cached_records is not None:
+                    self.logger.info(f"Reading URL: {url}: Not modified")
+                    yield from self.tag_records(url, cached_records)
+                    continue
 
-            # Iterate through each markup document
-            for markupdoc in markup_docs:
+                if http_data is None:
+                    self.logger.info(f"Reading URL: {url}: Error")
+                    continue
 
-                tagtext = tc.get_text_within_tags(markupdoc, container_tag=data_element)
+                read_status = f"{len(http_data)} chars"
+                self.logger.info(f"Reading URL: {url}: {read_status}")
 
-                if isinstance(tagtext, list):
-                    text_data = " ".join(tagtext)
+                if self.record_cache is not None:
+                    records = list(self.iter_markup_records(http_data, tc))
+                    self.cache_web_page(url, records, etag)
+                    yield from self.tag_records(url, records)
                 else:
-                    text_data = tagtext
-
-                clean_data = self.cleanup_data(text_data)
-
-                if clean_data is not None and len(clean_data.strip()) > 0:
-                    file_data_list.append(clean_data)
-
-                    # if a label is provided globally, append it to labels list for each document
-                    if global_label_value is not None:
-                        label_value_list.append(global_label_value)
-
-        return file_data_list, label_value_list
-
-    """
-    Read markup files from an S3 path
-    """
-    def read_s3_files (self, config):
-        self.logger.error ("S3 file reader: Not yet implemented")
-        return [], []
+                    yield from self.tag_records(url, self.iter_markup_records(http_data, tc))
+        finally:
+            self.close_pool()
 
     """
-    Read web pages from a list of URLs provided in a text file
+    Split marked up data (a file or a web page) into markup documents, extract the text within
+    data_element and clean it up. Yields a {"content", "label"} record for each non empty document
     """
-    def read_url_list(self):
-        tfr = TextFileReader ()
-        tc = TextCleaner ()
+    def iter_markup_records (self, markup_data, tc):
         access = self.source_config["access"]
 
-        file_data_list = []
-        label_value_list = []
-
-        # Read the list of URLs from the local text file defined by the config JSON.
-        # Each line in the text file is assumed to be a valid URL
-        urls_list_file = access["url_list_file"]
-        urls_list = tfr.read_file_by_line(urls_list_file)
+        # Marked up data that is read from the file may contain one or more markup blocks
+        # Split them into a list of markup docs
 
-        for url in urls_list:
-            http_data = tfr.read_web_page(url)
+        if "document_element" in access:
+            yield from self.iter_markup_chunks([markup_data], tc)
+        else:
+            yield from self.iter_markup_docs([markup_data], tc)
 
-            if http_data is None:
-                self.logger.info(f"Reading URL: {url}: Error")
-                continue
-
-            read_status = f"{len(http_data)} chars"
-            self.logger.info(f"Reading URL: {url}: {read_status}")
-
-            # Marked up data that is read from the file may contain one or more markup blocks
-            # Split them into a list of markup docs
+    """
+    Split marked up data, given as an iterable of text chunks, into markup documents and extract the text within
+    data_element, in a single pass. "preserve_case": true in the access section keeps the case of the text.
+    Yields a {"content", "label"} record for each non empty document
+    """
+    def iter_markup_chunks (self, chunks, tc):
+        access = self.source_config["access"]
 
-            if "document_element" in access:
-                separator_markup = access["document_element"]
-                markup_docs = tc.split_multi_content_by_end_tag(http_data, separator_markup=separator_markup)
-            else:
-                markup_docs = [http_data]
+        texts = tc.iter_text_within_tags_by_end_tag(chunks, separator_markup=access["document_element"],
+                                                    container_tag=access["data_element"],
+                                                    preserve_case=access.get("preserve_case", False))
+        texts = self.iter_timed("extract", texts)
 
-            data_element = access["data_element"]
+        yield from self.iter_clean_texts(texts)
 
-            # If a label is provided globally, read it from config.
-            # Label will be the class/prediction used for training purposes.
-            global_label_value = None
-            if "label_value_override" in access:
-                global_label_value = access["label_value_override"]
+    """
+    Extract the text within data_element from each markup document and clean it up.
+    @markup_docs can be a list or a generator. Yields a {"content", "label"} record for each non empty document
+    """
+    def iter_markup_docs (self, markup_docs, tc):
+        access = self.source_config["access"]
 
-            self.logger.info("Found {} markup documents ".format(len(markup_docs)))
+        # Which data element is to be read from the markup document for text data
+        data_element = access["data_element"]
 
-            # Iterate through each markup document
+        # Extract text from each markup document
+        def iter_texts():
             for markupdoc in markup_docs:
 
-                tagtext = tc.get_text_within_tags(markupdoc, container_tag=data_element)
+                tagtext = self.timed_call("extract", tc.get_text_within_tags, markupdoc, container_tag=data_element)
 
                 if isinstance(tagtext, list):
                     text_data = " ".join(tagtext)
                 else:
                     text_data = tagtext
 
-                clean_data = self.cleanup_data(text_data)
-
-                if clean_data is not None and len(clean_data.strip()) > 0:
-                    file_data_list.append(clean_data)
+                yield text_data
 
-                    # if a label is provided globally, append it to labels list for each document
-                    if global_label_value is not None:
-                        label_value_list.append(global_label_value)
-
-        return file_data_list, label_value_list
+        yield from self.iter_clean_texts(iter_texts())
 
     """
-    Cleanup file data list using the cleaning steps listed within the sources section of the feed config JSON
+    Clean the text of each markup document. Yields a {"content", "label"} record for each non empty document
     """
-    def cleanup_data (self, clean_data):
-        if clean_data is None or len(clean_data) < 1:
-            return ""
-
-        tc = TextCleaner()
-        clean_steps = self.source_config["clean"]
-
-        # Iterate through each step and perform specified cleaning action
-        for cstep in clean_steps:
+    def iter_clean_texts (self, texts):
+        access = self.source_config["access"]
 
-            stepname = cstep["step"]
+        # If a label is provided globally, read it from config.
+        # Label will be the class/prediction used for training purposes.
+        global_label_value = None
+        if "label_value_override" in access:
+            global_label_value = access["label_value_override"]
 
-            #self.logger.info("Processing: {}".format(stepname))
+        # Iterate through each cleaned document
+        doc_count = 0
+        for clean_data in self.clean_documents(texts):
+            doc_count += 1
 
-            if stepname == "remove_all_markup":
-                clean_data = tc.remove_all_markup (doc=clean_data, valid_markup=False)
+            if clean_data is not None and len(clean_data.strip()) > 0:
+                yield {"content": clean_data, "label": global_label_value}
 
-            if stepname == "remove_html_encoded_chars":
-                clean_data = tc.remove_html_encoded_chars(clean_data, replace_char=' ')
+        self.logger.info("Found {} markup documents ".format(doc_count))
 
-            if stepname == "remove_special_chars":
-                if "special_chars" in cstep:
-                    special_chars = cstep["special_chars"]
-                else:
-                    special_chars = self.def_special_chars
-                clean_data = tc.remove_special_chars (special_chars, clean_data)
+    """
+    Convert records into the list of documents and the list of labels returned by the read_* methods.
+    Labels are listed only when a label is provided globally
+    """
+    def collect_records (self, records):
+        file_data_list = []
+        label_value_list = []
 
-            if stepname == "remove_white_spaces":
-                if "white_space_chars" in cstep:
-                    white_space_chars = cstep["white_space_chars"]
-                else:
-                    white_space_chars = self.def_white_space_chars
+        for record in records:
+            file_data_list.append(record["content"])
 
-                clean_data = tc.remove_white_spaces(white_space_chars=white_space_chars, doc=clean_data)
+            # if a label is provided globally, append it to labels list for each document
+            if record["label"] is not None:
+                label_value_list.append(record["label"])
 
-        return clean_data
+        return file_data_list, label_value_list
 
     """
     From the config, understand the file endpoint. It can be local file system or Amazon S3. 
@@ -220,3 +196,29 @@ class MarkupReader (object):
 
         return data_list, label_list
 
+    """
+    Generator version of read_markup_data. Yields one {"content", "label"} record at a time
+    """
+    def iter_markup_data (self):
+
+        access = self.source_config["access"]
+
+        if (access["endpoint"] == "file") and (access["filesystem"] == "local"):
+            self.logger.info ("Streaming local markup files from {}".format(access["path"]))
+            yield from self.iter_local_files ()
+
+        if (access["endpoint"] == "file") and (access["filesystem"] == "s3"):
+            self.logger.info("Streaming s3 markup files from {}".format(access["path"]))
+            data_list, label_list = self.read_s3_files (access)
+            for data, label in zip(data_list, label_list):
+                yield {"content": data, "label": label}
+
+        if access["endpoint"] == "http":
+            self.logger.info("Streaming web pages for URLs in {}".format(access["url_list_file"]))
+            yield from self.iter_url_list ()
+
+    """
+    Records of the channel. Entry point used by DataServer
+    """
+    def iter_data (self):
+        return self.iter_markup_data()
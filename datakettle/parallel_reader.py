@@ -0,0 +1,404 @@
+import os
+import copy
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import datakettle.cleantext.utils as utils
+from datakettle.cleantext.utils import resolve_parallelism
+from datakettle.record_cache import channel_config_hash
+from datakettle.stats import PipelineStats
+
+"""
+Process pool support shared by the file readers.
+
+Cleaning is CPU bound regex work, so readers can spread it over a pool of worker processes.
+A channel with several files is distributed file by file. A channel with a single (large) file
+is distributed in chunks of documents. Results are always returned in input order.
+
+The reader, including its compiled cleaning plan, is shipped to every worker once, by the pool
+initializer. Tasks only carry a file name or a chunk of documents.
+
+When a record cache is set, records of files that did not change since the last run are
+read from the cache instead. With a manifest store, the channel is read incrementally:
+only new and changed files are read. See datakettle.manifest
+
+With a PipelineStats, time and sizes of each step are recorded per channel. Workers collect
+their own counters, which travel back with each result. See datakettle.stats
+
+With record_source set, each record gets the channel name and its source file or URL, as
+"channel" and "source" keys. Records are tagged as they are yielded, never in the cache
+"""
+
+# Default number of documents sent to a worker in one task
+DEFAULT_CHUNK_SIZE = 256
+
+# Reader installed in each worker process by the pool initializer
+worker_reader = None
+
+def init_worker (reader):
+    global worker_reader
+    worker_reader = reader
+
+def run_in_worker (method_name, args):
+    result = getattr(worker_reader, method_name)(*args)
+
+    # Counters collected while running the task
+    counters = worker_reader.stats.pop_counters() if worker_reader.stats is not None else None
+    return result, counters
+
+class ParallelReader (object):
+
+    """
+    Read the parallelism settings. A "parallelism" value in the access section of the channel
+    takes precedence over the value passed by the DataServer
+    """
+    def init_parallelism (self, parallelism=None):
+        access = self.source_config["access"]
+
+        channel_parallelism = access.get("parallelism")
+        if channel_parallelism is None or channel_parallelism == "":
+            channel_parallelism = parallelism
+
+        self.parallelism = resolve_parallelism(channel_parallelism)
+        self.chunk_size = int(utils.if_null(access.get("chunk_size"), DEFAULT_CHUNK_SIZE))
+        self.read_chunk_size = access.get("read_chunk_size")
+        self.pool = None
+
+    """
+    Use @record_cache (a RecordCache) to skip files that were already read with the same config.
+    A channel can opt out with "cache": false in its access section.
+    "cache_key": "content" keys files by content hash instead of size and modification time
+    """
+    def init_record_cache (self, record_cache=None):
+        access = self.source_config["access"]
+
+        self.record_cache = record_cache if access.get("cache", True) else None
+        self.cache_channel = self.source_config.get("channel")
+        self.cache_use_content = access.get("cache_key") == "content"
+        self.cache_config_hash = self.record_cache.config_hash(self.source_config) if self.record_cache else None
+
+    """
+    Use @manifest_store (a ManifestStore) to read only files that are new or changed since the last run.
+    "incremental" in the access section of the channel selects the mode ("delta" or "merge")
+    or turns incremental reading off (false)
+    """
+    def init_manifest (self, manifest_store=None):
+        access = self.source_config["access"]
+        mode = access.get("incremental")
+
+        self.manifest = None
+        self.incremental_mode = None
+
+        if manifest_store is None or mode is False:
+            return
+
+        self.incremental_mode = mode if mode else manifest_store.mode
+        if self.incremental_mode not in ("delta", "merge"):
+            raise ValueError("Unknown incremental mode: {}".format(self.incremental_mode))
+
+        self.manifest = manifest_store.load(self.source_config.get("channel"), channel_config_hash(self.source_config))
+
+        if self.incremental_mode == "merge" and self.record_cache is None:
+            self.logger.warning("Incremental merge without a record cache. Unchanged files will be read again")
+
+    """
+    Record time and sizes of each step in @stats (a PipelineStats). None turns instrumentation off
+    """
+    def init_stats (self, stats=None):
+        self.stats = stats
+        self.stats_channel = self.source_config.get("channel")
+
+        self.cleaning_plan.stats = stats
+        self.cleaning_plan.stats_channel = self.stats_channel
+
+    """
+    Add "channel" and "source" keys to the records yielded by the reader when @record_source is True
+    """
+    def init_record_source (self, record_source=False):
+        self.record_source = record_source
+
+    """
+    Records of @source, with "channel" and "source" keys when record_source is set.
+    Records are copied, so that cached records are left as they are
+    """
+    def tag_records (self, source, records):
+        if not self.record_source:
+            return records
+
+        channel = self.source_config.get("channel")
+        return ({**record, "channel": channel, "source": source} for record in records)
+
+    """
+    Yield the items of @iterable, recording the time spent producing each of them as a call of @step.
+    The size of @file, when given, is recorded as input size. See PipelineStats.iter_timed
+    """
+    def iter_timed (self, step, iterable, count=None, size=None, file=None):
+        if self.stats is None:
+            return iterable
+
+        bytes_in = os.path.getsize(file) if file is not None else 0
+        return self.stats.iter_timed(self.stats_channel, step, iterable, count=count, size=size, bytes_in=bytes_in)
+
+    """
+    Call @function, recording the call as @step
+    """
+    def timed_call (self, step, function, *args, **kwargs):
+        if self.stats is None:
+            return function(*args, **kwargs)
+
+        return self.stats.timed_call(self.stats_channel, step, function, *args, **kwargs)
+
+    """
+    Read a whole file with tfr.read_file, recording it as a read
+    """
+    def read_whole_file (self, tfr, file):
+        if self.stats is None:
+            return tfr.read_file(file)
+
+        start = self.stats.start()
+        file_data = tfr.read_file(file)
+        self.stats.stop(self.stats_channel, "read", start, docs=1, bytes_in=os.path.getsize(file),
+                        bytes_out=len(file_data) if file_data else 0)
+        return file_data
+
+    """
+    Create the process pool on first use
+    """
+    def get_pool (self):
+        if self.pool is None:
+            self.logger.info("Starting {} worker processes".format(self.parallelism))
+            self.pool = ProcessPoolExecutor(max_workers=self.parallelism, initializer=init_worker,
+                                            initargs=(self.serial_copy(),))
+        return self.pool
+
+    def close_pool (self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    """
+    Copy of the reader that runs everything in the current process. This is what workers get
+    """
+    def serial_copy (self):
+        reader = copy.copy(self)
+        reader.parallelism = 1
+        reader.pool = None
+        reader.record_cache = None
+        reader.manifest = None
+
+        # Workers count into their own stats, and need their own cleaning plan to point at them
+        if self.stats is not None:
+            reader.cleaning_plan = copy.copy(self.cleaning_plan)
+            reader.init_stats(PipelineStats(log_reports=False))
+
+        return reader
+
+    """
+    Run reader method @method_name in the worker processes, once for each tuple of arguments.
+    Results are yielded in order. At most two tasks per worker are pending at a time, so that
+    input is consumed and results are produced lazily
+    """
+    def pool_map (self, method_name, args_iter):
+        pool = self.get_pool()
+        pending = deque()
+
+        for args in args_iter:
+            pending.append(pool.submit(run_in_worker, method_name, args))
+
+            if len(pending) >= 2 * self.parallelism:
+                yield self.worker_result(pending.popleft())
+
+        while pending:
+            yield self.worker_result(pending.popleft())
+
+    def worker_result (self, future):
+        result, counters = future.result()
+        if counters:
+            self.stats.merge(counters)
+        return result
+
+    """
+    Clean a list (or any iterable) of documents. Yields the cleaned documents in order.
+    Documents are consumed lazily, a few chunks ahead of the cleaned output
+    """
+    def clean_documents (self, docs):
+        if self.parallelism <= 1:
+            for doc in docs:
+                yield self.cleanup_data(doc)
+            return
+
+        chunks = utils.iter_batches(docs, self.chunk_size)
+
+        # A single chunk is not worth a round trip to a worker
+        first = next(chunks, None)
+        second = next(chunks, None)
+        if second is None:
+            for doc in (first or []):
+                yield self.cleanup_data(doc)
+            return
+
+        chunks = itertools.chain([first, second], chunks)
+        for clean_docs in self.pool_map("clean_chunk", ((chunk,) for chunk in chunks)):
+            yield from clean_docs
+
+    def clean_chunk (self, docs):
+        return [self.cleanup_data(doc) for doc in docs]
+
+    """
+    Yield the records of each file in order. Files are spread over worker processes when
+    parallelism is enabled and there is more than one file.
+    @file_stats ({path: os.stat_result}, optional) saves stat'ing files again for the cache and the manifest
+    """
+    def iter_files (self, files_list, file_stats=None):
+        if self.manifest is not None:
+            yield from self.iter_incremental_files(files_list, file_stats)
+            return
+
+        if self.record_cache is not None:
+            yield from self.iter_cached_files(files_list, file_stats)
+            return
+
+        if self.parallelism <= 1 or len(files_list) < 2:
+            for file in files_list:
+                yield from self.tag_records(file, self.iter_file_records(file))
+            return
+
+        results = self.pool_map("read_file_records", ((file,) for file in files_list))
+        for file, records in zip(files_list, results):
+            yield from self.tag_records(file, records)
+
+    """
+    Same as iter_files, reading records of unchanged files from the record cache.
+    Only files missing from the cache are read (in parallel when enabled) and then stored
+    """
+    def iter_cached_files (self, files_list, file_stats=None):
+        cache = self.record_cache
+        file_stats = file_stats if file_stats is not None else {}
+
+        lookups = []
+        for file in files_list:
+            key = cache.file_key(self.cache_config_hash, file, use_content=self.cache_use_content,
+                                 stat=file_stats.get(file))
+            cached = key is not None and cache.contains(self.cache_channel, key)
+            lookups.append((file, key, cached))
+
+        self.logger.info("Record cache: {} of {} files cached".format(sum(1 for lookup in lookups if lookup[2]), len(lookups)))
+
+        results = self.read_files_records([file for file, key, cached in lookups if not cached])
+
+        for file, key, cached in lookups:
+            if cached:
+                entry = cache.get(self.cache_channel, key)
+                if entry is not None:
+                    yield from self.tag_records(file, entry["records"])
+                    continue
+
+                # Entry was evicted meanwhile
+                records = self.read_file_records(file)
+            else:
+                records = next(results)
+
+            if key is not None:
+                cache.put(self.cache_channel, key, records)
+
+            yield from self.tag_records(file, records)
+
+    """
+    Read files incrementally using the channel manifest. Files are stat'ed first; only new and
+    changed files are read. Unchanged files are skipped ("delta") or their records are taken
+    from the record cache ("merge"). A file is recorded in the manifest once all its records
+    have been yielded, and the manifest is saved when iteration ends, even if it ends early
+    """
+    def iter_incremental_files (self, files_list, file_stats=None):
+        manifest = self.manifest
+        file_stats = file_stats if file_stats is not None else {}
+
+        plan = []
+        for file in files_list:
+            try:
+                stat = file_stats.get(file) or os.stat(file)
+            except OSError:
+                self.logger.error("Cannot access {}".format(file), exc_info=True)
+                continue
+            plan.append((file, stat, manifest.is_unchanged(file, stat)))
+
+        dropped = manifest.retain([file for file, stat, unchanged in plan])
+        changed = [file for file, stat, unchanged in plan if not unchanged]
+        self.logger.info("Incremental {}: {} new or changed, {} unchanged, {} removed files".format(
+            self.incremental_mode, len(changed), len(plan) - len(changed), dropped))
+
+        results = self.read_files_records(changed)
+
+        try:
+            for file, stat, unchanged in plan:
+                if unchanged:
+                    if self.incremental_mode == "merge":
+                        yield from self.tag_records(file, self.get_file_records(file))
+                    continue
+
+                records = next(results)
+                if self.record_cache is not None:
+                    key = self.record_cache.file_key(self.cache_config_hash, file, use_content=self.cache_use_content,
+                                                     stat=stat)
+                    if key is not None:
+                        self.record_cache.put(self.cache_channel, key, records)
+
+                yield from self.tag_records(file, records)
+                manifest.update(file, stat, len(records))
+        finally:
+            manifest.save()
+
+    """
+    Records of a file, from the record cache when available
+    """
+    def get_file_records (self, file):
+        if self.record_cache is not None:
+            key = self.record_cache.file_key(self.cache_config_hash, file, use_content=self.cache_use_content)
+            entry = self.record_cache.get(self.cache_channel, key) if key is not None else None
+            if entry is not None:
+                return entry["records"]
+
+            records = self.read_file_records(file)
+            if key is not None:
+                self.record_cache.put(self.cache_channel, key, records)
+            return records
+
+        return self.read_file_records(file)
+
+    """
+    Read the records of each file. Yields a list of records per file, in order
+    """
+    def read_files_records (self, files_list):
+        if self.parallelism <= 1 or len(files_list) < 2:
+            return (self.read_file_records(file) for file in files_list)
+
+        return self.pool_map("read_file_records", ((file,) for file in files_list))
+
+    def read_file_records (self, file):
+        return list(self.iter_file_records(file))
+
+    """
+    Fetch web pages with tfr.read_web_pages. Yields (url, page content, cached records, etag).
+    With a record cache, a page that was not modified since the last run (same ETag) comes
+    with its cached records and no content
+    """
+    def iter_web_pages (self, tfr, urls, concurrency=None, ordered=True):
+        if self.record_cache is None:
+            for url, page_data in tfr.read_web_pages(urls, concurrency=concurrency, ordered=ordered):
+                yield url, page_data, None, None
+            return
+
+        def read_cached_page(url):
+            key = self.record_cache.url_key(self.cache_config_hash, url)
+            return self.record_cache.read_web_page(tfr, self.cache_channel, key, url)
+
+        for url, (entry, page_data, etag) in tfr.read_web_pages(urls, concurrency=concurrency, ordered=ordered, read_fn=read_cached_page):
+            yield url, page_data, (entry["records"] if entry else None), etag
+
+    """
+    Store the records of a web page in the record cache. Pages without an ETag cannot be revalidated and are not cached
+    """
+    def cache_web_page (self, url, records, etag):
+        if self.record_cache is not None and etag:
+            key = self.record_cache.url_key(self.cache_config_hash, url)
+            self.record_cache.put(self.cache_channel, key, records, etag=etag)
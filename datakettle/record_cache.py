@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import pickle
+import hashlib
+import logging
+import argparse
+import datakettle.cleantext.utils as utils
+
+"""
+On-disk cache of cleaned records.
+
+Each entry holds the cleaned records of one source (a local file or a web page) and is stored as
+<cache_dir>/<channel>/<key>.pkl. The key is a hash of:
+    - the channel config (access and clean sections), so that a config change invalidates the channel
+    - the source: file path, size and modification time (or the file content, when "cache_key" is "content"),
+      or the URL. Web pages are revalidated with their ETag on every run.
+
+The cache is bounded in size. When it grows beyond max_size bytes, least recently used entries are removed.
+
+Remove entries explicitly with:
+    python -m datakettle.record_cache --cache-dir <dir> invalidate [--channel <channel>]
+"""
+
+# Bump when the layout of cached records changes
+CACHE_VERSION = 1
+
+# Default maximum cache size: 1 GB
+DEF_CACHE_MAX_SIZE = 1024 * 1024 * 1024
+
+# Access settings that only affect how a channel is read, not what is read. Excluded from config hash
+EXECUTION_SETTINGS = ["parallelism", "chunk_size", "concurrency", "connections_per_host", "timeout", "retries",
+                      "backoff_factor", "ordered", "cache", "cache_key", "incremental",
+                      "read_chunk_size", "csv_chunk_size", "dedup",
+                      "file_order", "scan_workers"]
+
+ENTRY_SUFFIX = ".pkl"
+
+"""
+Hash of the parts of the channel config that determine the cleaned records
+"""
+def channel_config_hash (source_config):
+    access = {name: value for name, value in source_config.get("access", {}).items() if name not in EXECUTION_SETTINGS}
+    config = {"version": CACHE_VERSION, "access": access, "clean": source_config.get("clean")}
+
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class RecordCache (object):
+    def __init__(self, cache_dir, max_size=None):
+        """
+        :param cache_dir: Directory where cache entries are stored
+        :param max_size: Maximum size of the cache in bytes. Default 1 GB
+        """
+        self.cache_dir = cache_dir
+        self.max_size = int(max_size) if max_size else DEF_CACHE_MAX_SIZE
+        self.logger = logging.getLogger(__name__)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.total_size = sum(size for path, mtime, size in self.list_entries())
+
+    """
+    Hash of the parts of the channel config that determine the cleaned records
+    """
+    def config_hash (self, source_config):
+        return channel_config_hash(source_config)
+
+    """
+    Cache key of a local file. Returns None when the file cannot be accessed
+    """
+    def file_key (self, config_hash, file_path, use_content=False, stat=None):
+        """
+        :param config_hash: Hash of the channel config. See config_hash()
+        :param file_path: Path of the source file
+        :param use_content: Hash the file content instead of using size and modification time
+        :param stat: os.stat() result of the file, when already known
+        """
+        hasher = hashlib.sha256(config_hash.encode("utf-8"))
+
+        try:
+            if use_content:
+                hasher.update(utils.file_sha256(file_path).encode("utf-8"))
+            else:
+                stat = stat if stat is not None else os.stat(file_path)
+                hasher.update("{}|{}|{}".format(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns).encode("utf-8"))
+
+        except OSError:
+            self.logger.error("Cannot compute cache key of {}".format(file_path), exc_info=True)
+            return None
+
+        return hasher.hexdigest()
+
+    """
+    Cache key of a web page. The page itself is revalidated using its ETag
+    """
+    def url_key (self, config_hash, url):
+        return hashlib.sha256("{}|{}".format(config_hash, url).encode("utf-8")).hexdigest()
+
+    def entry_path (self, channel, key):
+        return os.path.join(self.cache_dir, self.channel_dir(channel), key + ENTRY_SUFFIX)
+
+    def channel_dir (self, channel):
+        # Keep channel names usable as a directory name
+        return "".join(char if char.isalnum() or char in "-_." else "_" for char in str(channel))
+
+    def contains (self, channel, key):
+        return os.path.exists(self.entry_path(channel, key))
+
+    """
+    Get a cache entry: {"records": [...], "etag": ...}. Returns None when not cached
+    """
+    def get (self, channel, key):
+        path = self.entry_path(channel, key)
+
+        try:
+            with open(path, "rb") as fh:
+                entry = pickle.load(fh)
+
+            # Mark entry as recently used
+            os.utime(path)
+
+        except FileNotFoundError:
+            return None
+        except Exception:
+            self.logger.error("Cannot read cache entry {}".format(path), exc_info=True)
+            return None
+
+        return entry
+
+    """
+    Store the cleaned records of a source
+    """
+    def put (self, channel, key, records, etag=None):
+        path = self.entry_path(channel, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first, so that readers never see a partial entry
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as fh:
+                pickle.dump({"records": records, "etag": etag}, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.total_size += os.path.getsize(path) - old_size
+
+        except Exception:
+            self.logger.error("Cannot write cache entry {}".format(path), exc_info=True)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        if self.total_size > self.max_size:
+            self.evict()
+
+    """
+    List cache entries as (path, modification time, size) tuples
+    """
+    def list_entries (self, channel=None):
+        entries = []
+        channel_dirs = [self.channel_dir(channel)] if channel is not None else os.listdir(self.cache_dir)
+
+        for cdir in channel_dirs:
+            cpath = os.path.join(self.cache_dir, cdir)
+            if not os.path.isdir(cpath):
+                continue
+
+            for entry in os.scandir(cpath):
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_mtime, stat.st_size))
+
+        return entries
+
+    """
+    Remove least recently used entries until the cache fits within max_size
+    """
+    def evict (self):
+        entries = sorted(self.list_entries(), key=lambda entry: entry[1])
+        self.total_size = sum(size for path, mtime, size in entries)
+
+        removed = 0
+        for path, mtime, size in entries:
+            if self.total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                self.total_size -= size
+                removed += 1
+            except OSError:
+                pass
+
+        self.logger.info("Evicted {} cache entries. Cache size: {} bytes".format(removed, self.total_size))
+
+    """
+    Remove all entries of a channel, or the whole cache when @channel is None.
+    Returns the number of removed entries
+    """
+    def invalidate (self, channel=None):
+        removed = 0
+        for path, mtime, size in self.list_entries(channel=channel):
+            try:
+                os.remove(path)
+                self.total_size -= size
+                removed += 1
+            except OSError:
+                pass
+
+        self.logger.info("Invalidated {} cache entries".format(removed))
+        return removed
+
+    """
+    Fetch a web page, reusing the cached entry when the server reports it as not modified (ETag).
+    Returns (cache entry, page content, etag). The entry is None unless the cached records are still valid
+    """
+    def read_web_page (self, tfr, channel, key, url):
+        entry = self.get(channel, key)
+        etag = entry.get("etag") if entry else None
+
+        status, page_data, new_etag = tfr.fetch_web_page(url, etag=etag)
+
+        if status == 304:
+            return entry, None, etag
+
+        return None, page_data, new_etag
+
+
+def main (argv=None):
+    parser = argparse.ArgumentParser(prog="python -m datakettle.record_cache", description="Manage the cleaned records cache")
+    parser.add_argument("--cache-dir", required=True, help="Cache directory")
+
+    commands = parser.add_subparsers(dest="command", required=True)
+    invalidate = commands.add_parser("invalidate", help="Remove cached records")
+    invalidate.add_argument("--channel", default=None, help="Remove only the entries of this channel")
+    commands.add_parser("info", help="Show number of entries and size of the cache")
+
+    args = parser.parse_args(argv)
+    cache = RecordCache(args.cache_dir)
+
+    if args.command == "invalidate":
+        print("Removed {} entries".format(cache.invalidate(channel=args.channel)))
+
+    if args.command == "info":
+        entries = cache.list_entries()
+        print("{} entries, {} bytes".format(len(entries), sum(size for path, mtime, size in entries)))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,22 +2,196 @@ import os
 import sys
 import json
 import logging
-from .json_reader import JsonReader
-from .markup_reader import MarkupReader
-from .text_reader import TextReader
-from .csv_reader import CSVReader
-from .html_reader import HTMLReader
+from .channel_scheduler import ChannelScheduler, read_channel
+from .record_cache import RecordCache
+from .manifest import ManifestStore
+from .stats import PipelineStats
+from .sink import RecordSink
+import datakettle.cleantext.utils as utils
 
 class DataServer (object):
-    def __init__(self, config):
+    def __init__(self, config, parallelism=None, cache_dir=None, cache_max_size=None, manifest_dir=None, incremental=None,
+                 stats=None, channel_concurrency=None, process_workers=None, ordered=None, dedup=None, dedup_dir=None):
+        """
+        :param config: Feed config (parsed feedconfig.json)
+        :param parallelism: Number of worker processes used by file readers to read and clean data.
+                            0 or "auto" uses all CPU cores. A "parallelism" value within a channel takes precedence
+        :param cache_dir: Directory of the cleaned records cache. Overrides "path" of the "cache" section in the config.
+                          When neither is set, records are not cached
+        :param cache_max_size: Maximum size of the cache in bytes. Overrides "max_size_mb" of the "cache" section
+        :param manifest_dir: Directory of the manifests of processed files. Overrides "path" of the "incremental" section
+                             in the config. When set, file channels are read incrementally
+        :param incremental: Incremental mode: "delta" returns records of new and changed files only,
+                            "merge" adds the records of unchanged files from the record cache.
+                            Overrides "mode" of the "incremental" section. Default "delta"
+        :param stats: PipelineStats recording time and sizes of each step per channel, or True to create one.
+                      A "stats" section in the config turns it on as well. Default: off
+        :param channel_concurrency: Number of channels read at the same time. 0 or "auto": one per CPU core.
+                                    Overrides "channel_concurrency" of the "scheduler" section. Default 1, one channel after another
+        :param process_workers: Number of worker processes for CPU bound channels, when channels are read concurrently.
+                                Overrides "process_workers" of the "scheduler" section
+        :param ordered: When channels are read concurrently, True returns records in channel order, False as soon
+                        as they are read. Overrides "ordered" of the "scheduler" section. Default True
+        :param dedup: True removes duplicate and near duplicate records, False keeps them. A dict overrides settings
+                      of the "dedup" section in the config. Default: on when the config has a "dedup" section
+        :param dedup_dir: Directory of the persistent dedup indexes. Overrides "path" of the "dedup" section
+        """
         self.config = config
+        self.parallelism = parallelism
         self.logger = logging.getLogger(__name__)
 
+        cache_config = self.config.get("cache", {})
+        cache_dir = utils.if_null(cache_dir, cache_config.get("path"))
+
+        if cache_max_size is None and cache_config.get("max_size_mb"):
+            cache_max_size = int(float(cache_config["max_size_mb"]) * 1024 * 1024)
+
+        self.record_cache = RecordCache(cache_dir, max_size=cache_max_size) if cache_dir else None
+
+        incremental_config = self.config.get("incremental", {})
+        manifest_dir = utils.if_null(manifest_dir, incremental_config.get("path"))
+        incremental = utils.if_null(incremental, incremental_config.get("mode", "delta"))
+
+        self.manifest_store = ManifestStore(manifest_dir, mode=incremental) if manifest_dir else None
+
+        stats_config = self.config.get("stats")
+        if stats is True or (stats is None and stats_config):
+            stats_config = stats_config if isinstance(stats_config, dict) else {}
+            stats = PipelineStats(report_interval=stats_config.get("report_interval"))
+
+        self.stats = stats if stats else None
+
+        scheduler_config = self.config.get("scheduler", {})
+        self.channel_concurrency = utils.if_null(channel_concurrency, scheduler_config.get("channel_concurrency"))
+        self.process_workers = utils.if_null(process_workers, scheduler_config.get("process_workers"))
+        self.ordered = ordered if ordered is not None else scheduler_config.get("ordered", True)
+        self.buffer_batches = scheduler_config.get("buffer_batches")
+
+        # Imported only when records are deduplicated
+        self.deduplicator = None
+        if dedup is not False and (dedup or self.config.get("dedup") or
+                                   any(source.get("access", {}).get("dedup") for source in self.config.get("sources", []))):
+            from .dedup import get_deduplicator
+            self.deduplicator = get_deduplicator(self.config, dedup=dedup, index_dir=dedup_dir)
+
+    """
+    Remove cached records of a channel, or of all channels. Returns the number of removed entries
+    """
+    def invalidate_cache (self, channel='ALL'):
+        if self.record_cache is None:
+            return 0
+
+        return self.record_cache.invalidate(channel=None if channel == 'ALL' else channel)
+
+    """
+    Forget processed files of a channel, or of all channels, so that the next incremental run
+    reads all files again. Returns the number of removed manifests
+    """
+    def reset_manifest (self, channel='ALL'):
+        if self.manifest_store is None:
+            return 0
+
+        return self.manifest_store.reset(channel=None if channel == 'ALL' else channel)
+
+    """
+    Forget the records indexed for deduplication, of a channel ("scope": "channel") or of all channels.
+    Returns the number of removed indexes
+    """
+    def reset_dedup (self, channel='ALL'):
+        if self.deduplicator is None:
+            return 0
+
+        return self.deduplicator.reset(channel=None if channel == 'ALL' else channel)
+
     """
     Iterate through the sources in the config JSON and fetch data from each channel, or, 
     as specified in the input
+    If @stream is True, a generator is returned instead of a list. See iter_data()
+    If @return_stats is True, a (data, stats) tuple is returned. stats is the PipelineStats of the
+    DataServer, or a new one when instrumentation is off
     """
-    def fetch_data (self, channel='ALL'):
+    def fetch_data (self, channel='ALL', stream=False, batch_size=None, return_stats=False, ordered=None):
+        stats = self.stats
+        if return_stats and stats is None:
+            stats = PipelineStats()
+
+        if stream:
+            data = self.iter_data(channel=channel, batch_size=batch_size, stats=stats, ordered=ordered)
+        else:
+            data = list(self.iter_data(channel=channel, stats=stats, ordered=ordered))
+
+        if return_stats:
+            return data, stats
+
+        return data
+
+    """
+    Write the records of each channel, or, as specified in the input, to a Parquet or Arrow file at @path.
+    Records are streamed to the file a row group at a time, with channel, source, url, title, content
+    and label columns. See datakettle.sink. Returns the number of records written
+    """
+    def write_data (self, path, channel='ALL', format=None, row_group_size=None, compression=None, label_type=None,
+                    ordered=None):
+        """
+        :param path: Output file. .arrow, .feather and .ipc files are written as Arrow IPC, others as Parquet
+        :param channel: Channel name. Specify ALL to write all enabled channels
+        :param format: "parquet" or "arrow". Overrides the file extension
+        :param row_group_size: Number of records per row group. Default 65536
+        :param compression: Compression codec. Default "snappy" for parquet, none for arrow
+        :param label_type: Arrow type of the label column. Default "float64"
+        :param ordered: When channels are read concurrently, False writes records as soon as they are read
+        """
+        with RecordSink(path, format=format, row_group_size=row_group_size, compression=compression,
+                        label_type=label_type) as sink:
+            for records in self.iter_data(channel=channel, batch_size=sink.row_group_size, ordered=ordered,
+                                          record_source=True):
+                sink.write(records)
+
+        return sink.count
+
+    """
+    Stream data from each channel, or, as specified in the input.
+    Records ({"content", "label"} or {"url", "title", "content"}) are read, cleaned and yielded 
+    one at a time, so that the corpus is never held in memory as a whole.
+    If @batch_size is given, lists of @batch_size records are yielded instead
+    """
+    def iter_data (self, channel='ALL', batch_size=None, stats=None, ordered=None, record_source=False):
+        """
+        :param channel: Channel name. Specify ALL to fetch from all enabled channels
+        :param batch_size: Number of records per yielded list. None yields single records
+        :param stats: PipelineStats to record into, instead of the one of the DataServer
+        :param ordered: When channels are read concurrently, False yields records as soon as they are read.
+                        Default: ordered setting of the DataServer
+        :param record_source: True adds "channel" and "source" (file path or URL) keys to each record
+        :return: Generator of records, or of lists of records
+        """
+        records = self.iter_records(channel=channel, stats=stats, ordered=ordered, record_source=record_source)
+
+        if batch_size:
+            return utils.iter_batches(records, batch_size)
+
+        return records
+
+    """
+    Generator yielding records from all matching, enabled channels in config order.
+    Duplicates are removed when dedup is on. See datakettle.dedup
+    """
+    def iter_records (self, channel='ALL', stats=None, ordered=None, record_source=False):
+        stats = utils.if_null(stats, self.stats)
+
+        if self.deduplicator is None:
+            yield from self.iter_channel_records(channel=channel, stats=stats, ordered=ordered, record_source=record_source)
+            return
+
+        # Dedup needs the channel and source of each record
+        records = self.iter_channel_records(channel=channel, stats=stats, ordered=ordered, record_source=True)
+        yield from self.deduplicator.iter_unique(records, stats=stats, strip_source=not record_source)
+
+    """
+    Generator yielding records from all matching, enabled channels in config order.
+    With channel_concurrency > 1, channels are read concurrently. See datakettle.channel_scheduler
+    """
+    def iter_channel_records (self, channel='ALL', stats=None, ordered=None, record_source=False):
         sources = ""
 
         if ("sources" in self.config):
@@ -25,38 +199,18 @@ class DataServer (object):
 
         self.logger.info("Channel: {0}".format(channel))
 
-        data_list = []
-        label_list = []
+        sources = [source for source in sources
+                   if not source["disabled"] and ((source["channel"] == channel) or (channel == 'ALL'))]
+
+        channel_concurrency = 1 if self.channel_concurrency is None else self.channel_concurrency
+        if len(sources) > 1 and utils.resolve_parallelism(channel_concurrency) > 1:
+            ordered = ordered if ordered is not None else self.ordered
+            scheduler = ChannelScheduler(channel_concurrency, process_workers=self.process_workers, ordered=ordered,
+                                         buffer_batches=self.buffer_batches)
+            yield from scheduler.iter_records(sources, parallelism=self.parallelism, record_cache=self.record_cache,
+                                              manifest_store=self.manifest_store, stats=stats, record_source=record_source)
+            return
+
         for source in sources:
-            if (source["disabled"]):
-                continue
-
-            if (source["channel"] == channel ) or (channel == 'ALL'):
-                access = source["access"]
-                self.logger.info ("Fetching data from {0} Reader {1}".format(source["channel"], access["reader"]))
-
-                if access["reader"] == "json_file_reader":
-                    jsreader = JsonReader(source_config=source)
-                    data = jsreader.read_json_data()
-                    data_list.extend (data)
-                    self.logger.info("Fetched data {} items ".format(len(data)))
-
-                if access["reader"] == "html_reader":
-                    htmlreader = HTMLReader(source_config=source)
-                    data = htmlreader.read_html_data()
-                    data_list.extend(data)
-                    self.logger.info("Fetched data {} items ".format(len(data)))
-
-                if access["reader"] == "text_file_reader":
-                    txtreader = TextReader(source_config=source)
-                    data = txtreader.read_text_data()
-                    data_list.extend(data)
-                    self.logger.info("Fetched data {} items ".format(len(data)))
-
-                if access["reader"] == "csv_file_reader":
-                    csvreader = CSVReader(source_config=source)
-                    data = csvreader.read_csv_data()
-                    data_list.extend(data)
-                    self.logger.info("Fetched data {} items ".format(len(data)))
-
-        return data_list
\ No newline at end of file
+            yield from read_channel(source, parallelism=self.parallelism, record_cache=self.record_cache,
+                                    manifest_store=self.manifest_store, stats=stats, record_source=record_source)
@@ -0,0 +1,159 @@
+import os
+import logging
+import datakettle.cleantext.utils as utils
+
+"""
+Columnar output of cleaned records.
+
+RecordSink writes records to a Parquet file, or to an Arrow IPC file (the Feather V2 format),
+in batches of row_group_size records. Every file has the columns:
+    channel   channel name
+    source    source file path or URL
+    url       URL of a web page (html_reader), else null
+    title     title of a web page (html_reader), else null
+    content   cleaned text
+    label     label of the record, float64 unless given otherwise. See label_type
+
+Arrow IPC files can be memory-mapped and read without copying:
+    pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all()
+Parquet files are smaller and are read with pyarrow.parquet.read_table(path) or pandas.read_parquet(path).
+
+pyarrow is an optional dependency, imported when a sink is opened. Install it with: pip install pyarrow
+"""
+
+FORMATS = ["parquet", "arrow"]
+
+# File extension -> format
+FORMAT_EXTENSIONS = {".parquet": "parquet", ".pq": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+
+COLUMNS = ["channel", "source", "url", "title", "content", "label"]
+
+# Default number of records per row group (parquet) or record batch (arrow)
+DEF_ROW_GROUP_SIZE = 65536
+
+DEF_LABEL_TYPE = "float64"
+
+"""
+Import pyarrow, which is needed to write a sink
+"""
+def get_pyarrow ():
+    try:
+        import pyarrow
+    except ImportError as ex:
+        raise ImportError("Writing Parquet or Arrow files requires pyarrow: pip install pyarrow") from ex
+
+    return pyarrow
+
+"""
+Format of the sink file at @path, from its extension. Files without a known extension are written as parquet
+"""
+def get_sink_format (path):
+    return FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower(), "parquet")
+
+class RecordSink (object):
+    def __init__(self, path, format=None, row_group_size=None, compression=None, label_type=None):
+        """
+        :param path: Output file. It is replaced when the sink is closed, so readers never see a partial file
+        :param format: "parquet" or "arrow". Default: from the file extension (.arrow, .feather, .ipc are arrow)
+        :param row_group_size: Number of records per row group or record batch. Default 65536
+        :param compression: Compression codec. Default "snappy" for parquet, none for arrow, which keeps arrow
+                            files memory-mappable without copies. Arrow supports "lz4" and "zstd"
+        :param label_type: Arrow type name of the label column: "float64", "int64", "string", ... Default "float64"
+        """
+        self.path = path
+        self.format = format if format else get_sink_format(path)
+        if self.format not in FORMATS:
+            raise ValueError("Unknown sink format: {}. Use one of {}".format(self.format, FORMATS))
+
+        self.row_group_size = int(utils.if_null(row_group_size, DEF_ROW_GROUP_SIZE))
+        self.compression = compression
+        self.label_type = utils.if_null(label_type, DEF_LABEL_TYPE)
+        self.logger = logging.getLogger(__name__)
+
+        self.pa = get_pyarrow()
+        self.schema = self.pa.schema([(column, self.pa.string()) for column in COLUMNS[:-1]] +
+                                     [("label", self.pa.type_for_alias(self.label_type))])
+
+        self.tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        self.writer = self.open_writer()
+        self.buffer = []
+        self.count = 0
+
+    def open_writer (self):
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(self.tmp_path, self.schema, compression=utils.if_null(self.compression, "snappy"))
+
+        options = self.pa.ipc.IpcWriteOptions(compression=self.compression)
+        return self.pa.ipc.new_file(self.tmp_path, self.schema, options=options)
+
+    """
+    Add @records to the sink. Records are written a row group at a time
+    """
+    def write (self, records):
+        self.buffer.extend(records)
+
+        while len(self.buffer) >= self.row_group_size:
+            self.flush(self.buffer[:self.row_group_size])
+            del self.buffer[:self.row_group_size]
+
+    """
+    Write @records as one row group
+    """
+    def flush (self, records):
+        columns = [self.pa.array([record.get(column) for record in records], type=field.type, from_pandas=True)
+                   for column, field in zip(COLUMNS, self.schema)]
+        table = self.pa.Table.from_arrays(columns, schema=self.schema)
+
+        if self.format == "parquet":
+            self.writer.write_table(table, row_group_size=len(records))
+        else:
+            self.writer.write_table(table, max_chunksize=len(records))
+
+        self.count += len(records)
+
+    """
+    Write the remaining records and move the file in place. Returns the number of records written
+    """
+    def close (self):
+        if self.writer is None:
+            return self.count
+
+        try:
+            if self.buffer:
+                self.flush(self.buffer)
+                self.buffer = []
+
+            self.writer.close()
+            self.writer = None
+            os.replace(self.tmp_path, self.path)
+        except Exception:
+            self.abort()
+            raise
+
+        self.logger.info("Wrote {} records to {}".format(self.count, self.path))
+        return self.count
+
+    """
+    Drop the partial file. The output file, if any, is left as it was
+    """
+    def abort (self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception:
+                self.logger.error("Cannot close {}".format(self.tmp_path), exc_info=True)
+            self.writer = None
+
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,217 @@
+import time
+import logging
+import threading
+
+"""
+Per channel, per step instrumentation of the read and clean pipeline.
+
+For every channel and step it counts calls, wall time, documents and text size in and out.
+Steps recorded by the readers:
+    read        reading and parsing source files, fetching web pages. bytes_in is the size of the files
+    split       splitting the content of a file into documents
+    extract     extracting text from markup (get_text_within_tags, html tag filter)
+    clean:...   one operation of the compiled cleaning plan. Steps fused into one operation are joined with "+"
+    records     the rest of the time spent producing the records of the channel (labels, caches, worker round trips)
+
+Times are exclusive: the time of a step nested in another (e.g. read, while splitting pulls the next chunk)
+is not counted in the outer step, so that steps add up to the time spent in the pipeline.
+Work done in worker processes is added up across workers, hence can exceed the wall time.
+Text sizes are counted in characters, file sizes in bytes.
+
+Instrumentation is off unless a PipelineStats is passed to DataServer (or a reader). When off, each
+instrumented call costs a single "is None" check.
+"""
+
+# Fields of a counter, in the order they are kept in
+STAT_FIELDS = ("calls", "seconds", "docs", "bytes_in", "bytes_out")
+
+"""
+Size of a text value: length of a string, or the total length of a list of strings. 0 for anything else
+"""
+def text_size (value):
+    if isinstance(value, str):
+        return len(value)
+
+    if isinstance(value, (list, tuple)):
+        return sum(len(item) for item in value if isinstance(item, str))
+
+    return 0
+
+class PipelineStats (object):
+    def __init__(self, callback=None, report_interval=None, log_reports=True):
+        """
+        :param callback: Called with snapshot() on every report, e.g. to export the counters as metrics
+        :param report_interval: Report every so many seconds while channels are read. Reports are also
+                                made at the end of every channel
+        :param log_reports: Log the counters on every report
+        """
+        self.callback = callback
+        self.report_interval = report_interval
+        self.log_reports = log_reports
+        self.logger = logging.getLogger(__name__)
+
+        # {channel: {step: [calls, seconds, docs, bytes_in, bytes_out]}}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+        # Stack of nested timings of the current thread. Each entry holds the time spent in nested steps
+        self.local = threading.local()
+        self.last_report = time.monotonic()
+
+    # Locks, thread locals and callbacks do not travel to worker processes. Workers start with empty counters
+    def __getstate__(self):
+        return {"report_interval": None, "log_reports": False}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def add (self, channel, step, seconds=0.0, calls=1, docs=0, bytes_in=0, bytes_out=0):
+        with self.lock:
+            steps = self.counters.setdefault(channel, {})
+            counter = steps.get(step)
+            if counter is None:
+                counter = steps[step] = [0, 0.0, 0, 0, 0]
+
+            counter[0] += calls
+            counter[1] += seconds
+            counter[2] += docs
+            counter[3] += bytes_in
+            counter[4] += bytes_out
+
+        if self.report_interval is not None and time.monotonic() - self.last_report >= self.report_interval:
+            self.report()
+
+    def get_stack (self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    """
+    Start timing a step. Pass the returned value to stop()
+    """
+    def start (self):
+        self.get_stack().append(0.0)
+        return time.perf_counter()
+
+    """
+    Stop timing a step started with start() and record it. Returns the exclusive time of the step
+    """
+    def stop (self, channel, step, start, docs=0, bytes_in=0, bytes_out=0):
+        elapsed = time.perf_counter() - start
+
+        stack = self.get_stack()
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+
+        self.add(channel, step, elapsed - nested, docs=docs, bytes_in=bytes_in, bytes_out=bytes_out)
+        return elapsed - nested
+
+    """
+    Call @function and record it as one call of @step. Sizes are taken from the first argument and the result
+    """
+    def timed_call (self, channel, step, function, *args, **kwargs):
+        start = self.start()
+        try:
+            result = function(*args, **kwargs)
+        except BaseException:
+            self.stop(channel, step, start)
+            raise
+
+        self.stop(channel, step, start, docs=1, bytes_in=text_size(args[0]) if args else 0, bytes_out=text_size(result))
+        return result
+
+    """
+    Wrap an iterable, recording the time spent producing each item as a call of @step
+    """
+    def iter_timed (self, channel, step, iterable, count=None, size=None, bytes_in=0):
+        """
+        :param count: Number of documents in an item. Default 1
+        :param size: Size of an item. Default: text_size
+        :param bytes_in: Input size, recorded once (e.g. the size of the file being read)
+        """
+        if bytes_in:
+            self.add(channel, step, calls=0, bytes_in=bytes_in)
+
+        iterator = iter(iterable)
+        while True:
+            start = self.start()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stop(channel, step, start)
+                return
+            except BaseException:
+                self.stop(channel, step, start)
+                raise
+
+            self.stop(channel, step, start, docs=count(item) if count else 1,
+                      bytes_out=size(item) if size else text_size(item))
+            yield item
+
+    """
+    Add counters taken from another PipelineStats with pop_counters(), e.g. of a worker process
+    """
+    def merge (self, counters):
+        for channel, steps in counters.items():
+            for step, counter in steps.items():
+                self.add(channel, step, seconds=counter[1], calls=counter[0], docs=counter[2],
+                         bytes_in=counter[3], bytes_out=counter[4])
+
+    """
+    Take the counters collected so far and start over
+    """
+    def pop_counters (self):
+        with self.lock:
+            counters, self.counters = self.counters, {}
+        return counters
+
+    def reset (self):
+        self.pop_counters()
+
+    """
+    Counters as {channel: {step: {"calls", "seconds", "docs", "bytes_in", "bytes_out"}}}
+    """
+    def snapshot (self):
+        with self.lock:
+            return {channel: {step: dict(zip(STAT_FIELDS, counter)) for step, counter in steps.items()}
+                    for channel, steps in self.counters.items()}
+
+    """
+    Counters of each channel added up over its steps: {channel: {"calls", "seconds", ...}}
+    """
+    def totals (self):
+        totals = {}
+        for channel, steps in self.snapshot().items():
+            totals[channel] = {field: sum(step[field] for step in steps.values()) for field in STAT_FIELDS}
+        return totals
+
+    def format_lines (self):
+        lines = []
+        for channel, steps in self.snapshot().items():
+            total_seconds = sum(step["seconds"] for step in steps.values())
+            lines.append("Channel {}: {:.3f} s".format(channel, total_seconds))
+
+            for name, step in sorted(steps.items(), key=lambda item: -item[1]["seconds"]):
+                share = 100.0 * step["seconds"] / total_seconds if total_seconds > 0 else 0.0
+                lines.append("  {:<48} {:>10.3f} s {:>5.1f}% {:>9} calls {:>9} docs {:>10} in {:>10} out".format(
+                    name, step["seconds"], share, step["calls"], step["docs"], step["bytes_in"], step["bytes_out"]))
+
+        return lines
+
+    """
+    Log the counters and pass them to the callback
+    """
+    def report (self):
+        self.last_report = time.monotonic()
+
+        if self.log_reports:
+            for line in self.format_lines():
+                self.logger.info(line)
+
+        if self.callback is not None:
+            try:
+                self.callback(self.snapshot())
+            except Exception:
+                self.logger.error("Stats callback failed", exc_info=True)